@@ -0,0 +1,193 @@
+"""Analysis worker: takes jobs from the shared MQTT job queue and runs them on the local Ollama.
+
+Start any number of these, on one machine or many, and set
+analysis_mode = distributed in MainApplication's config.ini:
+
+    python AnalysisWorker.py                      # settings from config.ini
+    python AnalysisWorker.py --worker-id gpu1 --ollama-server http://gpu1:11434
+    python AnalysisWorker.py --dry-run            # no Ollama; answers with the image size, for testing
+"""
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import argparse
+import threading
+from collections import deque
+from configparser import ConfigParser
+
+import paho.mqtt.client as mqtt
+
+from JobDispatch import (shared_queue_topic, done_topic, decode_job, MSG_CLAIMED, MSG_HEARTBEAT,
+                         MSG_RESULT, DEFAULT_GROUP, DEFAULT_LEASE)
+from MqttChunking import ChunkedPublisher, Reassembler, codec_from_name, CLASS_JOB
+
+CONFIG_PATH = "config.ini"
+
+
+class AnalysisWorker:
+    """One worker process. Runs up to `concurrency` jobs at once.
+
+    With paho-mqtt >= 2.0 jobs are acknowledged only when finished and the
+    broker is told (Receive Maximum) not to send more than `concurrency`
+    unacknowledged jobs, so a busy worker does not hoard the queue.
+    """
+
+    def __init__(self, broker, port, base_topic, group, worker_id, ollama_server, model,
+                 concurrency=1, dry_run=False, compression="zlib"):
+        self.broker = broker
+        self.port = port
+        self.base_topic = base_topic
+        self.group = group
+        self.worker_id = worker_id
+        self.ollama_server = ollama_server
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self.dry_run = dry_run
+        self.publisher = ChunkedPublisher(codec=codec_from_name(compression))
+        self.reassembler = Reassembler()
+        self.jobs = queue.Queue()
+        self.done_ids = deque(maxlen=4096) # Jobs another worker already finished
+        self.ollama_client = None
+        self.stats = {'done': 0, 'errors': 0, 'skipped': 0}
+        try:
+            from paho.mqtt.client import CallbackAPIVersion
+            self.client = mqtt.Client(CallbackAPIVersion.VERSION2, client_id=f"worker_{worker_id}",
+                                      protocol=mqtt.MQTTv5, manual_ack=True)
+            self.manual_ack = True
+        except (ImportError, AttributeError, TypeError):
+            self.client = mqtt.Client(client_id=f"worker_{worker_id}", protocol=mqtt.MQTTv5)
+            self.manual_ack = False
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+
+    def start(self):
+        from paho.mqtt.properties import Properties
+        from paho.mqtt.packettypes import PacketTypes
+        properties = Properties(PacketTypes.CONNECT)
+        properties.ReceiveMaximum = self.concurrency
+        self.client.connect_async(self.broker, self.port, 60, clean_start=True, properties=properties)
+        self.client.loop_start()
+        for i in range(self.concurrency):
+            threading.Thread(target=self._run, name=f"AnalysisWorker-{i}", daemon=True).start()
+        print(f"Worker {self.worker_id}: {self.concurrency} slot(s), "
+              f"{'dry run' if self.dry_run else self.ollama_server}, manual ack {'on' if self.manual_ack else 'off'}")
+
+    def stop(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        if getattr(rc, 'is_failure', rc != 0):
+            print(f"Worker {self.worker_id}: MQTT connect failed ({rc})")
+            return
+        client.subscribe(shared_queue_topic(self.base_topic, self.group), qos=1)
+        client.subscribe(done_topic(self.base_topic), qos=0)
+        print(f"Worker {self.worker_id}: waiting for jobs on {shared_queue_topic(self.base_topic, self.group)}")
+
+    def on_message(self, client, userdata, msg):
+        if msg.topic == done_topic(self.base_topic):
+            self.done_ids.append(msg.payload.decode(errors="replace"))
+            self._ack(msg)
+            return
+        try:
+            payload = self.reassembler.add(msg.payload, msg.topic)
+            header, image = decode_job(payload)
+        except ValueError as e:
+            print(f"Worker {self.worker_id}: dropping malformed job: {e}")
+            self._ack(msg)
+            return
+        self.jobs.put((msg, header, image))
+
+    def _ack(self, msg):
+        if self.manual_ack and msg.qos > 0:
+            self.client.ack(msg.mid, msg.qos)
+
+    def _reply(self, header, message):
+        message.update(job_id=header['job_id'], worker=self.worker_id)
+        self.publisher.publish(self.client, header['reply_to'], json.dumps(message), CLASS_JOB)
+
+    def _heartbeat(self, header, finished):
+        interval = float(header.get('lease', DEFAULT_LEASE)) / 3
+        while not finished.wait(interval):
+            self._reply(header, {'type': MSG_HEARTBEAT})
+
+    def _run(self):
+        while True:
+            msg, header, image = self.jobs.get()
+            try:
+                if header['job_id'] in self.done_ids:
+                    self.stats['skipped'] += 1
+                    continue
+                self._reply(header, {'type': MSG_CLAIMED, 'attempt': header.get('attempt', 1)})
+                finished = threading.Event()
+                threading.Thread(target=self._heartbeat, args=(header, finished), daemon=True).start()
+                start = time.perf_counter()
+                try:
+                    text, status = self.analyze(header, image), "ok"
+                    self.stats['done'] += 1
+                except Exception as e:
+                    text, status = f"Worker {self.worker_id} error: {e}", "error"
+                    self.stats['errors'] += 1
+                finally:
+                    finished.set()
+                elapsed = time.perf_counter() - start
+                self._reply(header, {'type': MSG_RESULT, 'status': status, 'text': text,
+                                     'elapsed_ms': round(elapsed * 1000.0, 1)})
+                print(f"Worker {self.worker_id}: job {header['job_id']} {status} in {elapsed:.2f}s")
+            except Exception as e:
+                print(f"Worker {self.worker_id}: error handling job {header.get('job_id')}: {e}")
+            finally:
+                self._ack(msg)
+
+    def analyze(self, header, image):
+        if self.dry_run:
+            time.sleep(0.05)
+            return f"dry run: {len(image)} bytes, prompt {header.get('prompt')!r}"
+        if self.ollama_client is None:
+            import ollama
+            self.ollama_client = ollama.Client(host=self.ollama_server)
+        model = header.get('model') or self.model
+        response = self.ollama_client.chat(model=model, messages=[
+            {'role': 'user', 'content': header.get('prompt') or '', 'images': [image]}])
+        return response['message']['content'].strip()
+
+
+def main():
+    config = ConfigParser()
+    config.read(CONFIG_PATH)
+    settings = config['DEFAULT']
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--broker", default=settings.get('mqtt_broker', 'localhost'))
+    parser.add_argument("--port", type=int, default=settings.getint('mqtt_port', 1883))
+    parser.add_argument("--topic", default=settings.get('analysis_job_topic', 'ai_assistant/jobs'),
+                        help="Base job topic")
+    parser.add_argument("--group", default=settings.get('analysis_worker_group', DEFAULT_GROUP),
+                        help="Shared subscription group")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--ollama-server", default=settings.get('ollama_server', 'http://localhost:11434'))
+    parser.add_argument("--model", default=settings.get('ollama_model', ''),
+                        help="Model for jobs that don't name one")
+    parser.add_argument("--concurrency", type=int, default=1, help="Jobs run at once")
+    parser.add_argument("--dry-run", action="store_true", help="Don't call Ollama (for testing the job flow)")
+    args = parser.parse_args()
+
+    worker = AnalysisWorker(args.broker, args.port, args.topic, args.group, args.worker_id,
+                            args.ollama_server, args.model, args.concurrency, args.dry_run,
+                            settings.get('mqtt_compression', 'zlib'))
+    worker.start()
+    try:
+        while True:
+            time.sleep(60)
+            print(f"Worker {args.worker_id}: {worker.stats}")
+    except KeyboardInterrupt:
+        print("Stopping worker...")
+        worker.stop()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
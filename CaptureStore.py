@@ -0,0 +1,191 @@
+"""Ring-buffer store for captured frames and their analyses (sqlite, frames as blobs).
+
+    python CaptureStore.py list                 # newest first
+    python CaptureStore.py export 3 frame.png   # write slot 3's image to a file
+"""
+import sys
+import time
+import queue
+import sqlite3
+import hashlib
+import threading
+
+from ImageIngest import sniff_format
+from Metrics import metrics
+
+DEFAULT_SLOTS = 50
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    slot INTEGER PRIMARY KEY,
+    hash BLOB NOT NULL UNIQUE,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 1,
+    format TEXT,
+    width INTEGER,
+    height INTEGER,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    source TEXT,
+    request_id TEXT,
+    prompt TEXT,
+    model TEXT,
+    latency_ms REAL,
+    status TEXT,
+    result TEXT
+)
+"""
+META_FIELDS = ("source", "request_id", "prompt", "model", "latency_ms", "status", "result")
+
+
+def frame_hash(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class CaptureStore:
+    """Keeps the last `slots` frames (and at most max_bytes of image data) in one sqlite file.
+
+    Frames are stored as the bytes already encoded for the model, so saving
+    costs no extra encode. Slot numbers wrap around, overwriting the oldest
+    frame; an identical frame (same content hash) updates the existing row's
+    metadata and hit count instead of storing the image again. Writes happen on
+    a background thread, so add() and annotate() never block the caller on disk.
+    """
+
+    def __init__(self, path, slots=DEFAULT_SLOTS, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.slots = max(1, slots)
+        self.max_bytes = max_bytes
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(SCHEMA)
+        self.db.execute("DELETE FROM frames WHERE slot >= ?", (self.slots,)) # slots setting was lowered
+        newest = self.db.execute("SELECT slot FROM frames ORDER BY created DESC LIMIT 1").fetchone()
+        self.next_slot = (newest[0] + 1) % self.slots if newest else 0
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM frames").fetchone()[0]
+        self.lock = threading.Lock()
+        self.jobs = queue.Queue()
+        self.writer = threading.Thread(target=self._run, name="CaptureStoreWriter", daemon=True)
+        self.writer.start()
+
+    def add(self, data, size=None, **meta):
+        """Queues a frame (encoded bytes) with metadata; returns its content hash."""
+        digest = frame_hash(data)
+        self.jobs.put(("add", digest, data, size, meta))
+        return digest
+
+    def annotate(self, digest, **meta):
+        """Updates the metadata of a stored frame (e.g. when a remote result arrives later)."""
+        self.jobs.put(("annotate", digest, None, None, meta))
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            try:
+                with self.lock:
+                    if job[0] == "add":
+                        self._add(*job[1:])
+                    else:
+                        self._annotate(job[1], job[4])
+            except Exception as e:
+                print(f"Error writing to capture store {self.path}: {e}")
+
+    def _annotate(self, digest, meta):
+        fields = [key for key in META_FIELDS if key in meta]
+        if not fields:
+            return
+        self.db.execute(f"UPDATE frames SET updated = ?, {', '.join(f'{key} = ?' for key in fields)} WHERE hash = ?",
+                        [time.time()] + [meta[key] for key in fields] + [digest])
+
+    def _add(self, digest, data, size, meta):
+        now = time.time()
+        if self.db.execute("SELECT 1 FROM frames WHERE hash = ?", (digest,)).fetchone():
+            self.db.execute("UPDATE frames SET hits = hits + 1 WHERE hash = ?", (digest,))
+            metrics.inc("cache_hits_total", cache="capture_store")
+            self._annotate(digest, meta)
+            return
+        width, height = size or (None, None)
+        self.db.execute("BEGIN")
+        try:
+            self._insert(digest, data, width, height, meta, now)
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM frames").fetchone()[0]
+            raise
+
+    def _insert(self, digest, data, width, height, meta, now):
+        slot = self.next_slot
+        old = self.db.execute("SELECT size FROM frames WHERE slot = ?", (slot,)).fetchone()
+        if old:
+            self.total_bytes -= old[0]
+        self.db.execute(
+            f"INSERT OR REPLACE INTO frames (slot, hash, created, updated, format, width, height, size, data, "
+            f"{', '.join(META_FIELDS)}) VALUES ({', '.join('?' * (9 + len(META_FIELDS)))})",
+            [slot, digest, now, now, sniff_format(data), width, height, len(data), data]
+            + [meta.get(key) for key in META_FIELDS])
+        self.total_bytes += len(data)
+        self.next_slot = (slot + 1) % self.slots
+        # Byte retention: drop the oldest other frames until under the limit
+        while self.total_bytes > self.max_bytes:
+            oldest = self.db.execute("SELECT slot, size FROM frames WHERE slot != ? ORDER BY created LIMIT 1",
+                                     (slot,)).fetchone()
+            if not oldest:
+                break
+            self.db.execute("DELETE FROM frames WHERE slot = ?", (oldest[0],))
+            self.total_bytes -= oldest[1]
+
+    def recent(self, limit=20):
+        """Metadata of the newest frames (no image data)."""
+        with self.lock:
+            cursor = self.db.execute(
+                f"SELECT slot, created, hits, format, width, height, size, {', '.join(META_FIELDS)} "
+                f"FROM frames ORDER BY created DESC LIMIT ?", (limit,))
+            names = [d[0] for d in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def image(self, slot):
+        """Returns (format, bytes) for a slot, or None."""
+        with self.lock:
+            return self.db.execute("SELECT format, data FROM frames WHERE slot = ?", (slot,)).fetchone()
+
+    def close(self):
+        self.jobs.put(None)
+        self.writer.join(timeout=5)
+        with self.lock:
+            self.db.close()
+
+
+def main():
+    from configparser import ConfigParser
+    config = ConfigParser()
+    config.read("config.ini")
+    path = config['DEFAULT'].get('capture_store_path', 'captures.sqlite')
+    if len(sys.argv) < 2 or sys.argv[1] not in ("list", "export"):
+        print(__doc__)
+        sys.exit(1)
+    store = CaptureStore(path, slots=config['DEFAULT'].getint('capture_store_slots', DEFAULT_SLOTS))
+    if sys.argv[1] == "list":
+        for row in store.recent(int(sys.argv[2]) if len(sys.argv) > 2 else 20):
+            when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row['created']))
+            result = (row['result'] or '').replace("\n", " ")[:60]
+            print(f"{row['slot']:>4} {when} {row['format'] or '?':<5} {row['size']:>9}B x{row['hits']:<3} "
+                  f"{row['source'] or '':<8} {row['latency_ms'] or 0:>8.0f}ms {row['status'] or '':<6} {result}")
+    else:
+        found = store.image(int(sys.argv[2]))
+        if not found:
+            print(f"No frame in slot {sys.argv[2]}")
+            sys.exit(1)
+        with open(sys.argv[3], 'wb') as f:
+            f.write(found[1])
+        print(f"Wrote {found[0]} frame to {sys.argv[3]}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+from PyQt5.QtCore import QObject, QTimer, pyqtSlot
+from PyQt5.QtGui import QTextCursor
+
+
+class ChatRenderer(QObject):
+    """Coalesces chat output and renders it at most once per frame.
+
+    Messages and streamed fragments are buffered and written to the QTextEdit
+    in a single edit block when the frame timer fires, instead of one append()
+    (and one layout pass) per message. The document is capped at max_blocks so
+    it cannot grow without bound.
+    """
+
+    def __init__(self, text_edit, max_blocks=2000, interval_ms=16, parent=None):
+        super().__init__(parent)
+        self.text_edit = text_edit
+        self.document = text_edit.document()
+        if max_blocks > 0:
+            # Oldest blocks are dropped by Qt itself once the cap is reached
+            self.document.setMaximumBlockCount(max_blocks)
+        self.pending = [] # List of (stream_id or None, text)
+        self.current_stream = None # Stream whose block is last in the document
+        self.following = True # False while browsing history; live output is then held back
+        self.unseen = 0
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.flush)
+
+    @pyqtSlot(str)
+    def queue_message(self, text):
+        """Queues a complete message; it gets its own block."""
+        if not self.following:
+            self.unseen += 1 # It is in the history store; shown again on "end"
+            return
+        self.pending.append((None, text))
+        self._schedule()
+
+    @pyqtSlot(str, str)
+    def queue_fragment(self, stream_id, text):
+        """Queues a streamed fragment; fragments of the same stream share one block."""
+        if not self.following:
+            return
+        self.pending.append((stream_id, text))
+        self._schedule()
+
+    def _schedule(self):
+        if not self.timer.isActive():
+            self.timer.start()
+
+    @pyqtSlot()
+    def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        scrollbar = self.text_edit.verticalScrollBar()
+        follow = scrollbar.value() >= scrollbar.maximum() - 4 # Only autoscroll if already at the bottom
+
+        cursor = QTextCursor(self.document)
+        cursor.movePosition(QTextCursor.End)
+        cursor.beginEditBlock()
+        for stream_id, text in pending:
+            continues_stream = stream_id is not None and stream_id == self.current_stream
+            if not continues_stream and not self.document.isEmpty():
+                cursor.insertBlock()
+            cursor.insertText(text)
+            self.current_stream = stream_id
+        cursor.endEditBlock()
+
+        if follow:
+            scrollbar.setValue(scrollbar.maximum())
+
+    def clear(self):
+        self.pending = []
+        self.current_stream = None
+        self.text_edit.clear()
+
+    def show_entries(self, texts, top_index=None):
+        """Replaces the view with texts (one block each) and stops following live output.
+
+        top_index scrolls that entry to the top of the view; None scrolls to the end.
+        """
+        self.pending = []
+        self.current_stream = None
+        self.following = False
+        self.document.clear()
+        cursor = QTextCursor(self.document)
+        cursor.beginEditBlock()
+        starts = []
+        for i, text in enumerate(texts):
+            if i:
+                cursor.insertBlock()
+            starts.append(cursor.blockNumber())
+            cursor.insertText(text)
+        cursor.endEditBlock()
+        scrollbar = self.text_edit.verticalScrollBar()
+        if top_index is None or top_index >= len(starts):
+            scrollbar.setValue(scrollbar.maximum())
+        else:
+            block = self.document.findBlockByNumber(starts[top_index])
+            scrollbar.setValue(int(self.document.documentLayout().blockBoundingRect(block).top()))
+
+    def follow(self, texts):
+        """Shows texts (the history tail) and resumes following live output."""
+        self.show_entries(texts)
+        self.following = True
+        self.unseen = 0
+
+
+class HistoryNavigator:
+    """Keypad navigation over the history store, as a sliding window of entries.
+
+    The view holds at most window entries at any time; scrolling past either
+    edge loads the next page from the store and drops entries from the other
+    end, so memory stays flat however long the history grows. Reaching the
+    newest entry (or "end") switches back to following live output.
+    """
+
+    def __init__(self, renderer, store, page_size=50, window=150):
+        self.renderer = renderer
+        self.store = store
+        self.page_size = page_size
+        self.window = max(window, 2 * page_size)
+        self.entries = [] # (id, created, text) currently shown while browsing
+        self.searching = False
+
+    @property
+    def scrollbar(self):
+        return self.renderer.text_edit.verticalScrollBar()
+
+    def _enter_browse(self):
+        if self.renderer.following or not self.entries:
+            self.renderer.flush()
+            self.entries = self.store.latest(self.page_size)
+            self.searching = False
+            self.renderer.show_entries([e[2] for e in self.entries])
+
+    def scroll(self, steps):
+        """Scrolls by steps lines (negative = up)."""
+        self._enter_browse()
+        self._move(steps * self.scrollbar.singleStep() * 3)
+
+    def page(self, pages):
+        self._enter_browse()
+        self._move(pages * self.scrollbar.pageStep())
+
+    def _move(self, delta):
+        scrollbar = self.scrollbar
+        target = scrollbar.value() + delta
+        if target < scrollbar.minimum() and not self.searching and self.entries:
+            older = self.store.before(self.entries[0][0], self.page_size)
+            if older:
+                # Keep the first currently shown entry in view, then drop the newest beyond the window
+                self.entries = (older + self.entries)[:self.window]
+                self.renderer.show_entries([e[2] for e in self.entries], top_index=len(older))
+                scrollbar.setValue(max(scrollbar.minimum(), scrollbar.value() + delta))
+                return
+        if target > scrollbar.maximum() and not self.searching and self.entries:
+            newer = self.store.after(self.entries[-1][0], self.page_size)
+            if not newer:
+                self.end() # Scrolled past the newest entry: back to live output
+                return
+            dropped = max(0, len(self.entries) + len(newer) - self.window)
+            keep_top = max(0, len(self.entries) - dropped - 1)
+            self.entries = (self.entries + newer)[dropped:]
+            self.renderer.show_entries([e[2] for e in self.entries], top_index=keep_top)
+            return
+        scrollbar.setValue(target)
+
+    def home(self):
+        """Jumps to the oldest history entry."""
+        self.renderer.flush()
+        self.searching = False
+        self.entries = self.store.oldest(self.page_size)
+        self.renderer.show_entries([e[2] for e in self.entries], top_index=0)
+
+    def end(self):
+        """Back to the newest entries, following live output again."""
+        self.searching = False
+        self.entries = []
+        self.renderer.follow([e[2] for e in self.store.latest(self.page_size)])
+
+    def search(self, text):
+        """Shows the entries matching text; "end" returns to live output."""
+        self.renderer.flush()
+        results = self.store.search(text, self.window)
+        self.searching = True
+        self.entries = results
+        header = f"--- {len(results)} match(es) for '{text}' (End returns to live output) ---"
+        self.renderer.show_entries([header] + [e[2] for e in results])
+
+    def clear(self):
+        """Clears the view; history is kept in the store."""
+        self.searching = False
+        self.entries = []
+        self.renderer.clear()
+        self.renderer.following = True
+        self.renderer.unseen = 0
@@ -0,0 +1,102 @@
+import time
+from collections import deque
+
+import numpy as np
+
+DEFAULT_SECONDS = 3.0
+DEFAULT_FPS = 4.0
+DEFAULT_MAX_SIDE = 1280   # Longest side of the frames kept in the ring
+DEFAULT_RING_MB = 64
+DEFAULT_KEYFRAMES = 4
+DEFAULT_MIN_CHANGE = 8.0  # 0-255: how much the most-changed block must differ for a frame to count as distinct
+SIGNATURE_GRID = 32       # Frames are compared as SIGNATURE_GRID x SIGNATURE_GRID block means
+
+
+def signature(pixels):
+    """Returns the grey block means of an HxWx3 uint8 frame on a fixed grid (float32, GRID x GRID).
+
+    Blocks are averaged rather than sampled, so a small change (a toast, a
+    progress bar step) shifts its block's mean instead of falling between samples.
+    """
+    grid = SIGNATURE_GRID
+    height, width = pixels.shape[:2]
+    if height < grid or width < grid:
+        rows = np.linspace(0, height - 1, grid).astype(int)
+        cols = np.linspace(0, width - 1, grid).astype(int)
+        return pixels[np.ix_(rows, cols)].mean(axis=2, dtype=np.float32)
+    bh, bw = height // grid, width // grid
+    blocks = pixels[:bh * grid, :bw * grid].reshape(grid, bh, grid, bw, -1)
+    return blocks.mean(axis=(1, 3, 4), dtype=np.float32)
+
+
+def select_keyframes(signatures, count=DEFAULT_KEYFRAMES, min_change=DEFAULT_MIN_CHANGE):
+    """Picks up to count distinct frames from a clip; returns their indices in time order.
+
+    The last frame (how things ended up) comes first, then the first frame
+    and the frames right after the largest changes. A candidate is kept only
+    if its largest block difference to every frame already picked is at
+    least min_change, so a static clip yields a single frame and a flicker
+    back to an earlier state is not sent twice.
+    """
+    n = len(signatures)
+    if n == 0 or count <= 0:
+        return []
+    stack = np.asarray(signatures, dtype=np.float32)
+    # Change into frame i + 1, for every i at once
+    changes = np.abs(np.diff(stack, axis=0)).max(axis=(1, 2)) if n > 1 else np.zeros(0, np.float32)
+    candidates = [n - 1, 0] + [int(i) + 1 for i in np.argsort(changes)[::-1] if changes[i] >= min_change]
+    chosen = []
+    for index in candidates:
+        if len(chosen) >= count:
+            break
+        if index in chosen:
+            continue
+        if chosen and np.abs(stack[chosen] - stack[index]).max(axis=(1, 2)).min() < min_change:
+            continue
+        chosen.append(index)
+    return sorted(chosen)
+
+
+class ClipBuffer:
+    """Ring of recent reduced-resolution frames, bounded by memory rather than frame count.
+
+    add() keeps each frame with its timestamp and signature and evicts the
+    oldest frames once max_bytes of pixels are held. Frames are anything
+    numpy.asarray() turns into an HxWx3 uint8 array (PIL images included).
+    """
+
+    def __init__(self, max_bytes=DEFAULT_RING_MB * 1024 * 1024, max_side=DEFAULT_MAX_SIDE):
+        self.max_bytes = max_bytes
+        self.max_side = max_side
+        self.frames = deque() # (timestamp, frame, signature, nbytes)
+        self.bytes = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def add(self, frame, timestamp=None):
+        pixels = np.asarray(frame)
+        nbytes = pixels.nbytes
+        self.frames.append((time.monotonic() if timestamp is None else timestamp, frame, signature(pixels), nbytes))
+        self.bytes += nbytes
+        while self.bytes > self.max_bytes and len(self.frames) > 1:
+            self.bytes -= self.frames.popleft()[3]
+            self.dropped += 1
+
+    def span_seconds(self):
+        """Seconds between the oldest and newest frame held."""
+        return self.frames[-1][0] - self.frames[0][0] if self.frames else 0.0
+
+    def keyframes(self, count=DEFAULT_KEYFRAMES, min_change=DEFAULT_MIN_CHANGE):
+        """Returns [(seconds since the first frame, frame)] for select_keyframes()."""
+        frames = list(self.frames)
+        if not frames:
+            return []
+        start = frames[0][0]
+        indices = select_keyframes([f[2] for f in frames], count, min_change)
+        return [(frames[i][0] - start, frames[i][1]) for i in indices]
+
+    def clear(self):
+        self.frames.clear()
+        self.bytes = 0
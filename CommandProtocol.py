@@ -0,0 +1,157 @@
+import json
+import uuid
+
+from MqttChunking import is_publish_topic
+
+# --- Command schema ---
+# Commands arrive either as a bare string ("capture") or as a JSON object:
+#   {
+#     "command": "capture" | "chat" | ...,   required
+#     "request_id": "abc123",                optional, echoed in every response
+#     "prompt": "code" | "literal text",     optional, [Prompts] name or prompt text
+#     "model": "llava:13b",                  optional, overrides ollama_model
+#     "image": {"format": "png" | "jpeg",    optional image options for analysis
+#               "max_size": 1280,             longest side in pixels
+#               "quality": 85},               JPEG quality
+#     "response_topic": "client/7/replies"   optional, for MQTT 3.1.1 clients
+#   }
+# MQTT v5 clients should set the ResponseTopic/CorrelationData properties instead
+# of response_topic; CorrelationData is returned unchanged on every response.
+# Either way the response topic must be publishable (no + or # wildcards) and
+# must not be one of the app's own topics, or replies would be read as commands.
+IMAGE_FORMATS = ("png", "jpeg", "webp")
+
+# --- Response status values ---
+STATUS_ACCEPTED = "accepted"
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+
+
+class CommandError(ValueError):
+    """Raised for payloads that do not follow the command schema."""
+
+
+class Command:
+    """One parsed command plus where (if anywhere) its results should be routed."""
+
+    def __init__(self, command, request_id=None, prompt=None, model=None, image=None,
+                 response_topic=None, correlation_data=None, source=None, extra=None):
+        self.command = command
+        self.request_id = request_id or uuid.uuid4().hex[:12]
+        self.prompt = prompt
+        self.model = model
+        self.image = image or {}
+        self.response_topic = response_topic
+        self.correlation_data = correlation_data
+        self.source = source
+        self.extra = extra or {}
+
+    @property
+    def wants_reply(self):
+        return bool(self.response_topic)
+
+    def __repr__(self):
+        return f"Command({self.command!r}, request_id={self.request_id!r}, source={self.source!r})"
+
+
+def _parse_image_options(image):
+    if image is None:
+        return {}
+    if not isinstance(image, dict):
+        raise CommandError("'image' must be an object")
+    options = {}
+    if 'format' in image:
+        image_format = str(image['format']).lower()
+        if image_format == "jpg":
+            image_format = "jpeg"
+        if image_format not in IMAGE_FORMATS:
+            raise CommandError(f"unsupported image format '{image['format']}'")
+        options['format'] = image_format
+    for key, low, high in (('max_size', 64, 16384), ('quality', 1, 100)):
+        if key in image:
+            try:
+                value = int(image[key])
+            except (TypeError, ValueError):
+                raise CommandError(f"'image.{key}' must be an integer")
+            if not low <= value <= high:
+                raise CommandError(f"'image.{key}' must be between {low} and {high}")
+            options[key] = value
+    return options
+
+
+def is_reply_topic(topic, reserved_topics=()):
+    """True if responses may be published to topic: valid, and not one of reserved_topics or below it."""
+    return is_publish_topic(topic) and not any(topic == reserved or topic.startswith(reserved + "/")
+                                               for reserved in reserved_topics if reserved)
+
+
+def parse_command(payload, properties=None, source=None, reserved_topics=()):
+    """Parses a command payload (str or bytes) and optional MQTT v5 properties into a Command.
+
+    reserved_topics are the app's own topics, which are refused as response topics.
+    """
+    if isinstance(payload, bytes):
+        payload = payload.decode(errors="replace")
+    payload = payload.strip()
+    response_topic = getattr(properties, 'ResponseTopic', None) if properties is not None else None
+    correlation_data = getattr(properties, 'CorrelationData', None) if properties is not None else None
+
+    if not payload.startswith("{"):
+        if not payload:
+            raise CommandError("empty command")
+        _check_response_topic(response_topic, reserved_topics)
+        return Command(payload, response_topic=response_topic, correlation_data=correlation_data, source=source)
+
+    try:
+        data = json.loads(payload)
+    except ValueError as e:
+        raise CommandError(f"malformed JSON: {e}")
+    if not isinstance(data, dict):
+        raise CommandError("command must be a JSON object")
+    return command_from_dict(data, response_topic, correlation_data, source, reserved_topics)
+
+
+def _check_response_topic(topic, reserved_topics):
+    if topic and not is_reply_topic(topic, reserved_topics):
+        raise CommandError("'response_topic' must be a topic without wildcards that is not one of this app's topics")
+
+
+def command_from_dict(data, response_topic=None, correlation_data=None, source=None, reserved_topics=()):
+    """Validates an already-decoded command object (consumed in place) into a Command."""
+    command = data.pop('command', None)
+    if not isinstance(command, str) or not command.strip():
+        raise CommandError("missing 'command'")
+    request_id = data.pop('request_id', None)
+    if request_id is not None and not isinstance(request_id, (str, int)):
+        raise CommandError("'request_id' must be a string or integer")
+    prompt = data.pop('prompt', None)
+    model = data.pop('model', None)
+    for key, value in (('prompt', prompt), ('model', model)):
+        if value is not None and not isinstance(value, str):
+            raise CommandError(f"'{key}' must be a string")
+    image = _parse_image_options(data.pop('image', None))
+    # The MQTT v5 property wins over the in-payload fallback
+    payload_topic = data.pop('response_topic', None)
+    response_topic = response_topic or payload_topic
+    _check_response_topic(response_topic, reserved_topics)
+    return Command(
+        command.strip(),
+        request_id=str(request_id) if request_id is not None else None,
+        prompt=prompt, model=model, image=image,
+        response_topic=response_topic,
+        correlation_data=correlation_data,
+        source=source, extra=data,
+    )
+
+
+def format_response(request, sender_id, text, status=STATUS_OK, **fields):
+    """Builds the JSON response sent to a request's response topic."""
+    response = {
+        'request_id': request.request_id,
+        'command': request.command,
+        'status': status,
+        'sender': sender_id,
+        'text': text,
+    }
+    response.update(fields)
+    return json.dumps(response)
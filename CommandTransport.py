@@ -0,0 +1,219 @@
+import os
+import abc
+import time
+import uuid
+import socket
+import struct
+import threading
+
+# --- Transport names used by the command_transport setting ---
+TRANSPORT_MQTT = "mqtt"
+TRANSPORT_UNIX = "unix"
+DEFAULT_COMMAND_SOCKET = "@sauroneye-commands" # Leading '@' = Linux abstract namespace
+MAX_DATAGRAM = 65536
+UCRED = struct.Struct("3i") # struct ucred: pid, uid, gid
+
+
+def socket_address(path):
+    """Maps a configured socket path to an AF_UNIX address ('@name' -> abstract namespace)."""
+    if path.startswith("@"):
+        return "\0" + path[1:]
+    return path
+
+
+class CommandTransport(abc.ABC):
+    """Sending side of a command channel (KeyboardListener -> MainApplication).
+
+    wait_ready() blocks for at most timeout seconds until send() is worth trying;
+    send() raises OSError if the message could not be handed over.
+    """
+
+    name = "base"
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def wait_ready(self, timeout):
+        return True
+
+    @abc.abstractmethod
+    def send(self, message):
+        """Hands message (str or bytes) to the channel."""
+
+
+class MqttCommandTransport(CommandTransport):
+    """Publishes commands to the keypad topic through the MQTT broker."""
+
+    name = TRANSPORT_MQTT
+
+    def __init__(self, broker, port, topic, client_prefix="keypad_listener"):
+        import paho.mqtt.client as mqtt
+        self.broker = broker
+        self.port = port
+        self.topic = topic
+        self.connected = threading.Event()
+        client_id = f"{client_prefix}_{uuid.uuid4()}"
+        try:
+            from paho.mqtt.client import CallbackAPIVersion
+            self.client = mqtt.Client(CallbackAPIVersion.VERSION2, client_id=client_id)
+        except (ImportError, AttributeError):
+            self.client = mqtt.Client(client_id=client_id)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        # paho's network thread retries with exponential backoff between these bounds
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc == 0:
+            self.connected.set()
+            print("MQTT connected")
+        else:
+            self.connected.clear()
+            print(f"MQTT failed with code {rc}")
+
+    def _on_disconnect(self, client, userdata, *args):
+        self.connected.clear()
+        print("MQTT disconnected")
+
+    def start(self):
+        try:
+            self.client.connect_async(self.broker, self.port, 60)
+            self.client.loop_start()
+        except Exception as e:
+            print(f"MQTT connect error: {e}")
+
+    def stop(self):
+        try:
+            self.client.disconnect()
+            self.client.loop_stop()
+        except Exception as e:
+            print(f"MQTT disconnect error: {e}")
+
+    def wait_ready(self, timeout):
+        return self.connected.wait(timeout)
+
+    def send(self, message):
+        info = self.client.publish(self.topic, payload=message)
+        if info.rc != 0:
+            raise OSError(f"MQTT publish failed (rc={info.rc})")
+
+
+class UnixSocketCommandTransport(CommandTransport):
+    """Sends each command as one datagram to MainApplication's Unix socket.
+
+    No broker and no TCP: a keypress is a single sendto() on the same host. If
+    nobody is listening, sends are retried with exponential backoff.
+    """
+
+    name = TRANSPORT_UNIX
+
+    def __init__(self, path=DEFAULT_COMMAND_SOCKET):
+        self.path = path
+        self.address = socket_address(path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.backoff = 0.0
+        self.retry_at = 0.0
+
+    def stop(self):
+        self.sock.close()
+
+    def wait_ready(self, timeout):
+        delay = self.retry_at - time.monotonic()
+        if delay <= 0:
+            return True
+        time.sleep(min(delay, timeout))
+        return delay <= timeout
+
+    def send(self, message):
+        data = message.encode() if isinstance(message, str) else message
+        try:
+            self.sock.sendto(data, self.address)
+        except OSError:
+            self.backoff = min(5.0, self.backoff * 2 if self.backoff else 0.1)
+            self.retry_at = time.monotonic() + self.backoff
+            raise
+        if self.backoff:
+            print(f"Command socket {self.path} reachable again.")
+        self.backoff = 0.0
+
+
+def create_command_transport(kind, broker, port, topic, socket_path=DEFAULT_COMMAND_SOCKET):
+    """Builds the sending transport named by the command_transport setting."""
+    kind = (kind or TRANSPORT_MQTT).strip().lower()
+    if kind == TRANSPORT_UNIX:
+        return UnixSocketCommandTransport(socket_path)
+    if kind != TRANSPORT_MQTT:
+        print(f"Warning: Unknown command_transport '{kind}', using MQTT.")
+    return MqttCommandTransport(broker, port, topic)
+
+
+class UnixSocketCommandServer:
+    """Receiving side of the Unix socket transport: calls on_message(text) per datagram on a reader thread.
+
+    Abstract sockets have no permissions, so every datagram carries the
+    sender's credentials (SO_PASSCRED) and only allowed_uids are accepted:
+    by default root (KeyboardListener) and the user running MainApplication.
+    """
+
+    def __init__(self, path, on_message, allowed_uids=None):
+        self.path = path
+        self.address = socket_address(path)
+        self.on_message = on_message
+        self.allowed_uids = set(allowed_uids) if allowed_uids is not None else {0, os.getuid()}
+        self.rejected = 0
+        self.sock = None
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        if not self.path.startswith("@") and os.path.exists(self.path):
+            os.unlink(self.path) # Stale socket file from a previous run
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_PASSCRED, 1)
+        self.sock.bind(self.address)
+        if not self.path.startswith("@"):
+            # Owner only; KeyboardListener runs as root and is not subject to it
+            os.chmod(self.path, 0o600)
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="UnixSocketCommandServer", daemon=True)
+        self.thread.start()
+        print(f"Listening for commands on Unix socket {self.path}")
+
+    def _run(self):
+        while self.running:
+            try:
+                data, ancdata, _, _ = self.sock.recvmsg(MAX_DATAGRAM, socket.CMSG_SPACE(UCRED.size))
+            except OSError:
+                break # Socket closed by stop()
+            if not self.running:
+                break
+            uid = None
+            for level, kind, cdata in ancdata:
+                if level == socket.SOL_SOCKET and kind == socket.SCM_CREDENTIALS and len(cdata) >= UCRED.size:
+                    _, uid, _ = UCRED.unpack_from(cdata)
+            if uid not in self.allowed_uids:
+                self.rejected += 1
+                print(f"Ignoring command on {self.path} from uid {uid}") # DEBUG
+                continue
+            try:
+                self.on_message(data.decode(errors="replace"))
+            except Exception as e:
+                print(f"Error handling command from {self.path}: {e}")
+
+    def stop(self):
+        self.running = False
+        if self.sock:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.sock.close()
+            self.sock = None
+        if not self.path.startswith("@") and os.path.exists(self.path):
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
@@ -0,0 +1,88 @@
+import numpy as np
+
+DEFAULT_BLOCK = 32        # Pixels per side of the blocks frames are compared in
+DEFAULT_THRESHOLD = 24    # 0-255: a pixel changed if a channel moved by more than this
+DEFAULT_MIN_PIXELS = 4    # Changed pixels a block needs, so single-pixel noise is ignored
+DEFAULT_PADDING = 16      # Context kept around each region, in pixels
+DEFAULT_MAX_REGIONS = 4
+DEFAULT_MAX_AREA = 0.5    # Above this share of the frame, the whole frame is cheaper to send
+
+
+def changed_blocks(previous, current, block=DEFAULT_BLOCK, threshold=DEFAULT_THRESHOLD, min_pixels=DEFAULT_MIN_PIXELS):
+    """Returns a (rows, cols) bool grid of the blocks that differ between two same-sized HxWx3 uint8 frames."""
+    # |a - b| without widening to int16: max - min stays within uint8
+    diff = np.maximum(previous, current)
+    diff -= np.minimum(previous, current)
+    changed = diff.max(axis=2) > threshold
+    height, width = changed.shape
+    rows, cols = -(-height // block), -(-width // block)
+    padded = np.zeros((rows * block, cols * block), dtype=bool)
+    padded[:height, :width] = changed
+    return padded.reshape(rows, block, cols, block).sum(axis=(1, 3)) >= min_pixels
+
+
+def _components(grid):
+    """Bounding boxes (row0, col0, row1, col1), exclusive ends, of the 8-connected groups of True cells."""
+    seen = np.zeros_like(grid)
+    rows, cols = grid.shape
+    boxes = []
+    for r, c in np.argwhere(grid):
+        if seen[r, c]:
+            continue
+        seen[r, c] = True
+        stack = [(r, c)]
+        r0, c0, r1, c1 = r, c, r, c
+        while stack:
+            y, x = stack.pop()
+            r0, c0, r1, c1 = min(r0, y), min(c0, x), max(r1, y), max(c1, x)
+            for ny in (y - 1, y, y + 1):
+                for nx in (x - 1, x, x + 1):
+                    if 0 <= ny < rows and 0 <= nx < cols and grid[ny, nx] and not seen[ny, nx]:
+                        seen[ny, nx] = True
+                        stack.append((ny, nx))
+        boxes.append((int(r0), int(c0), int(r1) + 1, int(c1) + 1))
+    return boxes
+
+
+def _merge(boxes):
+    """Merges overlapping (x0, y0, x1, y1) boxes until none overlap."""
+    boxes = list(boxes)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    boxes[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return boxes
+
+
+def changed_regions(previous, current, block=DEFAULT_BLOCK, threshold=DEFAULT_THRESHOLD, min_pixels=DEFAULT_MIN_PIXELS,
+                    padding=DEFAULT_PADDING, max_regions=DEFAULT_MAX_REGIONS, max_area=DEFAULT_MAX_AREA):
+    """Returns the (x0, y0, x1, y1) pixel boxes, top to bottom, that changed from previous to current.
+
+    [] means nothing changed. None means the frames cannot be compared usefully:
+    different sizes, or so much changed (more than max_area of the frame once
+    padded and merged) that the whole frame should be sent instead. More than
+    max_regions regions are combined into their common bounding box.
+    """
+    previous, current = np.asarray(previous), np.asarray(current)
+    if previous.shape != current.shape or current.ndim != 3:
+        return None
+    height, width = current.shape[:2]
+    boxes = []
+    for r0, c0, r1, c1 in _components(changed_blocks(previous, current, block, threshold, min_pixels)):
+        boxes.append((max(0, c0 * block - padding), max(0, r0 * block - padding),
+                      min(width, c1 * block + padding), min(height, r1 * block + padding)))
+    boxes = _merge(boxes)
+    if len(boxes) > max_regions:
+        boxes = [(min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes))]
+    if sum((b[2] - b[0]) * (b[3] - b[1]) for b in boxes) > max_area * width * height:
+        return None
+    return sorted(boxes, key=lambda b: (b[1], b[0]))
@@ -0,0 +1,183 @@
+import io
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+DEFAULT_WORKERS = 2
+BLOCK_ROUNDING = 1 << 20 # Blocks are sized in whole MiB so small size changes reuse them
+MAX_FREE_BLOCKS = 8
+WORKER_ATTACH_CACHE = 8
+
+
+def encode_pil(img, image_options=None):
+    """Encodes a PIL image for the LLM: RGB, optional max_size thumbnail, PNG or JPEG/WEBP at quality.
+
+    Returns (bytes, format). Used in-process and inside FramePool workers.
+    """
+    image_options = image_options or {}
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    max_size = image_options.get('max_size')
+    if max_size and max(img.size) > max_size:
+        img = img.copy()
+        img.thumbnail((max_size, max_size))
+    image_format = image_options.get('format', 'png').upper()
+    if image_format not in ('JPEG', 'WEBP'):
+        image_format = 'PNG'
+    img_byte_arr = io.BytesIO()
+    if image_format == 'PNG':
+        img.save(img_byte_arr, format='PNG')
+    else:
+        img.save(img_byte_arr, format=image_format, quality=image_options.get('quality', 85))
+    return img_byte_arr.getvalue(), image_format
+
+
+# --- Worker side ---
+_attached = {} # shared memory name -> SharedMemory, most recently used last
+
+
+def _attach(name):
+    block = _attached.pop(name, None)
+    if block is None:
+        block = shared_memory.SharedMemory(name=name)
+        while len(_attached) >= WORKER_ATTACH_CACHE:
+            old_name = next(iter(_attached))
+            try:
+                _attached.pop(old_name).close()
+            except BufferError:
+                pass # Still referenced by a live image; unmapped when collected
+    _attached[name] = block
+    return block
+
+
+def _run_on_frame(name, mode, size, func, args):
+    from PIL import Image
+    block = _attach(name)
+    # Read straight from the shared block. Modes Pillow stores unpacked (e.g. RGB as
+    # 4 bytes per pixel) are copied into the image here; none are pickled
+    image = Image.frombuffer(mode, size, block.buf, "raw", mode, 0, 1)
+    try:
+        return func(image, *args)
+    finally:
+        del image
+
+
+def _warm_up():
+    from PIL import Image # Pay the import in the worker before the first frame
+    return True
+
+
+# --- Parent side ---
+class FramePool:
+    """Process pool for CPU-heavy frame work, with pixels passed through shared memory.
+
+    run(func, image, *args) copies the image's pixels into a reusable
+    multiprocessing.shared_memory block (tobytes() and the copy into the
+    block) and calls func(image, *args) in a worker process on an image read
+    from the block (a view for L/RGBA, another copy for RGB). Pixels never go
+    through pickle or a pipe; only func's result (e.g. the encoded bytes) is
+    pickled back. Palette images are converted to RGB/RGBA first, since only
+    the raw pixels reach the worker. The calling thread waits without holding
+    the GIL, so Qt and GLib stay responsive while several frames are encoded
+    on other cores. func must be a module-level function.
+
+    Workers are started with "spawn": forking a process that runs Qt, GLib
+    and paho threads is unsafe. Spawned workers import the main module once,
+    so start() warms them up in the background.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS):
+        self.workers = max(1, workers)
+        self.executor = None
+        self.lock = threading.Lock()
+        self.free = [] # Idle SharedMemory blocks
+        self.blocks = {} # name -> SharedMemory, every block this pool created
+
+    def start(self):
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        for _ in range(self.workers):
+            self.executor.submit(_warm_up)
+        return self
+
+    def _acquire(self, size):
+        with self.lock:
+            for i, block in enumerate(self.free):
+                if block.size >= size:
+                    return self.free.pop(i)
+        block = shared_memory.SharedMemory(create=True, size=-(-size // BLOCK_ROUNDING) * BLOCK_ROUNDING)
+        with self.lock:
+            self.blocks[block.name] = block
+        return block
+
+    def _release(self, block):
+        with self.lock:
+            self.free.append(block)
+            if len(self.free) <= MAX_FREE_BLOCKS:
+                return
+            block = self.free.pop(0)
+            del self.blocks[block.name]
+        block.close()
+        block.unlink()
+
+    def run(self, func, image, *args):
+        """Runs func(image, *args) in a worker and returns its result (exceptions are re-raised here).
+
+        If the pool is stopped, or a worker died and broke it, func runs in the calling thread instead.
+        Errors raised by func itself reach the caller and leave the pool running.
+        """
+        executor = self.executor
+        if executor is None:
+            return func(image, *args)
+        if image.mode in ("P", "PA"):
+            # The palette does not travel with the pixels
+            has_alpha = image.mode == "PA" or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+        raw = image.tobytes()
+        block = self._acquire(len(raw))
+        try:
+            block.buf[:len(raw)] = raw
+            del raw
+            try:
+                future = executor.submit(_run_on_frame, block.name, image.mode, image.size, func, args)
+            except RuntimeError as e: # After shutdown, or BrokenProcessPool
+                self._disable(executor, e)
+                return func(image, *args)
+            try:
+                return future.result()
+            except BrokenProcessPool as e:
+                self._disable(executor, e)
+                return func(image, *args)
+        finally:
+            self._release(block)
+
+    def _disable(self, executor, error):
+        """Shuts down a pool that can no longer take work; later frames are encoded in-process."""
+        print(f"Frame pool unavailable ({error}); encoding in-process.") # DEBUG
+        if self.executor is executor:
+            self.executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def trim(self):
+        """Unlinks the idle shared memory blocks (they are recreated on demand)."""
+        with self.lock:
+            blocks, self.free = self.free, []
+            for block in blocks:
+                del self.blocks[block.name]
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    def stop(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        with self.lock:
+            blocks, self.blocks, self.free = list(self.blocks.values()), {}, []
+        for block in blocks:
+            try:
+                block.close()
+                block.unlink()
+            except (OSError, BufferError):
+                pass
@@ -0,0 +1,115 @@
+import re
+import time
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created REAL NOT NULL,
+    sender TEXT,
+    request_id TEXT,
+    text TEXT NOT NULL
+)
+"""
+# External-content FTS5 index kept in sync by triggers
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(text, content='history', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN
+    INSERT INTO history_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN
+    INSERT INTO history_fts(history_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+# "[Sender]: text", "[Sender] [request-id]: text" or "[Sender] (MQTT disconnected): text"
+LINE_PATTERN = re.compile(r"^(\[[^\]]+\])(?: \[([^\]]+)\])?(?: \([^)]*\))?: ")
+PRUNE_EVERY = 500 # Inserts between retention checks
+
+
+def split_sender(line):
+    """Returns (sender, request_id) parsed from a displayed chat line, or (None, None)."""
+    match = LINE_PATTERN.match(line)
+    return (match.group(1), match.group(2)) if match else (None, None)
+
+
+def fts_query(text):
+    """Turns free text into an FTS5 query matching all words, without FTS syntax surprises."""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+
+class HistoryStore:
+    """Persistent chat/analysis history in sqlite, with an FTS5 full-text index.
+
+    Every displayed message is one row; the chat view loads pages of rows by id
+    instead of holding the whole history in the QTextEdit. Thread-safe.
+    max_entries = 0 keeps everything.
+    """
+
+    def __init__(self, path, max_entries=0):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(SCHEMA)
+        try:
+            self.db.executescript(FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError as e:
+            print(f"History search without full-text index (FTS5 unavailable: {e})")
+            self.has_fts = False
+        self.inserts = 0
+
+    def add(self, text, sender=None, request_id=None):
+        """Appends one message and returns its id."""
+        if sender is None:
+            sender, request_id = split_sender(text)
+        with self.lock:
+            cursor = self.db.execute("INSERT INTO history (created, sender, request_id, text) VALUES (?, ?, ?, ?)",
+                                     (time.time(), sender, request_id, text))
+            self.inserts += 1
+            if self.max_entries and self.inserts % PRUNE_EVERY == 0:
+                self.db.execute("DELETE FROM history WHERE id <= ?", (cursor.lastrowid - self.max_entries,))
+            return cursor.lastrowid
+
+    def _rows(self, sql, params):
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def latest(self, limit):
+        """The newest `limit` entries as (id, created, text), oldest first."""
+        return self._rows("SELECT id, created, text FROM history ORDER BY id DESC LIMIT ?", (limit,))[::-1]
+
+    def oldest(self, limit):
+        return self._rows("SELECT id, created, text FROM history ORDER BY id LIMIT ?", (limit,))
+
+    def before(self, entry_id, limit):
+        return self._rows("SELECT id, created, text FROM history WHERE id < ? ORDER BY id DESC LIMIT ?",
+                          (entry_id, limit))[::-1]
+
+    def after(self, entry_id, limit):
+        return self._rows("SELECT id, created, text FROM history WHERE id > ? ORDER BY id LIMIT ?",
+                          (entry_id, limit))
+
+    def search(self, text, limit=100):
+        """The newest `limit` entries matching all words of text, oldest first."""
+        if not text.strip():
+            return []
+        if self.has_fts:
+            rows = self._rows("SELECT h.id, h.created, h.text FROM history_fts f JOIN history h ON h.id = f.rowid "
+                              "WHERE history_fts MATCH ? ORDER BY h.id DESC LIMIT ?", (fts_query(text), limit))
+        else:
+            words = text.split()
+            rows = self._rows("SELECT id, created, text FROM history WHERE "
+                              + " AND ".join("text LIKE ?" for _ in words) + " ORDER BY id DESC LIMIT ?",
+                              [f"%{word}%" for word in words] + [limit])
+        return rows[::-1]
+
+    def count(self):
+        return self._rows("SELECT COUNT(*) FROM history", ())[0][0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
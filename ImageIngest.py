@@ -0,0 +1,227 @@
+import io
+import json
+import time
+import threading
+from collections import OrderedDict
+
+from CommandProtocol import CommandError, command_from_dict
+from Metrics import metrics
+
+# --- Ingest payload ---
+# Cameras and other hosts publish to <mqtt_ingest_topic>/<source> either the raw
+# JPEG/PNG/WebP bytes, or a one-line JSON header, a newline, then the image bytes:
+#   {"request_id": "cam1-0042", "prompt": "count the people", "model": "llava"}\n<JPEG bytes>
+# The header accepts the same fields as a command (see CommandProtocol); "command"
+# defaults to "ingest". Frames are analysed as sent when their format and size
+# already satisfy the request's image options; otherwise they are decoded and re-encoded.
+INGEST_COMMAND = "ingest"
+JPEG_MAGIC = b"\xff\xd8\xff"
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+MAX_HEADER = 16384
+MAX_SOURCES = 64      # Sources with their own token bucket and queue
+OVERFLOW_SOURCE = "*" # Shared bucket and queue for sources beyond MAX_SOURCES
+
+
+def sniff_format(data):
+    if data.startswith(JPEG_MAGIC):
+        return "jpeg"
+    if data.startswith(PNG_MAGIC):
+        return "png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+class EncodedImage:
+    """An image still in its wire encoding; decoded only if it has to be re-encoded."""
+
+    def __init__(self, data, image_format, size=None):
+        self.data = data
+        self.format = image_format
+        self._size = size
+
+    @property
+    def size(self):
+        if self._size is None:
+            from PIL import Image
+            # Image.open only parses the header; pixels are not decoded here
+            with Image.open(io.BytesIO(self.data)) as img:
+                self._size = img.size
+        return self._size
+
+    def acceptable(self, image_options=None):
+        """True if the bytes can go to the model unchanged for these image options."""
+        image_options = image_options or {}
+        if image_options.get('format', self.format) != self.format:
+            return False
+        max_size = image_options.get('max_size')
+        return not (max_size and max(self.size) > max_size)
+
+    def to_pil(self):
+        from PIL import Image
+        img = Image.open(io.BytesIO(self.data))
+        img.load()
+        return img
+
+    def copy(self):
+        return self
+
+
+def parse_ingest_payload(payload, properties=None, source=None, reserved_topics=()):
+    """Splits an ingest payload into (Command, EncodedImage). Raises CommandError if it is not usable.
+
+    reserved_topics are passed to command_from_dict() and refused as response topics.
+    """
+    header = {}
+    data = payload
+    if payload[:1] == b"{":
+        end = payload.find(b"\n", 0, MAX_HEADER)
+        if end < 0:
+            raise CommandError("JSON header must be followed by a newline before the image bytes")
+        try:
+            header = json.loads(payload[:end].decode())
+        except ValueError as e:
+            raise CommandError(f"malformed JSON header: {e}")
+        if not isinstance(header, dict):
+            raise CommandError("header must be a JSON object")
+        data = payload[end + 1:]
+    image_format = sniff_format(data)
+    if image_format is None:
+        raise CommandError("payload is not a JPEG, PNG or WebP image")
+    header.setdefault('command', INGEST_COMMAND)
+    response_topic = getattr(properties, 'ResponseTopic', None) if properties is not None else None
+    correlation_data = getattr(properties, 'CorrelationData', None) if properties is not None else None
+    request = command_from_dict(header, response_topic or header.pop('response_topic', None),
+                                correlation_data, source, reserved_topics)
+    return request, EncodedImage(data, image_format)
+
+
+class IngestScheduler:
+    """Runs remote-frame analyses with per-source rate limits and backpressure.
+
+    Each source gets a token bucket (rate frames/s, burst) and at most
+    queue_per_source waiting frames; when full, the oldest waiting frame of that
+    source is replaced, since cameras care about the latest view. Sources are
+    served round-robin by a fixed number of workers, and workers hold back while
+    local captures are being analysed so remote frames never delay them.
+
+    The source is the topic suffix, so anyone can invent new ones. At most
+    max_sources are tracked; idle buckets (refilled to burst, nothing queued)
+    are forgotten, least recently used first, and while all are busy new
+    sources share one OVERFLOW_SOURCE bucket and queue. Rotating subtopics
+    therefore neither bypasses the rate limit nor grows the tables.
+    """
+
+    def __init__(self, handler, rate=0.5, burst=2, queue_per_source=1, workers=1, max_sources=MAX_SOURCES):
+        self.handler = handler # handler(request, image), called on a worker thread
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.queue_per_source = max(1, queue_per_source)
+        self.workers = max(1, workers)
+        self.max_sources = max(1, max_sources)
+        self.lock = threading.Condition()
+        self.queues = OrderedDict() # source -> list of (request, image, queued_at), in round-robin order
+        self.buckets = OrderedDict() # source -> (tokens, last refill time), least recently used first
+        self.local_busy = 0
+        self.running = False
+        self.threads = []
+        self.stats = {'accepted': 0, 'rate_limited': 0, 'replaced': 0, 'done': 0, 'overflow': 0}
+
+    def start(self):
+        self.running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"IngestWorker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            self.lock.notify_all()
+
+    def _take_token(self, source, now):
+        if self.rate <= 0:
+            return True
+        tokens, last = self.buckets.get(source, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+        if tokens < 1.0:
+            self.buckets[source] = (tokens, now)
+            return False
+        self.buckets[source] = (tokens - 1.0, now)
+        return True
+
+    def _prune(self, now):
+        """Forgets sources whose bucket is full again and that have nothing queued."""
+        for source, (tokens, last) in list(self.buckets.items()):
+            if source not in self.queues and (self.rate <= 0 or tokens + (now - last) * self.rate >= self.burst):
+                del self.buckets[source]
+
+    def _source_key(self, source, now):
+        if source in self.buckets:
+            self.buckets.move_to_end(source)
+            return source
+        if source in self.queues:
+            return source
+        if len(self.buckets) >= self.max_sources:
+            self._prune(now)
+        if len(self.buckets) < self.max_sources and len(self.queues) < self.max_sources:
+            return source
+        self.stats['overflow'] += 1
+        return OVERFLOW_SOURCE
+
+    def submit(self, request, image):
+        """Queues a frame. Returns (accepted, replaced_request); replaced_request was dropped for this one."""
+        now = time.monotonic()
+        with self.lock:
+            source = self._source_key(request.source or "unknown", now)
+            if not self._take_token(source, now):
+                self.stats['rate_limited'] += 1
+                return False, None
+            queue = self.queues.setdefault(source, [])
+            replaced = None
+            if len(queue) >= self.queue_per_source:
+                replaced = queue.pop(0)[0]
+                self.stats['replaced'] += 1
+            queue.append((request, image, now))
+            self.stats['accepted'] += 1
+            self.lock.notify()
+            return True, replaced
+
+    def local_started(self):
+        with self.lock:
+            self.local_busy += 1
+
+    def local_finished(self):
+        with self.lock:
+            self.local_busy = max(0, self.local_busy - 1)
+            self.lock.notify_all()
+
+    def _next_job(self):
+        # Round-robin: take from the first source with work, then move it to the back
+        for source, queue in self.queues.items():
+            if queue:
+                job = queue.pop(0)
+                self.queues.move_to_end(source)
+                if not queue:
+                    del self.queues[source]
+                return job
+        return None
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while self.running and (self.local_busy or not any(self.queues.values())):
+                    self.lock.wait()
+                if not self.running:
+                    return
+                job = self._next_job()
+            if job is None:
+                continue
+            request, image, queued_at = job
+            metrics.observe("queue_wait_seconds", time.monotonic() - queued_at, queue="ingest")
+            try:
+                self.handler(request, image)
+            except Exception as e:
+                print(f"Error analysing ingested frame {request.request_id}: {e}")
+            with self.lock:
+                self.stats['done'] += 1
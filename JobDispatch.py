@@ -0,0 +1,157 @@
+import json
+import time
+import uuid
+import threading
+
+# --- Distributed analysis topics (below the analysis_job_topic setting) ---
+#   <base>/queue            producer -> workers, via the shared subscription $share/<group>/<base>/queue
+#   <base>/reply/<producer> workers -> producer: status ("claimed"/"heartbeat") and results
+#   <base>/done             producer -> all workers: ids of finished jobs, so queued duplicates are skipped
+# A job is a one-line JSON header, a newline, then the encoded image (as in ImageIngest):
+#   {"job_id": "...", "attempt": 1, "prompt": "...", "model": "...", "lease": 30, "reply_to": "..."}\n<image>
+# Workers heartbeat every lease/3 seconds while working. A job with no sign of
+# life for a whole lease is published again, up to max_attempts times; the first
+# result wins and later ones are ignored.
+MSG_CLAIMED = "claimed"
+MSG_HEARTBEAT = "heartbeat"
+MSG_RESULT = "result"
+DEFAULT_GROUP = "sauroneye-workers"
+DEFAULT_LEASE = 30.0
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def queue_topic(base):
+    return f"{base}/queue"
+
+
+def shared_queue_topic(base, group=DEFAULT_GROUP):
+    return f"$share/{group}/{base}/queue"
+
+
+def reply_topic(base, producer_id):
+    return f"{base}/reply/{producer_id}"
+
+
+def done_topic(base):
+    return f"{base}/done"
+
+
+def encode_job(header, image_bytes):
+    return json.dumps(header).encode() + b"\n" + image_bytes
+
+
+def decode_job(payload):
+    """Returns (header dict, image bytes). Raises ValueError for malformed jobs."""
+    end = payload.find(b"\n")
+    if end < 0:
+        raise ValueError("job has no header line")
+    header = json.loads(payload[:end].decode())
+    if not isinstance(header, dict) or 'job_id' not in header or 'reply_to' not in header:
+        raise ValueError("job header needs job_id and reply_to")
+    return header, payload[end + 1:]
+
+
+class JobDispatcher:
+    """Producer side: publishes jobs to the worker pool and tracks their leases.
+
+    publish(topic, payload, single) sends an MQTT message; on_done(request, status,
+    text, worker) is called once per job, from the MQTT thread or the lease thread.
+    """
+
+    def __init__(self, base_topic, publish, on_done, lease=DEFAULT_LEASE, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.base_topic = base_topic
+        self.producer_id = uuid.uuid4().hex[:12]
+        self.reply_topic = reply_topic(base_topic, self.producer_id)
+        self.publish = publish
+        self.on_done = on_done
+        self.lease = lease
+        self.max_attempts = max(1, max_attempts)
+        self.jobs = {} # job_id -> {'request', 'header', 'image', 'deadline', 'worker'}
+        self.lock = threading.Lock()
+        self.running = False
+        self.stats = {'submitted': 0, 'retried': 0, 'completed': 0, 'failed': 0, 'duplicates': 0}
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._watch_leases, name="JobLeaseWatcher", daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def submit(self, request, image_bytes, prompt, model):
+        """Queues one analysis job for the worker pool."""
+        job_id = f"{self.producer_id}-{request.request_id}-{uuid.uuid4().hex[:6]}"
+        header = {'job_id': job_id, 'attempt': 1, 'prompt': prompt, 'model': model,
+                  'lease': self.lease, 'reply_to': self.reply_topic}
+        with self.lock:
+            self.jobs[job_id] = {'request': request, 'header': header, 'image': image_bytes,
+                                 'deadline': time.monotonic() + self.lease, 'worker': None}
+            self.stats['submitted'] += 1
+        self._send(header, image_bytes)
+        return job_id
+
+    def _send(self, header, image_bytes):
+        try:
+            self.publish(queue_topic(self.base_topic), encode_job(header, image_bytes), True)
+        except Exception as e:
+            # The lease watcher will retry it
+            print(f"Error publishing job {header['job_id']}: {e}")
+
+    def handle_reply(self, payload):
+        """Processes a status or result message from a worker. Runs in the MQTT thread."""
+        message = json.loads(payload)
+        job_id = message.get('job_id')
+        kind = message.get('type')
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                if kind == MSG_RESULT:
+                    self.stats['duplicates'] += 1
+                return
+            if kind in (MSG_CLAIMED, MSG_HEARTBEAT):
+                job['deadline'] = time.monotonic() + self.lease
+                job['worker'] = message.get('worker')
+                return
+            if kind != MSG_RESULT:
+                return
+            del self.jobs[job_id]
+            self.stats['completed'] += 1
+        self._finish(job_id, job['request'], message.get('status', 'ok'), message.get('text', ''),
+                     message.get('worker'))
+
+    def _finish(self, job_id, request, status, text, worker):
+        try:
+            self.publish(done_topic(self.base_topic), job_id, False)
+        except Exception as e:
+            print(f"Error publishing done notice for {job_id}: {e}")
+        self.on_done(request, status, text, worker)
+
+    def _watch_leases(self):
+        while self.running:
+            time.sleep(min(1.0, self.lease / 3))
+            now = time.monotonic()
+            resend, failed = [], []
+            with self.lock:
+                for job_id, job in list(self.jobs.items()):
+                    if now < job['deadline']:
+                        continue
+                    if job['header']['attempt'] >= self.max_attempts:
+                        del self.jobs[job_id]
+                        self.stats['failed'] += 1
+                        failed.append((job_id, job))
+                        continue
+                    job['header'] = dict(job['header'], attempt=job['header']['attempt'] + 1)
+                    job['deadline'] = now + self.lease
+                    self.stats['retried'] += 1
+                    print(f"Job {job_id} lease expired (worker {job['worker'] or 'none'}), "
+                          f"retrying, attempt {job['header']['attempt']}/{self.max_attempts}")
+                    resend.append(job)
+            for job in resend:
+                self._send(job['header'], job['image'])
+            for job_id, job in failed:
+                self._finish(job_id, job['request'], 'error',
+                             f"No worker finished the job after {self.max_attempts} attempts.", job['worker'])
+
+    def pending(self):
+        with self.lock:
+            return len(self.jobs)
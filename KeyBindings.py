@@ -0,0 +1,215 @@
+import json
+import time
+from evdev import ecodes
+
+# --- Binding modes ---
+MODE_PRESS = "press" # Fires on key down (and throttled autorepeat if repeat= is set)
+MODE_TAP = "tap"     # Fires on release if the key was not held past the hold threshold
+MODE_HOLD = "hold"   # Fires once the key has been held for hold= (long-press)
+
+DEFAULT_HOLD = 0.5   # Seconds before a press counts as a long-press
+OPTION_KEYS = ("hold", "repeat", "debounce") # Everything else in a binding is payload
+
+
+def key_name(code):
+    name = ecodes.KEY.get(code, str(code))
+    return name[0] if isinstance(name, (list, tuple)) else name
+
+
+def parse_duration(value):
+    """Parses '600ms', '0.6s' or '0.6' (seconds) into seconds."""
+    value = value.strip().lower()
+    if value.endswith("ms"):
+        return float(value[:-2]) / 1000.0
+    if value.endswith("s"):
+        return float(value[:-1])
+    return float(value)
+
+
+def parse_rate(value):
+    """Parses '8', '8/s' or '8hz' (events per second) into a minimum interval in seconds."""
+    value = value.strip().lower()
+    for suffix in ("/s", "hz"):
+        if value.endswith(suffix):
+            value = value[:-len(suffix)]
+    rate = float(value)
+    return 1.0 / rate if rate > 0 else 0.0
+
+
+class Binding:
+    """One trigger (a key or chord, with a mode) and the command it publishes."""
+
+    def __init__(self, codes, mode, command, payload=None, hold=DEFAULT_HOLD, repeat=0.0, debounce=0.0):
+        self.codes = tuple(codes)
+        self.mode = mode
+        self.command = command
+        self.payload = payload or {}
+        self.hold = hold
+        self.repeat = repeat     # Minimum interval between autorepeat fires (0 = no repeat)
+        self.debounce = debounce # Minimum interval between any two fires
+        # Plain command strings stay compatible with existing subscribers
+        if self.payload:
+            self.message = json.dumps(dict(command=command, **self.payload))
+        else:
+            self.message = command
+
+    @property
+    def is_chord(self):
+        return len(self.codes) > 1
+
+    def __repr__(self):
+        names = "+".join(key_name(code) for code in self.codes)
+        return f"Binding({names}@{self.mode} -> {self.message})"
+
+
+def parse_binding(trigger, value):
+    """Parses 'KEY_A+KEY_B@tap' = 'command; option=value; ...' into a Binding."""
+    trigger = trigger.strip()
+    mode = MODE_PRESS
+    if "@" in trigger:
+        trigger, mode = trigger.rsplit("@", 1)
+        mode = mode.strip().lower()
+        if mode not in (MODE_PRESS, MODE_TAP, MODE_HOLD):
+            raise ValueError(f"unknown binding mode '{mode}'")
+    codes = []
+    for name in trigger.split("+"):
+        code = ecodes.ecodes.get(name.strip().upper())
+        if code is None:
+            raise ValueError(f"unknown key '{name.strip()}'")
+        codes.append(code)
+
+    parts = [part.strip() for part in value.split(";")]
+    command = parts[0]
+    if not command:
+        raise ValueError("missing command")
+    options = {}
+    payload = {}
+    for part in parts[1:]:
+        if not part:
+            continue
+        key, _, option_value = part.partition("=")
+        key = key.strip().lower()
+        option_value = option_value.strip()
+        if key in OPTION_KEYS:
+            options[key] = option_value
+        else:
+            payload[key] = option_value
+    return Binding(
+        codes, mode, command, payload,
+        hold=parse_duration(options["hold"]) if "hold" in options else DEFAULT_HOLD,
+        repeat=parse_rate(options["repeat"]) if "repeat" in options else 0.0,
+        debounce=parse_duration(options["debounce"]) if "debounce" in options else 0.0,
+    )
+
+
+def parse_bindings_section(section, skip=()):
+    """Parses every trigger = command line in a config section, ignoring keys listed in skip."""
+    bindings = []
+    for trigger, value in section.items():
+        if trigger in skip:
+            continue
+        try:
+            bindings.append(parse_binding(trigger, value))
+        except (ValueError, KeyError) as e:
+            print(f"Warning: Ignoring binding '{trigger} = {value}' in [{section.name}]: {e}")
+    return bindings
+
+
+def bindings_from_intercept(intercept):
+    """Converts a legacy {keycode: command} table into press bindings."""
+    return [Binding((code,), MODE_PRESS, command) for code, command in intercept.items()]
+
+
+class BindingEngine:
+    """Turns one device's key events for bound keys into commands.
+
+    Holds per-device state (held keys, pending long-presses, rate-limit
+    timestamps), so the same bindings can be shared between devices. Call
+    key_event() for every EV_KEY of a bound code, and poll() whenever
+    next_deadline() passes.
+
+    Chord members without a binding of their own (e.g. KP+ in KP+ + KP-Enter)
+    are typing keys: when released without completing a chord they are handed
+    to forward(code, event_time), which types them after all.
+    """
+
+    def __init__(self, bindings, emit, forward=None):
+        self.emit = emit # emit(message, event_time)
+        self.forward = forward
+        self.press = {}  # code -> Binding
+        self.tap = {}
+        self.hold = {}
+        self.chords = []
+        for binding in bindings:
+            if binding.is_chord:
+                self.chords.append(binding)
+            else:
+                {MODE_PRESS: self.press, MODE_TAP: self.tap, MODE_HOLD: self.hold}[binding.mode][binding.codes[0]] = binding
+        self.chord_members = {code for chord in self.chords for code in chord.codes}
+        # Every key that appears in any binding is swallowed from pass-through
+        self.codes = set(self.press) | set(self.tap) | set(self.hold) | self.chord_members
+        self.held = {}       # code -> key-down time
+        self.consumed = set() # Held keys whose chord/hold already fired; their release is silent
+        self.last_fired = {}  # Binding -> time.monotonic() of its last fire
+
+    def _fire(self, binding, event_time, repeat=False):
+        now = time.monotonic()
+        min_interval = max(binding.debounce, binding.repeat if repeat else 0.0)
+        if min_interval and now - self.last_fired.get(binding, 0.0) < min_interval:
+            return False
+        self.last_fired[binding] = now
+        self.emit(binding.message, event_time)
+        return True
+
+    def key_event(self, code, value, event_time):
+        if value == 1:
+            self._key_down(code, event_time)
+        elif value == 2:
+            binding = self.press.get(code)
+            if binding and binding.repeat and code not in self.consumed and code not in self.chord_members:
+                self._fire(binding, event_time, repeat=True)
+        elif value == 0:
+            self._key_up(code, event_time)
+
+    def _key_down(self, code, event_time):
+        self.held[code] = event_time
+        for chord in self.chords:
+            if code in chord.codes and all(member in self.held for member in chord.codes):
+                self._fire(chord, event_time)
+                self.consumed.update(chord.codes)
+                return
+        binding = self.press.get(code)
+        # Chord members defer their own press binding to release, once no chord completed
+        if binding and code not in self.chord_members:
+            self._fire(binding, event_time)
+
+    def _key_up(self, code, event_time):
+        down_time = self.held.pop(code, None)
+        if code in self.consumed:
+            self.consumed.discard(code)
+            return
+        if down_time is None:
+            return
+        held_for = event_time - down_time
+        hold = self.hold.get(code)
+        tap = self.tap.get(code)
+        if tap and (hold is None or held_for < hold.hold):
+            self._fire(tap, event_time)
+        elif code in self.chord_members and code in self.press:
+            self._fire(self.press[code], event_time)
+        elif code in self.chord_members and not tap and not hold and self.forward:
+            self.forward(code, event_time)
+
+    def next_deadline(self):
+        """Returns the earliest time (time.time() clock) a pending long-press fires, or None."""
+        deadlines = [down + self.hold[code].hold for code, down in self.held.items()
+                     if code in self.hold and code not in self.consumed]
+        return min(deadlines) if deadlines else None
+
+    def poll(self, now=None):
+        now = time.time() if now is None else now
+        for code, down in list(self.held.items()):
+            binding = self.hold.get(code)
+            if binding and code not in self.consumed and now - down >= binding.hold:
+                self.consumed.add(code)
+                self._fire(binding, now)
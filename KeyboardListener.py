@@ -2,18 +2,33 @@
 
 import evdev
 from evdev import ecodes
-import uinput
-import paho.mqtt.client as mqtt
 import time
 import os
-import uuid
+import struct
+import queue
+import errno
+import ctypes
+import selectors
+import threading
+from collections import deque
 from configparser import ConfigParser
 import subprocess
+from KeyBindings import BindingEngine, parse_bindings_section, bindings_from_intercept
+from CommandTransport import create_command_transport, DEFAULT_COMMAND_SOCKET
 
 CONFIG_PATH = "config.ini"
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
 MQTT_TOPIC = "ai_assistant/keypad"
+COMMAND_TRANSPORT = "mqtt"    # "mqtt" (via broker) or "unix" (same-host socket)
+COMMAND_SOCKET = DEFAULT_COMMAND_SOCKET
+PUBLISH_QUEUE_SIZE = 64       # Commands buffered while the broker is unreachable
+PUBLISH_MAX_AGE = 5.0         # Seconds after which a queued command is stale and dropped
+LATENCY_REPORT_INTERVAL = 60  # Seconds between latency summaries (0 disables)
+DEVICE_MATCH = ["keyboard", "kbd"] # Grab every device whose name contains one of these
+DEVICE_EXCLUDE = []
+VIRTUAL_DEVICE_PREFIX = "SauronEye passthrough" # Our own uinput devices, never grabbed
+config = ConfigParser()
 
 def ensure_uinput_loaded():
     if not os.path.exists("/dev/uinput"):
@@ -26,51 +41,122 @@ def ensure_uinput_loaded():
             raise SystemExit("Cannot continue without uinput.")
 
 def load_config():
-    global MQTT_BROKER, MQTT_PORT, MQTT_TOPIC
+    global MQTT_BROKER, MQTT_PORT, MQTT_TOPIC, COMMAND_TRANSPORT, COMMAND_SOCKET
+    global PUBLISH_QUEUE_SIZE, PUBLISH_MAX_AGE, LATENCY_REPORT_INTERVAL
+    global DEVICE_MATCH, DEVICE_EXCLUDE
     if os.path.exists(CONFIG_PATH):
-        config = ConfigParser()
         config.read(CONFIG_PATH)
         settings = config['DEFAULT']
         MQTT_BROKER = settings.get('mqtt_broker', MQTT_BROKER)
         MQTT_PORT = int(settings.get('mqtt_port', MQTT_PORT))
         MQTT_TOPIC = settings.get('mqtt_keypad_topic', MQTT_TOPIC)
+        COMMAND_TRANSPORT = settings.get('command_transport', COMMAND_TRANSPORT)
+        COMMAND_SOCKET = settings.get('command_socket', COMMAND_SOCKET)
+        PUBLISH_QUEUE_SIZE = int(settings.get('publish_queue_size', PUBLISH_QUEUE_SIZE))
+        PUBLISH_MAX_AGE = float(settings.get('publish_max_age', PUBLISH_MAX_AGE))
+        LATENCY_REPORT_INTERVAL = float(settings.get('latency_report_interval', LATENCY_REPORT_INTERVAL))
+        DEVICE_MATCH = _split_list(settings.get('device_match', ",".join(DEVICE_MATCH)))
+        DEVICE_EXCLUDE = _split_list(settings.get('device_exclude', ",".join(DEVICE_EXCLUDE)))
+
+def _split_list(value):
+    return [item.strip().lower() for item in value.split(",") if item.strip()]
 
 load_config()
 
-CLIENT_ID = f"keypad_listener_{uuid.uuid4()}"
-mqtt_client = mqtt.Client(client_id=CLIENT_ID)
-mqtt_connected = False
 
-def on_connect(client, userdata, flags, rc):
-    global mqtt_connected
-    mqtt_connected = (rc == 0)
-    print("MQTT connected" if mqtt_connected else f"MQTT failed with code {rc}")
+class LatencyStats:
+    """Keeps a window of recent latency samples (ms) and summarises them."""
 
-def on_disconnect(client, userdata, rc):
-    global mqtt_connected
-    mqtt_connected = False
-    print("MQTT disconnected")
+    def __init__(self, name, window=2048):
+        self.name = name
+        self.samples = deque(maxlen=window)
+        self.count = 0
 
-mqtt_client.on_connect = on_connect
-mqtt_client.on_disconnect = on_disconnect
+    def record(self, ms):
+        # deque.append is atomic, so producers on other threads need no lock
+        self.samples.append(ms)
+        self.count += 1
 
-def connect_mqtt():
-    if not mqtt_connected:
-        try:
-            mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
-            mqtt_client.loop_start()
-        except Exception as e:
-            print(f"MQTT connect error: {e}")
+    def summary(self):
+        values = sorted(self.samples)
+        if not values:
+            return f"{self.name}: no samples"
+        def pct(p):
+            return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+        return (f"{self.name}: n={self.count} p50={pct(50):.2f}ms p95={pct(95):.2f}ms "
+                f"p99={pct(99):.2f}ms max={values[-1]:.2f}ms")
+
+
+class CommandPublisher:
+    """Sends intercepted commands from a bounded queue on a dedicated thread.
+
+    The input loop only ever calls submit(), which never blocks: network I/O,
+    connecting and reconnect backoff all happen on the publisher thread and in
+    the CommandTransport (MQTT or Unix socket).
+    """
+
+    def __init__(self, transport, queue_size=PUBLISH_QUEUE_SIZE, max_age=PUBLISH_MAX_AGE):
+        self.transport = transport
+        self.max_age = max_age
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.running = False
+        self.thread = None
+        self.dropped = 0
+        self.publish_latency = LatencyStats(f"key-to-publish ({transport.name})")
+
+    def start(self):
+        self.running = True
+        self.transport.start()
+        self.thread = threading.Thread(target=self._run, name="CommandPublisher", daemon=True)
+        self.thread.start()
 
-def publish_message(topic, message):
-    if not mqtt_connected:
-        connect_mqtt()
-        time.sleep(0.25)
-    if mqtt_connected:
-        mqtt_client.publish(topic, payload=message)
-        print(f"Published: {message}")
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
+        self.transport.stop()
 
-# Only intercept these keypad keys
+    def submit(self, command, event_time=None):
+        """Queues a command without blocking. Drops the oldest entry if the queue is full."""
+        item = (command, event_time if event_time is not None else time.time())
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    stale = self.queue.get_nowait()
+                    self.dropped += 1
+                    print(f"Publish queue full, dropped: {stale[0]}")
+                except queue.Empty:
+                    pass
+
+    def _run(self):
+        while self.running:
+            try:
+                command, event_time = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            # Retry until delivered, but give up on commands too old to be meaningful
+            sent = False
+            while self.running and time.time() - event_time <= self.max_age:
+                if not self.transport.wait_ready(0.5):
+                    continue
+                try:
+                    self.transport.send(command)
+                    sent = True
+                    break
+                except OSError as e:
+                    print(f"Command send error ({self.transport.name}): {e}")
+            if not sent:
+                self.dropped += 1
+                age = time.time() - event_time
+                print(f"Dropped stale command '{command}' ({age:.1f}s old, {self.transport.name} unavailable)")
+                continue
+            self.publish_latency.record((time.time() - event_time) * 1000.0)
+            print(f"Published: {command}")
+
+# Built-in keypad bindings, used when config.ini has no [Bindings] section
 INTERCEPT = {
     ecodes.KEY_KPENTER: "capture",
     ecodes.KEY_KP4: "scroll_left",
@@ -85,92 +171,333 @@ INTERCEPT = {
     ecodes.KEY_PAGEDOWN: "page_down"
 }
 
-def find_keyboard():
-    # Choose a device with "keyboard" or "kbd" in its name.
-    for path in evdev.list_devices():
-        dev = evdev.InputDevice(path)
-        if ecodes.EV_KEY in dev.capabilities():
-            if "keyboard" in dev.name.lower() or "kbd" in dev.name.lower():
-                print(f"Using input: {dev.path} ({dev.name})")
-                return dev
-    raise RuntimeError("No keyboard device found.")
-
-def main():
-    if os.geteuid() != 0:
-        raise SystemExit("Must run as root.")
+def load_binding_sets():
+    """Returns (default_bindings, [(match, bindings), ...]) from the config file.
 
-    ensure_uinput_loaded()
-    connect_mqtt()
-    src = find_keyboard()
-    src.grab()
-
-    # Setup passthrough devices
-    keyboard_passthrough = []
-    for code, name in ecodes.keys.items():
-        if code in INTERCEPT:
-            continue
-        if isinstance(name, tuple):
-            name = name[0]
-        if name.startswith("BTN_"):
+    Bindings come from [Bindings] and [Bindings:<match>] sections ([Intercept] and
+    [Intercept:<match>] are accepted as older names). A device uses the first
+    per-device section whose <match> appears in its name or path, otherwise
+    [Bindings], otherwise the built-in INTERCEPT table.
+    """
+    default_bindings = bindings_from_intercept(INTERCEPT)
+    device_bindings = []
+    skip = config.defaults() # Inherited [DEFAULT] settings, not bindings
+    for name in config.sections():
+        base, _, match = name.partition(":")
+        if base not in ("Bindings", "Intercept"):
             continue
-        keyboard_passthrough.append(code)
+        bindings = parse_bindings_section(config[name], skip)
+        if match.strip():
+            device_bindings.append((match.strip().lower(), bindings))
+        else:
+            default_bindings = bindings
+    return default_bindings, device_bindings
 
-    keyboard_virtual = uinput.Device([(ecodes.EV_KEY, code) for code in keyboard_passthrough])
-    mouse_virtual = uinput.Device([
-        (ecodes.EV_KEY, ecodes.BTN_LEFT),
-        (ecodes.EV_KEY, ecodes.BTN_RIGHT),
-        (ecodes.EV_KEY, ecodes.BTN_MIDDLE),
-        (ecodes.EV_REL, ecodes.REL_X),
-        (ecodes.EV_REL, ecodes.REL_Y)
-    ])
+def device_matches(dev):
+    """True for devices we should grab: keyboards by name, excluding our own virtual devices."""
+    name = dev.name.lower()
+    if dev.name.startswith(VIRTUAL_DEVICE_PREFIX):
+        return False
+    if any(pattern in name or pattern in dev.path for pattern in DEVICE_EXCLUDE):
+        return False
+    if ecodes.EV_KEY not in dev.capabilities():
+        return False
+    return any(pattern in name for pattern in DEVICE_MATCH)
 
-    print("Listening. Intercepting only defined keypad keys.")
 
-    try:
-        for event in src.read_loop():
-            if event.type == ecodes.EV_REL:
-                mouse_virtual.emit((event.type, event.code), event.value)
-                continue
+# --- inotify (via libc) for /dev/input hot-plug ---
+IN_ATTRIB = 0x00000004
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct("iIII") # wd, mask, cookie, len (name follows)
 
-            if event.type != ecodes.EV_KEY:
-                continue
 
-            key_event = evdev.categorize(event)
-            code = key_event.scancode
+class InputDirWatcher:
+    """Reports event* nodes appearing in or vanishing from /dev/input via inotify."""
+
+    def __init__(self, path="/dev/input"):
+        self.path = path
+        self.fd = -1
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            if libc.inotify_add_watch(fd, path.encode(), IN_CREATE | IN_ATTRIB | IN_DELETE) < 0:
+                os.close(fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch({path}) failed")
+            self.fd = fd
+        except Exception as e:
+            print(f"Warning: inotify unavailable ({e}), falling back to periodic rescans.")
+
+    def read(self):
+        """Returns a list of (mask, device_path) for the pending notifications."""
+        changes = []
+        try:
+            data = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return changes
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+            if name.startswith("event"):
+                changes.append((mask, os.path.join(self.path, name)))
+        return changes
 
-            if code in INTERCEPT:
-                if key_event.keystate == key_event.key_down:
-                    publish_message(MQTT_TOPIC, INTERCEPT[code])
-                continue  # Block intercepted keys
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
 
-            # Route normal events
-            name = ecodes.keys.get(code, "")
-            if isinstance(name, tuple):
-                name = name[0]
-            if isinstance(name, str) and name.startswith("BTN_"):
-                mouse_virtual.emit((ecodes.EV_KEY, code), key_event.keystate)
-            else:
-                keyboard_virtual.emit((ecodes.EV_KEY, code), key_event.keystate)
 
-    finally:
-        print("Cleaning up input device grab and virtual devices.")
+class DeviceManager:
+    """Grabs every matching input device and serves them all from one selector (epoll) loop.
+
+    Devices are added and released as they are plugged and unplugged, each with its
+    own PassthroughEngine and intercept map. With autoscan=False nothing is
+    discovered from /dev/input; devices are only those passed to add_device()
+    (used by benchmarks/input_path.py).
+    """
+
+    RESCAN_INTERVAL = 2.0 # Seconds; used for retries and when inotify is unavailable
+
+    def __init__(self, on_command, forward_latency, autoscan=True):
+        self.on_command = on_command
+        self.forward_latency = forward_latency
+        self.autoscan = autoscan
+        self.running = False
+        self.default_bindings, self.device_bindings = load_binding_sets()
+        self.selector = selectors.DefaultSelector()
+        self.devices = {} # path -> (InputDevice, PassthroughEngine)
+        self.pending = set() # Paths created but not yet openable (udev still setting permissions)
+        self.watcher = InputDirWatcher() if autoscan else None
+        if self.watcher and self.watcher.fd >= 0:
+            self.selector.register(self.watcher.fd, selectors.EVENT_READ, None)
+
+    def bindings_for(self, dev):
+        name = dev.name.lower()
+        for match, bindings in self.device_bindings:
+            if match in name or match in dev.path:
+                return bindings
+        return self.default_bindings
+
+    def scan(self):
+        for path in evdev.list_devices():
+            self.try_add(path)
+
+    def try_add(self, path):
+        if path in self.devices:
+            return
         try:
-            src.ungrab()
-            print("Ungrabbed physical input device.")
-        except Exception as e:
-            print(f"Failed to ungrab: {e}")
+            dev = evdev.InputDevice(path)
+        except OSError as e:
+            if e.errno in (errno.EACCES, errno.EPERM, errno.ENOENT):
+                self.pending.add(path)
+            return
+        self.pending.discard(path)
+        if not device_matches(dev):
+            dev.close()
+            return
+        self.add_device(dev)
 
+    def add_device(self, dev, virtual=None):
+        """Grabs an open device and starts forwarding it; returns its PassthroughEngine (None on failure)."""
         try:
-            del keyboard_virtual
-            #keyboard_virtual.close()
+            dev.grab()
+            engine = PassthroughEngine(dev, self.bindings_for(dev), self.on_command, self.forward_latency, virtual)
         except Exception as e:
-            print(f"Error closing keyboard virtual device: {e}")
+            print(f"Failed to take over {dev.path} ({dev.name}): {e}")
+            dev.close()
+            return None
+        self.devices[dev.path] = (dev, engine)
+        self.selector.register(dev.fd, selectors.EVENT_READ, dev.path)
+        print(f"Using input: {dev.path} ({dev.name}), intercepting {len(engine.bindings.codes)} keys")
+        return engine
 
+    def remove(self, path):
+        entry = self.devices.pop(path, None)
+        if not entry:
+            return
+        dev, engine = entry
+        try:
+            self.selector.unregister(dev.fd)
+        except (KeyError, ValueError):
+            pass
         try:
-            del mouse_virtual
-            #mouse_virtual.close()
+            dev.ungrab()
+        except OSError:
+            pass # Already gone if it was unplugged
+        engine.close()
+        dev.close()
+        print(f"Released input: {path}")
+
+    def run(self, on_tick=None):
+        self.running = True
+        if self.autoscan:
+            self.scan()
+        if not self.devices:
+            print("No keyboard device found yet, waiting for one to be plugged in.")
+        next_rescan = time.monotonic() + self.RESCAN_INTERVAL
+        while self.running:
+            timeout = self.RESCAN_INTERVAL
+            # Wake up in time for pending long-presses
+            for _, engine in self.devices.values():
+                deadline = engine.bindings.next_deadline()
+                if deadline is not None:
+                    timeout = max(0.0, min(timeout, deadline - time.time()))
+            for key, _ in self.selector.select(timeout=timeout):
+                path = key.data
+                if path is None:
+                    for mask, changed in self.watcher.read():
+                        if mask & IN_DELETE:
+                            self.pending.discard(changed)
+                            self.remove(changed)
+                        else:
+                            self.try_add(changed)
+                    continue
+                # An earlier key of this batch (inotify, ENODEV) may have removed the device
+                entry = self.devices.get(path)
+                if entry is None or self.selector.get_map().get(key.fd) is not key:
+                    continue
+                dev, engine = entry
+                try:
+                    for event in dev.read():
+                        engine.handle(event)
+                except BlockingIOError:
+                    pass
+                except OSError as e:
+                    if e.errno == errno.ENODEV:
+                        self.remove(path)
+                    else:
+                        raise
+            for _, engine in list(self.devices.values()):
+                engine.bindings.poll()
+            now = time.monotonic()
+            if self.autoscan and now >= next_rescan:
+                next_rescan = now + self.RESCAN_INTERVAL
+                if self.watcher.fd < 0:
+                    self.scan()
+                else:
+                    for path in list(self.pending):
+                        self.try_add(path)
+            if on_tick:
+                on_tick()
+
+    def stop(self):
+        """Makes run() return within RESCAN_INTERVAL (called from another thread)."""
+        self.running = False
+
+    def close(self):
+        for path in list(self.devices):
+            self.remove(path)
+        if self.watcher:
+            self.watcher.close()
+        self.selector.close()
+
+# struct input_event: struct timeval (long, long), __u16 type, __u16 code, __s32 value
+INPUT_EVENT = struct.Struct("llHHi")
+
+
+class PassthroughEngine:
+    """Forwards a grabbed device's input frames to a uinput device mirroring its capabilities.
+
+    Events are packed into a frame buffer until the source's SYN_REPORT and the
+    whole frame is written with a single write(), so the virtual device emits
+    exactly the frames the hardware produced (EV_MSC scan codes, autorepeat
+    value=2 events and SYN framing included). Intercepted keys are removed from
+    the frame and handed to the device's BindingEngine instead. `virtual` replaces
+    the uinput device with any object that has an fd and close() (e.g. a pipe in tests).
+    """
+
+    def __init__(self, src, bindings, on_command, forward_latency=None, virtual=None):
+        self.src = src
+        self.bindings = BindingEngine(bindings, on_command, self.forward_key)
+        self.codes = self.bindings.codes
+        # EV_REP is filtered so the kernel doesn't generate a second set of repeats:
+        # the source's own value=2 events are forwarded instead.
+        self.virtual = virtual or evdev.UInput.from_device(
+            src, name=f"{VIRTUAL_DEVICE_PREFIX} ({src.name})",
+            filtered_types=(ecodes.EV_SYN, ecodes.EV_FF, ecodes.EV_REP))
+        self.fd = self.virtual.fd
+        self.frame = []
+        self.frame_has_payload = False # Frames holding only EV_MSC are not worth forwarding
+        self.dropping = False # After SYN_DROPPED, discard until the next SYN_REPORT
+        self.forward_latency = forward_latency or LatencyStats("key-to-forward")
+
+    def handle(self, event):
+        etype = event.type
+        if etype == ecodes.EV_SYN:
+            if event.code == ecodes.SYN_REPORT:
+                if self.dropping:
+                    self.dropping = False
+                elif self.frame_has_payload:
+                    self.frame.append(INPUT_EVENT.pack(event.sec, event.usec, etype, event.code, event.value))
+                    os.write(self.fd, b"".join(self.frame))
+                    # evdev timestamps are CLOCK_REALTIME, same as time.time()
+                    self.forward_latency.record((time.time() - event.sec - event.usec / 1e6) * 1000.0)
+                self.frame.clear()
+                self.frame_has_payload = False
+            elif event.code == ecodes.SYN_DROPPED:
+                self.frame.clear()
+                self.frame_has_payload = False
+                self.dropping = True
+            return
+
+        if etype == ecodes.EV_KEY and event.code in self.codes:
+            self.bindings.key_event(event.code, event.value, event.sec + event.usec / 1e6)
+            return # Block intercepted keys
+
+        self.frame.append(INPUT_EVENT.pack(event.sec, event.usec, etype, event.code, event.value))
+        if etype != ecodes.EV_MSC:
+            self.frame_has_payload = True
+
+    def forward_key(self, code, event_time):
+        """Types an intercepted key that turned out not to be bound (a chord member pressed alone)."""
+        sec, usec = int(event_time), int((event_time % 1) * 1e6)
+        os.write(self.fd, b"".join(INPUT_EVENT.pack(sec, usec, etype, ecode, value) for etype, ecode, value in (
+            (ecodes.EV_KEY, code, 1), (ecodes.EV_SYN, ecodes.SYN_REPORT, 0),
+            (ecodes.EV_KEY, code, 0), (ecodes.EV_SYN, ecodes.SYN_REPORT, 0))))
+
+    def close(self):
+        try:
+            self.virtual.close()
         except Exception as e:
-            print(f"Error closing mouse virtual device: {e}")
+            print(f"Error closing virtual device: {e}")
+
+
+def main():
+    if os.geteuid() != 0:
+        raise SystemExit("Must run as root.")
+
+    ensure_uinput_loaded()
+    transport = create_command_transport(COMMAND_TRANSPORT, MQTT_BROKER, MQTT_PORT, MQTT_TOPIC, COMMAND_SOCKET)
+    publisher = CommandPublisher(transport)
+    publisher.start()
+    forward_latency = LatencyStats("key-to-forward")
+    next_report = [time.monotonic() + LATENCY_REPORT_INTERVAL]
+
+    def report_latency():
+        if LATENCY_REPORT_INTERVAL and time.monotonic() >= next_report[0]:
+            print(forward_latency.summary())
+            print(publisher.publish_latency.summary())
+            next_report[0] = time.monotonic() + LATENCY_REPORT_INTERVAL
+
+    manager = DeviceManager(publisher.submit, forward_latency)
+    print("Listening. Intercepting only defined keypad keys.")
+
+    try:
+        manager.run(on_tick=report_latency)
+    finally:
+        print("Cleaning up input device grabs and virtual devices.")
+        print(forward_latency.summary())
+        print(publisher.publish_latency.summary())
+        publisher.stop()
+        manager.close()
 
 
 if __name__ == "__main__":
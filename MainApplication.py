@@ -1,40 +1,46 @@
 import sys
-import ollama
-import io
-import multiprocessing
 import time
+from StartupTimer import StartupTimer
+# Start the clock before the heavier imports below
+startup_timer = StartupTimer()
 from SettingsWindow import SettingsWindow
 from configparser import ConfigParser
 import os
+import math
 import threading
 import signal
 import uuid
-import glob
-from pydbus import SessionBus
-# --- GStreamer/GObject Imports ---
-try:
-    import gi
-    gi.require_version('Gst', '1.0')
-    gi.require_version('GstBase', '1.0')
-    from gi.repository import GLib, GObject, Gst
-    # Initialize GStreamer here (or ensure ScreenCastHandler does)
-    Gst.init(None)
-    print("GStreamer initialized successfully.")
-except ImportError:
-    print("ERROR: Failed to import GObject/GStreamer bindings.")
-    print("Please ensure PyGObject and GStreamer Python bindings are installed.")
-    # Optionally exit or disable capture functionality
-    sys.exit(1)
-# --- End GStreamer/GObject Imports ---
+import json
+from collections import deque
+# --- Heavy subsystems are imported lazily ---
+# ollama, gi/GStreamer (via ScreenCastHandler), PIL and multiprocessing are only
+# imported when first used, so the window appears without paying for them.
+# ---
 
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QTextEdit, QStatusBar,
                              QPushButton, QWidget, QVBoxLayout, QHBoxLayout, QDialog)
 from PyQt5.QtCore import pyqtSignal, QObject, pyqtSlot, QTimer
 import paho.mqtt.client as mqtt
-
-# --- Import the new handler ---
-from ScreenCastHandler import ScreenCastHandler
-# ---
+from CommandTransport import UnixSocketCommandServer
+from ChatRenderer import ChatRenderer, HistoryNavigator
+from HistoryStore import HistoryStore
+from CaptureStore import CaptureStore, DEFAULT_SLOTS as DEFAULT_CAPTURE_SLOTS, \
+    DEFAULT_MAX_BYTES as DEFAULT_CAPTURE_BYTES
+from OutboundQueue import (OutboundQueue, DEFAULT_MAX_MESSAGES as DEFAULT_OUTBOX_MESSAGES,
+                           DEFAULT_MAX_BYTES as DEFAULT_OUTBOX_BYTES)
+from JobDispatch import JobDispatcher, DEFAULT_LEASE, DEFAULT_MAX_ATTEMPTS
+from ImageIngest import EncodedImage, IngestScheduler, parse_ingest_payload, MAX_SOURCES as INGEST_MAX_SOURCES
+from Metrics import metrics, MetricsServer
+from TraceRecorder import tracer, DEFAULT_CAPACITY as DEFAULT_TRACE_EVENTS, DEFAULT_SECONDS as DEFAULT_TRACE_SECONDS
+from SamplingProfiler import profiler, DEFAULT_SECONDS as DEFAULT_PROFILE_SECONDS, DEFAULT_INTERVAL as DEFAULT_PROFILE_INTERVAL
+from FramePool import FramePool, encode_pil, DEFAULT_WORKERS as DEFAULT_FRAME_POOL_WORKERS
+from MemoryWatchdog import (MemoryWatchdog, rss_bytes, DEFAULT_INTERVAL as DEFAULT_MEMORY_INTERVAL,
+                            DEFAULT_BUDGET_MB as DEFAULT_MEMORY_BUDGET_MB, DEFAULT_TRACE_FRAMES as DEFAULT_MEMORY_FRAMES)
+from MqttChunking import (ChunkedPublisher, Reassembler, codec_from_name, is_publish_topic, CLASS_OUTPUT,
+                          CLASS_RESPONSE, CLASS_CHUNKED, CLASS_JOB, DEFAULT_QOS, DEFAULT_CHUNK_SIZE, DEFAULT_REASSEMBLY_TIMEOUT)
+from CommandProtocol import (Command, CommandError, parse_command, format_response, is_reply_topic,
+                             STATUS_ACCEPTED, STATUS_OK, STATUS_ERROR)
+startup_timer.mark("imports")
 
 # --- Constants ---
 SENDER_ID_MAIN = "[SauronEye-Main]"
@@ -42,10 +48,20 @@ SENDER_ID_INIT = "[SauronEye-Init]"
 SENDER_ID_ANALYSIS = "[SauronEye-Analysis]"
 SENDER_ID_USER = "[User]"
 SENDER_ID_CHAT_RESPONSE = "[LLM-Chat]"
+SENDER_ID_RECALL = "[SauronEye-Recall]"
+# Keypad commands that move through the chat view / history
+NAVIGATION_COMMANDS = ("scroll_up", "scroll_down", "scroll_left", "scroll_right",
+                       "page_up", "page_down", "home", "end", "clear", "search")
+TRACE_SIGNAL = signal.SIGUSR2   # kill -USR2 <pid> dumps the trace ring
+PROFILE_SIGNAL = signal.SIGUSR1 # kill -USR1 <pid> starts a profile_seconds sampling profile
+MAX_REQUEST_SECONDS = 300       # Longest profile or trace window a command can ask for
 
 class MainApplication(QMainWindow):
     status_update_signal = pyqtSignal(str)
     output_message_signal = pyqtSignal(str)
+    command_signal = pyqtSignal(object) # Command from any transport thread
+    mqtt_connected_signal = pyqtSignal()
+    stream_fragment_signal = pyqtSignal(str, str) # (stream_id, text) for streamed responses
 
     def __init__(self):
         super().__init__()
@@ -64,6 +80,12 @@ class MainApplication(QMainWindow):
 
         self.chat_display = QTextEdit(self)
         self.chat_display.setReadOnly(True)
+        try:
+            max_blocks = int(self.settings.get('chat_max_blocks', 2000))
+        except (ValueError, TypeError):
+            max_blocks = 2000
+        # Batches appends per frame and caps the document size
+        self.chat_renderer = ChatRenderer(self.chat_display, max_blocks=max_blocks, parent=self)
         self.chat_input = QTextEdit(self)
         self.chat_input.setFixedHeight(60)
         self.send_button = QPushButton("Send", self)
@@ -80,13 +102,37 @@ class MainApplication(QMainWindow):
 
         self.status_update_signal.connect(self.update_status_bar)
         self.output_message_signal.connect(self.display_output_message)
+        self.stream_fragment_signal.connect(self.chat_renderer.queue_fragment)
+        # Digests of our own output-topic publishes whose broker echo has not arrived yet (MQTT 3.1.1 only;
+        # v5 subscribes with no_local). One entry per publish, removed by the echo it stands for
+        self.recent_outgoing = deque(maxlen=256)
+        # Queued across threads, so commands always run on the main thread
+        self.command_signal.connect(self.handle_command)
+        self.mqtt_connected_signal.connect(self._check_startup_ready)
+        self.command_socket_server = None
+        self.ingest_scheduler = None # Started by start_ingest() if mqtt_ingest_topic is set
+        self.job_dispatcher = None   # Started by start_job_dispatcher() with analysis_mode = distributed
+        self.outbox = None           # Durable outbound queue, opened by start_outbox() if outbox_path is set
+        self.capture_store = None    # Ring of recent frames + results, opened by start_capture_store()
+        self.history_store = None    # Persistent chat/analysis history, opened by start_history()
+        self.history_navigator = None
+        self.recall_service = None   # Semantic recall over past analyses, started by start_recall()
+        self.metrics_server = None   # Local /metrics endpoint, started by start_metrics() if metrics_port is set
+        self.metrics_timer = None    # Publishes metric snapshots to metrics_topic
+        self.memory_watchdog = None  # RSS sampling and leak reports, started by start_memory_watchdog()
+        self.frame_pool = None       # Worker processes for frame encoding, started by start_frame_pool()
+        self.diff_baselines = {}     # source -> (frame, description, changes) of the last analysis, for diff_analysis
+        self.diff_lock = threading.Lock()
 
-        # --- Initialize ScreenCastHandler ---
-        self.screen_cast_handler = ScreenCastHandler(self)
-        self.screen_cast_handler.capture_successful.connect(self.on_capture_successful)
-        self.screen_cast_handler.capture_failed.connect(self.on_capture_failed)
+        # --- ScreenCastHandler is created on first capture (imports GStreamer) ---
+        self.screen_cast_handler = None
+        self.glib_loop_timer = None
+        self.pending_capture_requests = [] # Commands waiting for the capture in progress
+        self.capture_in_progress = False
         # ---
 
+        self._ollama_clients = {} # Cached ollama.Client per server URL
+
         self.mqtt_client = None
         self.is_mqtt_connected = False
         self.mqtt_timer = QTimer(self)
@@ -96,6 +142,74 @@ class MainApplication(QMainWindow):
 
         print("MainApplication __init__ finished.") # DEBUG
 
+    def validate_settings(self, settings=None):
+        """Returns a list of problems with the settings (empty if they are usable)."""
+        settings = self.settings if settings is None else settings
+        problems = []
+        if not settings.get('mqtt_broker', '').strip():
+            problems.append("MQTT broker is not set")
+        try:
+            port = int(settings.get('mqtt_port', ''))
+            if not 1 <= port <= 65535:
+                problems.append(f"MQTT port {port} is out of range")
+        except (ValueError, TypeError):
+            problems.append("MQTT port is not a number")
+        if not settings.get('ollama_server', '').strip():
+            problems.append("Ollama server is not set")
+        if not settings.get('ollama_model', '').strip():
+            problems.append("Ollama model is not set")
+        return problems
+
+    def auto_start_enabled(self):
+        return str(self.settings.get('auto_start', 'false')).strip().lower() in ('1', 'true', 'yes', 'on')
+
+    def launch(self):
+        """Starts directly if auto_start is set and settings validate, otherwise shows the settings dialog."""
+        if self.auto_start_enabled():
+            problems = self.validate_settings()
+            if not problems:
+                print("auto_start enabled and settings valid, skipping settings dialog.") # DEBUG
+                self.start_application()
+                return
+            print(f"auto_start enabled but settings are invalid: {'; '.join(problems)}") # DEBUG
+        self.show_settings_window()
+
+    def start_application(self):
+        """Connects MQTT and shows the main window with the current settings."""
+        self._update_attributes_from_settings()
+        self.start_outbox() # Before MQTT, so on_connect can replay what a previous run queued
+        self.start_capture_store()
+        self.start_history()
+        self.start_recall()
+        self.setup_mqtt() # Setup/Reconnect MQTT *after* settings are confirmed
+        self.start_command_socket()
+        self.start_ingest()
+        self.start_job_dispatcher()
+        self.start_metrics()
+        self.start_frame_pool()
+        self.start_memory_watchdog()
+
+        # Show the main window AFTER settings are accepted
+        print("Showing main application window...") # DEBUG
+        self.show() # Show the main QMainWindow
+        startup_timer.mark("window_shown")
+        self._check_startup_ready()
+
+        # Trigger initial check AFTER showing main window and setting up MQTT
+        # Use a short delay to ensure MQTT has a chance to connect
+        QTimer.singleShot(500, self.trigger_initial_check)
+        # Report whatever was reached if MQTT never comes up
+        QTimer.singleShot(10000, self._report_startup)
+
+    def _check_startup_ready(self):
+        """Marks startup as ready for capture once the window is shown and MQTT is connected."""
+        if startup_timer.has("window_shown") and startup_timer.has("mqtt_connected"):
+            startup_timer.mark("ready")
+            self._report_startup()
+
+    def _report_startup(self):
+        startup_timer.report(self.settings.get('startup_log', '').strip() or None)
+
     def show_settings_window(self):
         """Creates and executes the modal settings dialog."""
         print("--- show_settings_window called ---") # DEBUG
@@ -104,11 +218,14 @@ class MainApplication(QMainWindow):
             # Pass only parent and current settings
             settings_dialog = SettingsWindow(self, self.settings)
             print("SettingsWindow created.") # DEBUG
+            startup_timer.mark("settings_dialog")
 
             print("Calling SettingsWindow.exec_()...") # DEBUG
             # Execute modally
             result = settings_dialog.exec_()
             print(f"SettingsWindow.exec_() finished with result: {result}") # DEBUG
+            # Time spent waiting on the user is not startup cost
+            startup_timer.mark("user_in_dialog", idle=True)
 
             # Check if user clicked Save (Accepted)
             if result == QDialog.Accepted:
@@ -117,18 +234,9 @@ class MainApplication(QMainWindow):
                 new_settings = settings_dialog.updated_settings
                 if new_settings:
                     print("Applying updated settings...") # DEBUG
-                    self.settings = new_settings # Apply the retrieved settings
+                    self.settings.update(new_settings) # Apply the retrieved settings
                     self.save_settings()
-                    self._update_attributes_from_settings()
-                    self.setup_mqtt() # Setup/Reconnect MQTT *after* settings are confirmed
-
-                    # Show the main window AFTER settings are accepted
-                    print("Settings accepted, showing main application window...") # DEBUG
-                    self.show() # Show the main QMainWindow
-
-                    # Trigger initial check AFTER showing main window and setting up MQTT
-                    # Use a short delay to ensure MQTT has a chance to connect
-                    QTimer.singleShot(500, self.trigger_initial_check)
+                    self.start_application()
 
                 else:
                      print("WARNING: Settings dialog accepted but no updated_settings found.") # DEBUG
@@ -195,8 +303,11 @@ class MainApplication(QMainWindow):
             # Ensure the [Settings] section exists before assigning
             if 'Settings' not in self.config:
                 self.config.add_section('Settings')
-            # Update the [Settings] section (overwrites if exists)
-            self.config['Settings'] = self.settings
+            # Update the [Settings] section (overwrites if exists), leaving
+            # values that merely repeat [DEFAULT] to be inherited from it
+            defaults = self.config.defaults()
+            self.config['Settings'] = {key: value for key, value in self.settings.items()
+                                       if defaults.get(key) != value}
             with open(self.config_path, 'w') as configfile:
                 self.config.write(configfile)
             self.update_status(f"Settings saved to {self.config_path}")
@@ -207,6 +318,15 @@ class MainApplication(QMainWindow):
 
     # start_application method is effectively replaced by the logic within show_settings_window after QDialog.Accepted
 
+    def get_ollama_client(self):
+        """Returns a cached ollama.Client for the configured server, importing ollama on first use."""
+        client = self._ollama_clients.get(self.ollama_server)
+        if client is None:
+            import ollama
+            client = ollama.Client(host=self.ollama_server)
+            self._ollama_clients[self.ollama_server] = client
+        return client
+
     def send_initial_ollama_message(self):
         """Sends an initial availability message via Ollama."""
         if not self.ollama_model or not self.ollama_server:
@@ -215,7 +335,7 @@ class MainApplication(QMainWindow):
 
         self.update_status(f"Sending initial check to Ollama ({self.ollama_model})...")
         try:
-            client = ollama.Client(host=self.ollama_server)
+            client = self.get_ollama_client()
             # Simple prompt to confirm Ollama is working
             init_prompt = "You are SauronEye, an AI assistant integrated into a desktop application. Respond with a brief greeting confirming you are ready."
             messages = [{'role': 'user', 'content': init_prompt}]
@@ -228,25 +348,397 @@ class MainApplication(QMainWindow):
             self.update_status(f"Error during Ollama initial check: {e}")
             self.publish_output_message(SENDER_ID_INIT, f"Error contacting Ollama: {e}")
 
-    def publish_output_message(self, sender_id, message):
-        """Publishes a formatted message to the MQTT output topic."""
-        if self.mqtt_client and self.is_mqtt_connected:
-            full_message = f"{sender_id}: {message}"
+    def mqtt_publish(self, topic, payload, message_class, correlation_data=None):
+        """Publishes now if possible, otherwise appends to the durable outbound queue.
+
+        Returns True if the message was published or queued. While queued messages
+        are waiting, new ones queue behind them so the broker sees them in order.
+        Only messages the client could not take are queued: QoS >= 1 messages
+        published while the connection drops are kept and resent by paho itself.
+        Messages that can never be published (bad topic, oversized) are dropped.
+        """
+        if not is_publish_topic(topic):
+            self.update_status(f"Dropped MQTT message: invalid topic {topic!r}.")
+            return False
+        outbox = self.outbox
+        connected = self.mqtt_client and self.is_mqtt_connected
+        if outbox and (not connected or outbox.has_backlog()):
+            outbox.append(topic, payload, message_class, correlation_data)
+            if connected:
+                self.start_outbox_replay() # e.g. an earlier replay was cut short
+            return True
+        if not connected:
+            return False
+        try:
+            self._publish_now(topic, payload, message_class, correlation_data)
+            return True
+        except ConnectionError as e:
+            # QoS 0 message paho dropped because the connection just went away
+            if outbox:
+                outbox.append(topic, payload, message_class, correlation_data)
+                return True
+            self.update_status(f"Error publishing MQTT message to {topic}: {e}")
+            return False
+        except Exception as e:
+            # ValueError/TypeError from paho (e.g. payload too large) or a client error: a retry would fail again
+            self.update_status(f"Dropped MQTT message to {topic}: {e}")
+            return False
+
+    def _publish_now(self, topic, payload, message_class, correlation_data=None, min_qos=0):
+        start = time.perf_counter()
+        properties = None
+        try:
+            with tracer.span("mqtt.publish", topic=topic, message_class=message_class, size=len(payload)):
+                if self.mqtt_protocol == mqtt.MQTTv5 and correlation_data is not None:
+                    from paho.mqtt.properties import Properties
+                    from paho.mqtt.packettypes import PacketTypes
+                    properties = Properties(PacketTypes.PUBLISH)
+                    properties.CorrelationData = correlation_data
+                return self.chunked_publisher.publish(self.mqtt_client, topic, payload, message_class,
+                                                      properties=properties, min_qos=min_qos)
+        except Exception:
+            metrics.inc("mqtt_publish_errors_total", message_class=message_class)
+            raise
+        finally:
+            metrics.observe("mqtt_publish_seconds", time.perf_counter() - start, message_class=message_class)
+
+    def start_metrics(self):
+        """Serves /metrics on metrics_port and publishes snapshots to metrics_topic, when configured."""
+        self.register_metric_gauges()
+        try:
+            port = int(self.settings.get('metrics_port', 0) or 0)
+            interval = float(self.settings.get('metrics_interval', 60))
+        except (ValueError, TypeError):
+            port, interval = 0, 60.0
+        if port > 0 and not self.metrics_server:
+            bind = self.settings.get('metrics_bind', '127.0.0.1').strip() or '127.0.0.1'
             try:
-                self.mqtt_client.publish(self.mqtt_output_topic, full_message)
-                # Also display locally via signal for safety
-                self.output_message_signal.emit(full_message)
+                self.metrics_server = MetricsServer(metrics, port, bind).start()
+                print(f"Serving metrics on http://{bind}:{port}/metrics") # DEBUG
+            except OSError as e:
+                self.update_status(f"Cannot serve metrics on {bind}:{port}: {e}")
+        if self.metrics_topic and interval > 0 and not self.metrics_timer:
+            self.metrics_timer = QTimer(self)
+            self.metrics_timer.timeout.connect(self.publish_metrics)
+            self.metrics_timer.start(int(interval * 1000))
+
+    def start_memory_watchdog(self):
+        """Samples RSS every memory_interval s; reports allocation growth and sheds caches above memory_ceiling_mb."""
+        if self.memory_watchdog:
+            return
+        try:
+            interval = float(self.settings.get('memory_interval', DEFAULT_MEMORY_INTERVAL))
+            budget_mb = float(self.settings.get('memory_budget_mb', DEFAULT_MEMORY_BUDGET_MB))
+            ceiling_mb = float(self.settings.get('memory_ceiling_mb', 0) or 0)
+            frames = int(self.settings.get('memory_trace_frames', DEFAULT_MEMORY_FRAMES))
+        except (ValueError, TypeError):
+            interval, budget_mb, ceiling_mb, frames = DEFAULT_MEMORY_INTERVAL, DEFAULT_MEMORY_BUDGET_MB, 0, DEFAULT_MEMORY_FRAMES
+        if interval <= 0:
+            return
+        self.memory_topic = self.settings.get('memory_topic', '').strip()
+        trace_always = str(self.settings.get('memory_trace_always', 'false')).strip().lower() in ('1', 'true', 'yes', 'on')
+        self.memory_watchdog = MemoryWatchdog(self.on_memory_report, interval, budget_mb, ceiling_mb, frames, trace_always)
+        self.memory_watchdog.add_shedder("ollama_clients", self._ollama_clients.clear)
+        if self.recall_service:
+            self.memory_watchdog.add_shedder("recall_index", self.recall_service.index.release)
+        if self.frame_pool:
+            self.memory_watchdog.add_shedder("frame_pool", self.frame_pool.trim)
+        self.memory_watchdog.add_shedder("diff_baselines", self.diff_baselines.clear)
+        self.memory_watchdog.start()
+
+    def start_frame_pool(self):
+        """Starts frame_pool_workers processes that encode frames passed through shared memory (0 = in-process)."""
+        if self.frame_pool:
+            return
+        try:
+            workers = int(self.settings.get('frame_pool_workers', DEFAULT_FRAME_POOL_WORKERS))
+        except (ValueError, TypeError):
+            workers = DEFAULT_FRAME_POOL_WORKERS
+        if workers <= 0:
+            return
+        try:
+            self.frame_pool = FramePool(workers).start()
+            print(f"Frame pool started with {workers} worker(s).") # DEBUG
+        except (OSError, ValueError) as e:
+            self.update_status(f"Frame pool unavailable, encoding in-process: {e}")
+
+    def on_memory_report(self, report):
+        """Logs a watchdog report and publishes it to memory_topic. Runs in the watchdog thread."""
+        mb = lambda value: f"{value / 1048576:.1f} MB"
+        if report['kind'] == "tracing":
+            message = (f"Memory grew by {mb(report['growth'])} to {mb(report['rss'])}; "
+                       f"tracing allocations for {report['interval']:g} s.")
+        elif report['kind'] == "shed":
+            message = (f"Memory above ceiling ({mb(report['rss_before'])} > {mb(report['ceiling'])}): "
+                       f"shed {', '.join(report['shed']) or 'nothing'}, now {mb(report['rss'])}.")
+        else:
+            message = f"Memory grew by {mb(report['growth'])} to {mb(report['rss'])}."
+            for site in report['sites']:
+                print(f"  +{mb(site['size_diff'])} ({site['count_diff']:+d} blocks) at {' <- '.join(site['traceback'])}")
+        self.update_status(message)
+        metrics.inc("memory_reports_total", kind=report['kind'])
+        if self.memory_topic:
+            self.mqtt_publish(self.memory_topic, json.dumps(dict(report, timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'))),
+                              CLASS_OUTPUT)
+
+    def register_metric_gauges(self):
+        """Exposes the queue and dispatcher counters kept by other components, read at scrape time."""
+        metrics.gauge("mqtt_connected", lambda: int(bool(self.is_mqtt_connected)), "1 while connected to the broker.")
+        metrics.gauge("outbox_depth", lambda: self.outbox.depth if self.outbox else None,
+                      "Messages waiting in the outbound queue.")
+        metrics.gauge("outbox_messages_total", lambda: {key: value for key, value in self.outbox.metrics().items()
+                                                        if key in ('queued', 'replayed', 'dropped')}
+                      if self.outbox else None, "Outbound queue messages by event.", label="event", kind="counter")
+        metrics.gauge("ingest_frames_total", lambda: dict(self.ingest_scheduler.stats) if self.ingest_scheduler else None,
+                      "Ingested frames by result.", label="result", kind="counter")
+        metrics.gauge("analysis_jobs_total", lambda: dict(self.job_dispatcher.stats) if self.job_dispatcher else None,
+                      "Distributed analysis jobs by event.", label="event", kind="counter")
+        metrics.gauge("process_resident_bytes", rss_bytes, "Resident set size of the process.")
+        metrics.gauge("analysis_jobs_in_flight", lambda: len(self.job_dispatcher.jobs) if self.job_dispatcher else None,
+                      "Distributed analysis jobs waiting for a worker's result.")
+
+    def publish_metrics(self):
+        """Publishes a metrics snapshot to metrics_topic. Skipped while disconnected (not queued: it is a live view)."""
+        if not (self.mqtt_client and self.is_mqtt_connected):
+            return
+        try:
+            self._publish_now(self.metrics_topic, json.dumps(metrics.snapshot()), CLASS_OUTPUT)
+        except Exception as e:
+            print(f"Error publishing metrics to {self.metrics_topic}: {e}")
+
+    def start_outbox(self):
+        """Opens the on-disk outbound queue (outbox_path) that keeps messages across broker outages."""
+        path = self.settings.get('outbox_path', '').strip()
+        if not path or self.outbox:
+            return
+        try:
+            max_messages = int(self.settings.get('outbox_max_messages', DEFAULT_OUTBOX_MESSAGES))
+            max_bytes = int(self.settings.get('outbox_max_bytes', DEFAULT_OUTBOX_BYTES))
+        except (ValueError, TypeError):
+            max_messages, max_bytes = DEFAULT_OUTBOX_MESSAGES, DEFAULT_OUTBOX_BYTES
+        try:
+            self.outbox = OutboundQueue(path, max_messages, max_bytes)
+        except Exception as e:
+            self.update_status(f"Cannot open outbound queue {path}: {e}")
+
+    def start_capture_store(self):
+        """Opens the ring-buffer capture store (capture_store_path) that keeps recent frames and results."""
+        path = self.settings.get('capture_store_path', '').strip()
+        if not path or self.capture_store:
+            return
+        try:
+            slots = int(self.settings.get('capture_store_slots', DEFAULT_CAPTURE_SLOTS))
+            max_bytes = int(self.settings.get('capture_store_max_bytes', DEFAULT_CAPTURE_BYTES))
+        except (ValueError, TypeError):
+            slots, max_bytes = DEFAULT_CAPTURE_SLOTS, DEFAULT_CAPTURE_BYTES
+        try:
+            self.capture_store = CaptureStore(path, slots, max_bytes)
+        except Exception as e:
+            self.update_status(f"Cannot open capture store {path}: {e}")
+
+    def start_history(self):
+        """Opens the persistent history (history_path) and shows its newest page."""
+        path = self.settings.get('history_path', '').strip()
+        if not path or self.history_store:
+            return
+        try:
+            max_entries = int(self.settings.get('history_max_entries', 0))
+            page_size = int(self.settings.get('history_page_size', 50))
+        except (ValueError, TypeError):
+            max_entries, page_size = 0, 50
+        try:
+            self.history_store = HistoryStore(path, max_entries)
+        except Exception as e:
+            self.update_status(f"Cannot open history {path}: {e}")
+            return
+        self.history_navigator = HistoryNavigator(self.chat_renderer, self.history_store, page_size, page_size * 3)
+        self.history_navigator.end()
+
+    def start_recall(self):
+        """Embeds analysis results into the recall index (recall_model, recall_index_path) for the recall command."""
+        model = self.settings.get('recall_model', '').strip()
+        path = self.settings.get('recall_index_path', '').strip()
+        if not model or not path or self.recall_service:
+            return
+        try:
+            # numpy is only needed with recall enabled
+            from RecallIndex import RecallIndex, RecallService
+            top_k = int(self.settings.get('recall_top_k', 5))
+            index = RecallIndex(path)
+            self.recall_service = RecallService(index, self.get_ollama_client, model, top_k)
+            print(f"Recall index {path}: {len(index)} entries") # DEBUG
+        except Exception as e:
+            self.update_status(f"Recall unavailable: {e}")
+
+    def index_for_recall(self, result, request, prompt=None, capture_hash=None):
+        if self.recall_service and result:
+            self.recall_service.add(result, request_id=request.request_id, source=request.source, prompt=prompt,
+                                    capture=capture_hash.hex() if capture_hash else None)
+
+    def recall(self, request):
+        """Finds past analyses semantically similar to request.prompt and shows/publishes them."""
+        if not self.recall_service:
+            self.publish_output_message(SENDER_ID_RECALL, "Recall is not enabled (set recall_model).", request)
+            return
+        def on_results(results, error):
+            if error is not None:
+                self.publish_output_message(SENDER_ID_RECALL, f"Recall failed: {error}", request)
+                return
+            if not results:
+                self.publish_output_message(SENDER_ID_RECALL, f"Nothing recalled for '{request.prompt}'.", request)
+                return
+            lines = [f"Closest past analyses for '{request.prompt}':"]
+            for score, meta in results:
+                when = time.strftime('%Y-%m-%d %H:%M', time.localtime(meta.get('created', 0)))
+                snippet = " ".join(meta.get('text', '').split())[:160]
+                origin = [f"source {meta.get('source') or '?'}", f"request {meta.get('request_id') or '?'}"]
+                if meta.get('capture'):
+                    origin.append(f"capture {meta['capture']}")
+                lines.append(f"  {when} ({score:.2f}) [{', '.join(origin)}] {snippet}")
+            self.publish_output_message(SENDER_ID_RECALL, "\n".join(lines), request)
+        k = request.extra.get('k')
+        self.recall_service.recall(request.prompt, on_results, k if isinstance(k, int) and k > 0 else None)
+
+    def dump_trace(self, request=None):
+        """Writes the last trace_seconds (or request.prompt / "seconds") of spans to trace_dir as Chrome trace JSON."""
+        seconds = self.request_seconds(request, self.trace_seconds)
+        if seconds is None:
+            return
+        path = os.path.join(self.trace_dir, f"sauroneye-trace-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        def write():
+            try:
+                count = tracer.dump(path, seconds if seconds > 0 else None)
+            except Exception as e:
+                self.update_status(f"Cannot write trace {path}: {e}")
+                self.publish_response(request, SENDER_ID_MAIN, f"Cannot write trace: {e}", STATUS_ERROR)
+                return
+            self.update_status(f"Trace of the last {seconds:g} s written to {path} ({count} events).")
+            self.publish_response(request, SENDER_ID_MAIN, os.path.abspath(path), STATUS_OK)
+        # Serialising a full ring takes a moment; keep it off the Qt thread
+        threading.Thread(target=write, name="TraceDump", daemon=True).start()
+
+    def request_seconds(self, request, default):
+        """Reads a duration from request "seconds" (or the prompt); answers the request and returns None if invalid.
+
+        Durations are capped at MAX_REQUEST_SECONDS; NaN and infinity are rejected.
+        """
+        value = request.extra.get('seconds', request.prompt) if request is not None else None
+        if value in (None, ""):
+            value = default
+        try:
+            seconds = float(value)
+        except (TypeError, ValueError):
+            seconds = math.nan
+        if not math.isfinite(seconds):
+            self.publish_response(request, SENDER_ID_MAIN, f"Invalid duration '{value}'.", STATUS_ERROR)
+            return None
+        return min(seconds, MAX_REQUEST_SECONDS)
+
+    def start_profile(self, request=None):
+        """Samples all threads' stacks for profile_seconds (or the request's "seconds") and announces the folded file."""
+        seconds = self.request_seconds(request, self.profile_seconds)
+        if seconds is None:
+            return
+        if seconds <= 0:
+            self.publish_response(request, SENDER_ID_MAIN, "Profile length must be positive.", STATUS_ERROR)
+            return
+        path = os.path.join(self.profile_dir, f"sauroneye-profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        def on_done(path, summary, error):
+            if error is not None:
+                self.update_status(f"Profiling failed: {error}")
+                self.publish_response(request, SENDER_ID_MAIN, f"Profiling failed: {error}", STATUS_ERROR)
+                return
+            hottest = ", ".join(f"{name} {share:.0%}" for name, share in summary['hottest']) or "idle"
+            self.update_status(f"Profile written to {path}.")
+            self.publish_output_message(SENDER_ID_MAIN,
+                f"Profile of {summary['seconds']:g} s ({summary['samples']} samples, sampler {summary['sampler_cpu_ms']:g} ms CPU) "
+                f"written to {os.path.abspath(path)}. Busiest: {hottest}", request)
+        if not profiler.start(seconds, path, on_done, self.profile_interval):
+            self.publish_response(request, SENDER_ID_MAIN, "A profile is already running.", STATUS_ERROR)
+            return
+        self.update_status(f"Profiling all threads for {seconds:g} s...")
+        self.publish_response(request, SENDER_ID_MAIN, f"Profiling for {seconds:g} s.", STATUS_ACCEPTED)
+
+    def record_history(self, message):
+        if self.history_store:
+            try:
+                self.history_store.add(message)
             except Exception as e:
-                self.update_status(f"Error publishing MQTT message: {e}")
+                print(f"Error writing history: {e}")
+
+    def start_outbox_replay(self):
+        if self.outbox and self.outbox.has_backlog():
+            threading.Thread(target=self._replay_outbox, name="OutboxReplay", daemon=True).start()
+
+    def _replay_outbox(self):
+        # QoS >= 1 so a batch is only deleted once the broker has it
+        count = self.outbox.replay(lambda topic, payload, message_class, correlation_data: self._publish_now(
+            topic, payload, message_class, correlation_data, min_qos=1))
+        if count:
+            metrics = self.outbox.metrics()
+            self.update_status(f"Delivered {count} queued message(s) in {metrics['last_replay_ms']:.0f} ms "
+                               f"({metrics['depth']} still queued).")
+
+    def publish_response(self, request, sender_id, text, status=STATUS_OK):
+        """Sends a JSON response to the request's response topic (no-op for requests without one)."""
+        if not request or not request.wants_reply:
+            return False
+        payload = format_response(request, sender_id, text, status)
+        if not self.mqtt_publish(request.response_topic, payload, CLASS_RESPONSE, request.correlation_data):
+            self.update_status(f"Cannot answer request {request.request_id}: MQTT not connected.")
+            return False
+        return True
+
+    def publish_output_message(self, sender_id, message, request=None, display=True):
+        """Publishes a formatted message to the MQTT output topic.
+
+        Results for a request with a response topic go only to that topic (and the
+        local display), so concurrent clients don't see each other's answers.
+        display=False skips the local display (e.g. when it was already streamed).
+        While disconnected, messages wait in the outbound queue (if enabled).
+        """
+        if request is not None and request.wants_reply:
+            self.publish_response(request, sender_id, message)
+            if display:
+                self.output_message_signal.emit(f"{sender_id} [{request.request_id}]: {message}")
+            else:
+                self.record_history(f"{sender_id} [{request.request_id}]: {message}")
+            return
+        full_message = f"{sender_id}: {message}"
+        if not display:
+            self.record_history(full_message) # Shown already (streamed); displayed messages are recorded on display
+        payload = full_message.encode()
+        echo = self.mqtt_protocol != mqtt.MQTTv5
+        if echo:
+            self.recent_outgoing.append(hash(payload))
+        if self.mqtt_publish(self.mqtt_output_topic, payload, CLASS_OUTPUT):
+            # Display locally; our own echo from the broker is suppressed
+            if display:
+                self.output_message_signal.emit(full_message)
         else:
+            if echo:
+                self._take_echo(payload) # Nothing was published, so no echo will come
             self.update_status("Cannot publish MQTT message: Not connected.")
             # Display locally even if not connected
-            self.output_message_signal.emit(f"{sender_id} (MQTT disconnected): {message}")
+            if display:
+                self.output_message_signal.emit(f"{sender_id} (MQTT disconnected): {message}")
+
+    def _take_echo(self, payload):
+        """Removes one pending echo of payload; True if there was one.
+
+        Each publish suppresses exactly one echo, so identical messages from other clients are still shown.
+        """
+        try:
+            self.recent_outgoing.remove(hash(payload))
+            return True
+        except ValueError:
+            return False
 
     @pyqtSlot(str)
     def display_output_message(self, message):
-        if hasattr(self, 'chat_display'):
-            self.chat_display.append(message)
+        self.record_history(message)
+        if hasattr(self, 'chat_renderer'):
+            self.chat_renderer.queue_message(message)
         else:
             print(f"Debug: chat_display widget not found. Message: {message}")
 
@@ -257,25 +749,52 @@ class MainApplication(QMainWindow):
             return
         self.chat_input.clear()
         self.publish_output_message(SENDER_ID_USER, user_message)
+        if user_message.startswith("/recall "):
+            self.recall(Command("recall", prompt=user_message[len("/recall "):].strip(), source="local"))
+            return
+        if user_message.split()[0] in ("/trace", "/profile"):
+            command = user_message.split()[0][1:]
+            handler = self.dump_trace if command == "trace" else self.start_profile
+            handler(Command(command, prompt=user_message[len(command) + 1:].strip() or None, source="local"))
+            return
         threading.Thread(target=self.send_chat_message_to_ollama, args=(user_message,), daemon=True).start()
 
-    def send_chat_message_to_ollama(self, user_message):
-        if not self.ollama_model or not self.ollama_server:
+    def send_chat_message_to_ollama(self, user_message, request=None):
+        model = (request.model if request else None) or self.ollama_model
+        if not model or not self.ollama_server:
             self.update_status("Ollama not configured for chat.")
             self.publish_output_message(SENDER_ID_CHAT_RESPONSE, "Error: Ollama not configured.")
+            self.publish_response(request, SENDER_ID_CHAT_RESPONSE, "Ollama not configured.", STATUS_ERROR)
             return
 
-        self.update_status(f"Sending chat message to Ollama ({self.ollama_model})...")
+        self.update_status(f"Sending chat message to Ollama ({model})...")
         try:
-            client = ollama.Client(host=self.ollama_server)
+            client = self.get_ollama_client()
             messages = [{'role': 'user', 'content': user_message}]
-            response = client.chat(model=self.ollama_model, messages=messages)
-            response_text = response['message']['content'].strip()
+            # Stream tokens into the chat view as they arrive; MQTT gets the full text at the end
+            stream_id = uuid.uuid4().hex
+            label = f"{SENDER_ID_CHAT_RESPONSE} [{request.request_id}]: " if request and request.wants_reply \
+                else f"{SENDER_ID_CHAT_RESPONSE}: "
+            self.stream_fragment_signal.emit(stream_id, label)
+            parts = []
+            start = time.perf_counter()
+            with tracer.span("ollama.chat_stream", request.request_id if request else stream_id, model=model):
+                for chunk in client.chat(model=model, messages=messages, stream=True):
+                    piece = chunk['message']['content']
+                    if piece:
+                        if not parts:
+                            metrics.observe("ollama_ttft_seconds", time.perf_counter() - start, kind="chat")
+                            tracer.instant("ollama.first_token")
+                        parts.append(piece)
+                        self.stream_fragment_signal.emit(stream_id, piece)
+            metrics.observe("ollama_generation_seconds", time.perf_counter() - start, kind="chat")
+            response_text = "".join(parts).strip()
             self.update_status("Ollama chat response received.")
-            self.publish_output_message(SENDER_ID_CHAT_RESPONSE, response_text)
+            self.publish_output_message(SENDER_ID_CHAT_RESPONSE, response_text, request, display=False)
         except Exception as e:
             self.update_status(f"Error during Ollama chat: {e}")
             self.publish_output_message(SENDER_ID_CHAT_RESPONSE, f"Error processing chat: {e}")
+            self.publish_response(request, SENDER_ID_CHAT_RESPONSE, f"Error processing chat: {e}", STATUS_ERROR)
 
     def _update_attributes_from_settings(self):
         self.mqtt_broker = self.settings.get('mqtt_broker', "localhost")
@@ -286,9 +805,52 @@ class MainApplication(QMainWindow):
             self.mqtt_port = 1883 # Default if conversion fails
         self.mqtt_output_topic = self.settings.get('mqtt_output_topic', "ai_assistant/output")
         self.mqtt_keypad_topic = self.settings.get('mqtt_keypad_topic', "ai_assistant/keypad")
+        self.mqtt_ingest_topic = self.settings.get('mqtt_ingest_topic', "ai_assistant/ingest").strip().rstrip('/')
+        # "distributed": analysis runs on AnalysisWorker processes instead of in this one
+        self.analysis_mode = self.settings.get('analysis_mode', 'local').strip().lower()
+        self.analysis_job_topic = self.settings.get('analysis_job_topic', "ai_assistant/jobs").strip().rstrip('/')
+        # Never accepted as a request's response topic: a reply there would be read as a command, frame or job
+        self.reserved_topics = (self.mqtt_keypad_topic, self.mqtt_output_topic, self.mqtt_ingest_topic,
+                                self.analysis_job_topic)
+        # MQTT v5 adds response topics/correlation data; "3.1.1" for older brokers
+        protocol = str(self.settings.get('mqtt_protocol', '5')).strip()
+        self.mqtt_protocol = mqtt.MQTTv311 if protocol in ('3', '3.1.1', '311') else mqtt.MQTTv5
+        # Large payloads are compressed and split into chunks (see MqttChunking)
+        qos = {}
+        for message_class in (CLASS_OUTPUT, CLASS_RESPONSE, CLASS_CHUNKED, CLASS_JOB):
+            try:
+                qos[message_class] = min(2, max(0, int(self.settings.get(f'mqtt_qos_{message_class}', DEFAULT_QOS[message_class]))))
+            except (ValueError, TypeError):
+                qos[message_class] = DEFAULT_QOS[message_class]
+        try:
+            chunk_size = int(self.settings.get('mqtt_chunk_size', DEFAULT_CHUNK_SIZE))
+        except (ValueError, TypeError):
+            chunk_size = DEFAULT_CHUNK_SIZE
+        try:
+            reassembly_timeout = float(self.settings.get('mqtt_reassembly_timeout', DEFAULT_REASSEMBLY_TIMEOUT))
+        except (ValueError, TypeError):
+            reassembly_timeout = DEFAULT_REASSEMBLY_TIMEOUT
+        self.chunked_publisher = ChunkedPublisher(chunk_size, codec_from_name(self.settings.get('mqtt_compression', 'zlib')),
+                                                  qos=qos)
+        self.reassembler = Reassembler(reassembly_timeout)
         self.ollama_model = self.settings.get('ollama_model', '') # Use empty string default
         self.ollama_server = self.settings.get('ollama_server', '') # Use empty string default
         self.ollama_prompt = self.settings.get('ollama_prompt', 'Describe this image.')
+        self.metrics_topic = self.settings.get('metrics_topic', '').strip()
+        try:
+            trace_events = int(self.settings.get('trace_buffer_events', DEFAULT_TRACE_EVENTS))
+            self.trace_seconds = float(self.settings.get('trace_seconds', DEFAULT_TRACE_SECONDS))
+        except (ValueError, TypeError):
+            trace_events, self.trace_seconds = DEFAULT_TRACE_EVENTS, DEFAULT_TRACE_SECONDS
+        self.trace_dir = self.settings.get('trace_dir', 'traces').strip() or '.'
+        try:
+            self.profile_seconds = float(self.settings.get('profile_seconds', DEFAULT_PROFILE_SECONDS))
+            self.profile_interval = float(self.settings.get('profile_interval_ms', DEFAULT_PROFILE_INTERVAL * 1000)) / 1000.0
+        except (ValueError, TypeError):
+            self.profile_seconds, self.profile_interval = DEFAULT_PROFILE_SECONDS, DEFAULT_PROFILE_INTERVAL
+        self.profile_dir = self.settings.get('profile_dir', 'profiles').strip() or '.'
+        tracer.configure(capacity=max(1024, trace_events),
+                         enabled=str(self.settings.get('trace_enabled', 'true')).strip().lower() in ('1', 'true', 'yes', 'on'))
         print("--- Attributes updated from settings ---") # DEBUG
         print(f"  MQTT Broker: {self.mqtt_broker}")      # DEBUG
         print(f"  MQTT Port: {self.mqtt_port}")          # DEBUG
@@ -308,10 +870,11 @@ class MainApplication(QMainWindow):
                 print(f"Error disconnecting previous MQTT client: {e}")
         self.client_id = f"main_app_{os.getpid()}_{uuid.uuid4()}" # More unique client ID
         try:
-            self.mqtt_client = mqtt.Client(CallbackAPIVersion.VERSION2, client_id=self.client_id)
+            self.mqtt_client = mqtt.Client(CallbackAPIVersion.VERSION2, client_id=self.client_id,
+                                           protocol=self.mqtt_protocol)
             print("Using Paho MQTT Callback API V2") # DEBUG
         except AttributeError:
-            self.mqtt_client = mqtt.Client(client_id=self.client_id)
+            self.mqtt_client = mqtt.Client(client_id=self.client_id, protocol=self.mqtt_protocol)
             print("Using Paho MQTT Callback API V1 (legacy)") # DEBUG
         self.mqtt_client.on_connect = self.on_connect
         self.mqtt_client.on_disconnect = self.on_disconnect
@@ -348,13 +911,33 @@ class MainApplication(QMainWindow):
 
         self.is_mqtt_connected = connect_successful
 
+        metrics.inc("mqtt_connects_total", result="ok" if connect_successful else "failed")
+        tracer.instant("mqtt.connect", result=reason_string)
         if self.is_mqtt_connected:
+            startup_timer.mark("mqtt_connected")
+            # Timer marks are thread-safe; the report itself runs on the main thread
+            self.mqtt_connected_signal.emit()
             status = f"Connected to MQTT Broker! Subscribing to {self.mqtt_keypad_topic} and {self.mqtt_output_topic}"
             self.update_status(status)
             # Subscribe with error handling
             try:
-                res_keypad = client.subscribe(self.mqtt_keypad_topic)
-                res_output = client.subscribe(self.mqtt_output_topic)
+                # QoS 1 so chunks of large inbound messages are not silently lost
+                res_keypad = client.subscribe(self.mqtt_keypad_topic, qos=1)
+                if self.mqtt_protocol == mqtt.MQTTv5:
+                    # no_local: the broker doesn't send our own publishes back to us
+                    from paho.mqtt.subscribeoptions import SubscribeOptions
+                    res_output = client.subscribe(self.mqtt_output_topic, options=SubscribeOptions(qos=1, noLocal=True))
+                else:
+                    res_output = client.subscribe(self.mqtt_output_topic, qos=1)
+                if self.job_dispatcher:
+                    res_jobs = client.subscribe(self.job_dispatcher.reply_topic, qos=1)
+                    if res_jobs[0] != mqtt.MQTT_ERR_SUCCESS:
+                        print(f"Warning: Failed to subscribe to {self.job_dispatcher.reply_topic}, rc={res_jobs[0]}")
+                if self.mqtt_ingest_topic:
+                    # "<topic>/#" also matches the bare topic; the suffix names the source
+                    res_ingest = client.subscribe(f"{self.mqtt_ingest_topic}/#", qos=1)
+                    if res_ingest[0] != mqtt.MQTT_ERR_SUCCESS:
+                        print(f"Warning: Failed to subscribe to {self.mqtt_ingest_topic}/#, rc={res_ingest[0]}")
                 if res_keypad[0] != mqtt.MQTT_ERR_SUCCESS:
                     print(f"Warning: Failed to subscribe to {self.mqtt_keypad_topic}, rc={res_keypad[0]}")
                 if res_output[0] != mqtt.MQTT_ERR_SUCCESS:
@@ -362,17 +945,24 @@ class MainApplication(QMainWindow):
             except Exception as e:
                 print(f"Error during MQTT subscribe: {e}")
 
+            # Deliver whatever was queued while we were disconnected, in order
+            self.start_outbox_replay()
+
             # Initial check is now triggered by trigger_initial_check after dialog closes
             # if not self.initial_check_done: ...
         else:
             self.update_status(f"Failed to connect to MQTT Broker ({reason_string}).")
 
-    def on_disconnect(self, client, userdata, rc, properties=None):
+    def on_disconnect(self, client, userdata, *args):
+        # V1: (rc), V2: (disconnect_flags, reason_code, properties)
+        rc = args[0] if len(args) == 1 else args[1]
         reason_string = str(rc)
         if isinstance(rc, int): # V1 API
              reason_string = f"rc={rc}"
 
         self.is_mqtt_connected = False
+        metrics.inc("mqtt_disconnects_total", expected="true" if rc == 0 else "false")
+        tracer.instant("mqtt.disconnect", reason=reason_string)
         # Only update status if rc indicates an unexpected disconnect (rc != 0)
         # Normal disconnect (rc=0) happens during shutdown.
         if rc != 0:
@@ -382,35 +972,389 @@ class MainApplication(QMainWindow):
 
     def on_mqtt_message(self, client, userdata, msg):
         topic = msg.topic
+        with tracer.span("mqtt.message", topic=topic, size=len(msg.payload)):
+            try:
+                data = self.reassembler.add(msg.payload, topic)
+                if data is None:
+                    return # Waiting for more chunks
+                if self.job_dispatcher and topic == self.job_dispatcher.reply_topic:
+                    self.job_dispatcher.handle_reply(data)
+                    return
+                if self.mqtt_ingest_topic and (topic == self.mqtt_ingest_topic
+                                               or topic.startswith(self.mqtt_ingest_topic + "/")):
+                    self.ingest_frame(data, getattr(msg, 'properties', None), topic)
+                    return
+                if topic == self.mqtt_output_topic and self.mqtt_protocol != mqtt.MQTTv5 and self._take_echo(data):
+                    return # Echo of our own publish (MQTT 3.1.1 has no no_local), already displayed
+                payload = data.decode(errors="replace")
+                print(f"MQTT Message Received: Topic='{topic}', Payload='{payload}'") # DEBUG
+                if topic == self.mqtt_keypad_topic:
+                    self.dispatch_command_payload(payload, getattr(msg, 'properties', None), source="mqtt")
+                elif topic == self.mqtt_output_topic:
+                    # Use signal to safely update GUI from MQTT thread
+                    self.output_message_signal.emit(payload)
+            except Exception as e:
+                print(f"Error processing MQTT message on topic {topic}: {e}")
+
+
+    def start_command_socket(self):
+        """Listens for keypad commands on the local Unix socket (same-host transport, no broker)."""
+        path = self.settings.get('command_socket', '').strip()
+        if not path or self.command_socket_server:
+            return
         try:
-            payload = msg.payload.decode()
-            print(f"MQTT Message Received: Topic='{topic}', Payload='{payload}'") # DEBUG
-            if topic == self.mqtt_keypad_topic and payload == "capture":
-                print("Capture command received via MQTT.") # DEBUG
-                # Use QTimer.singleShot to ensure capture runs in main thread
-                QTimer.singleShot(0, self.capture_and_process)
-            elif topic == self.mqtt_output_topic:
-                # Use signal to safely update GUI from MQTT thread
-                self.output_message_signal.emit(payload)
-        except Exception as e:
-            print(f"Error processing MQTT message on topic {topic}: {e}")
+            self.command_socket_server = UnixSocketCommandServer(
+                path, lambda payload: self.dispatch_command_payload(payload, source="unix"))
+            self.command_socket_server.start()
+        except OSError as e:
+            self.command_socket_server = None
+            self.update_status(f"Cannot listen on command socket {path}: {e}")
+
+    def start_ingest(self):
+        """Starts the workers that analyse frames pushed to the MQTT ingest topic."""
+        if not self.mqtt_ingest_topic or self.ingest_scheduler:
+            return
+        def setting(key, default, cast):
+            try:
+                return cast(self.settings.get(key, default))
+            except (ValueError, TypeError):
+                return default
+        self.ingest_scheduler = IngestScheduler(
+            self.run_analysis,
+            rate=setting('ingest_rate', 0.5, float),
+            burst=setting('ingest_burst', 2, int),
+            queue_per_source=setting('ingest_queue_per_source', 1, int),
+            workers=setting('ingest_workers', 1, int),
+            max_sources=setting('ingest_max_sources', INGEST_MAX_SOURCES, int))
+        self.ingest_scheduler.start()
+
+    def start_job_dispatcher(self):
+        """In distributed mode, hands analyses to the AnalysisWorker pool over MQTT."""
+        if self.analysis_mode != 'distributed' or self.job_dispatcher:
+            return
+        if self.mqtt_protocol != mqtt.MQTTv5:
+            self.update_status("analysis_mode = distributed needs mqtt_protocol = 5 (shared subscriptions); analysing locally.")
+            return
+        try:
+            lease = float(self.settings.get('analysis_job_lease', DEFAULT_LEASE))
+            attempts = int(self.settings.get('analysis_job_attempts', DEFAULT_MAX_ATTEMPTS))
+        except (ValueError, TypeError):
+            lease, attempts = DEFAULT_LEASE, DEFAULT_MAX_ATTEMPTS
+        self.job_dispatcher = JobDispatcher(
+            self.analysis_job_topic,
+            lambda topic, payload, single: self.chunked_publisher.publish(
+                self.mqtt_client, topic, payload, CLASS_JOB, single=single),
+            self.on_job_done, lease, attempts)
+        self.job_dispatcher.start()
+        if self.is_mqtt_connected:
+            self.mqtt_client.subscribe(self.job_dispatcher.reply_topic, qos=1)
+
+    def on_job_done(self, request, status, text, worker):
+        """Publishes a worker's result like a local analysis result. Runs in the MQTT or lease thread."""
+        tracer.instant("analysis.job_done", request.request_id, status=status, worker=worker)
+        capture_hash = getattr(request, 'capture_hash', None)
+        if capture_hash and self.capture_store:
+            self.capture_store.annotate(capture_hash, status=status, result=text)
+        metrics.inc("analyses_total", status="ok" if status == STATUS_OK else "error")
+        if status == STATUS_OK:
+            self.index_for_recall(text, request, capture_hash=capture_hash)
+            self.update_status(f"Analysis complete on worker {worker}. Publishing...")
+            self.publish_output_message(SENDER_ID_ANALYSIS, text, request)
+        else:
+            self.update_status(f"Analysis failed on worker {worker}: {text}")
+            self.publish_response(request, SENDER_ID_ANALYSIS, text, STATUS_ERROR)
+
+    def ingest_frame(self, payload, properties, topic):
+        """Queues an image pushed by a remote camera/host. Runs in the MQTT thread."""
+        source = topic[len(self.mqtt_ingest_topic):].strip('/') or "mqtt"
+        if not self.ingest_scheduler:
+            return
+        try:
+            request, image = parse_ingest_payload(payload, properties, source, self.reserved_topics)
+        except CommandError as e:
+            print(f"Ignoring invalid ingest frame from {source}: {e}")
+            reply_to = getattr(properties, 'ResponseTopic', None) if properties is not None else None
+            if reply_to and is_reply_topic(reply_to, self.reserved_topics):
+                bad = Command("ingest", response_topic=reply_to, source=source,
+                              correlation_data=getattr(properties, 'CorrelationData', None))
+                self.publish_response(bad, SENDER_ID_MAIN, str(e), STATUS_ERROR)
+            return
+        tracer.instant("ingest.frame", request.request_id, source=source, size=len(image.data))
+        accepted, replaced = self.ingest_scheduler.submit(request, image)
+        if not accepted:
+            print(f"Ingest from {source} rate limited, dropping {request.request_id}") # DEBUG
+            self.publish_response(request, SENDER_ID_MAIN, "Rate limited, frame dropped.", STATUS_ERROR)
+            return
+        if replaced is not None:
+            self.publish_response(replaced, SENDER_ID_MAIN, "Superseded by a newer frame.", STATUS_ERROR)
+        self.publish_response(request, SENDER_ID_MAIN, "Frame queued.", STATUS_ACCEPTED)
+
+    def dispatch_command_payload(self, payload, properties=None, source=None):
+        """Parses a command from any transport thread and hands it to the main thread."""
+        try:
+            with tracer.span("command.parse", source=source) as span:
+                request = parse_command(payload, properties, source, self.reserved_topics)
+                span.annotate(request.request_id, command=request.command)
+        except CommandError as e:
+            print(f"Ignoring invalid command from {source}: {e}")
+            # Still tell a v5 client why, if it asked for replies to a usable topic
+            reply_to = getattr(properties, 'ResponseTopic', None) if properties is not None else None
+            if reply_to and is_reply_topic(reply_to, self.reserved_topics):
+                bad = Command("invalid", response_topic=reply_to,
+                              correlation_data=getattr(properties, 'CorrelationData', None))
+                self.publish_response(bad, SENDER_ID_MAIN, str(e), STATUS_ERROR)
+            return
+        self.command_signal.emit(request)
+
+    @pyqtSlot(object)
+    def handle_command(self, request):
+        """Executes a keypad/IoT command. Runs in the main thread."""
+        with tracer.span("command", request.request_id, command=request.command, source=request.source):
+            print(f"Command received: {request}") # DEBUG
+            if request.command == "capture":
+                self.publish_response(request, SENDER_ID_MAIN, "Capture queued.", STATUS_ACCEPTED)
+                self.capture_and_process(request)
+            elif request.command == "capture_clip":
+                self.capture_clip(request)
+            elif request.command == "chat":
+                if not request.prompt:
+                    self.publish_response(request, SENDER_ID_MAIN, "'chat' needs a prompt.", STATUS_ERROR)
+                    return
+                self.publish_response(request, SENDER_ID_MAIN, "Chat queued.", STATUS_ACCEPTED)
+                threading.Thread(target=self.send_chat_message_to_ollama,
+                                 args=(request.prompt, request), daemon=True).start()
+            elif request.command == "recall":
+                if not request.prompt:
+                    self.publish_response(request, SENDER_ID_MAIN, "'recall' needs a prompt.", STATUS_ERROR)
+                    return
+                self.recall(request)
+            elif request.command == "trace":
+                self.dump_trace(request)
+            elif request.command == "profile":
+                self.start_profile(request)
+            elif request.command in NAVIGATION_COMMANDS:
+                self.navigate(request)
+            else:
+                print(f"Unhandled command: {request.command}") # DEBUG
+                self.publish_response(request, SENDER_ID_MAIN, f"Unknown command '{request.command}'.", STATUS_ERROR)
+
+    def navigate(self, request):
+        """Keypad history navigation: scrolling and paging load history pages on demand."""
+        command = request.command
+        navigator = self.history_navigator
+        if command in ("scroll_left", "scroll_right"):
+            scrollbar = self.chat_display.horizontalScrollBar()
+            scrollbar.setValue(scrollbar.value() + (scrollbar.singleStep() * 3) * (-1 if command == "scroll_left" else 1))
+        elif navigator is None:
+            # No history store: plain scrolling of what is shown
+            scrollbar = self.chat_display.verticalScrollBar()
+            if command == "clear":
+                self.chat_renderer.clear()
+            elif command == "home":
+                scrollbar.setValue(scrollbar.minimum())
+            elif command == "end":
+                scrollbar.setValue(scrollbar.maximum())
+            elif command in ("scroll_up", "scroll_down", "page_up", "page_down"):
+                step = scrollbar.pageStep() if command.startswith("page") else scrollbar.singleStep() * 3
+                scrollbar.setValue(scrollbar.value() + (step if command.endswith("down") else -step))
+        elif command in ("scroll_up", "scroll_down"):
+            navigator.scroll(-1 if command == "scroll_up" else 1)
+        elif command in ("page_up", "page_down"):
+            navigator.page(-1 if command == "page_up" else 1)
+        elif command == "home":
+            navigator.home()
+        elif command == "end":
+            navigator.end()
+        elif command == "clear":
+            navigator.clear()
+        elif command == "search":
+            if not request.prompt:
+                self.publish_response(request, SENDER_ID_MAIN, "'search' needs a prompt.", STATUS_ERROR)
+                return
+            navigator.search(request.prompt)
+        if not self.chat_renderer.following and self.chat_renderer.unseen:
+            self.update_status(f"Browsing history, {self.chat_renderer.unseen} new message(s). Press End to return.")
+        self.publish_response(request, SENDER_ID_MAIN, f"{command} done.", STATUS_OK)
+
+    def resolve_prompt(self, prompt):
+        """Looks a prompt name up in the [Prompts] section; anything else is used as literal prompt text."""
+        if not prompt:
+            return self.ollama_prompt
+        if self.config.has_section('Prompts') and prompt in self.config['Prompts'] \
+                and prompt not in self.config.defaults():
+            return self.config['Prompts'][prompt]
+        return prompt
+
+    def get_screen_cast_handler(self):
+        """Creates the ScreenCastHandler on first use, importing GStreamer/Gio only then."""
+        if self.screen_cast_handler is None:
+            try:
+                from ScreenCastHandler import ScreenCastHandler
+            except (ImportError, ValueError) as e:
+                print("ERROR: Failed to import GObject/GStreamer bindings.")
+                print("Please ensure PyGObject and GStreamer Python bindings are installed.")
+                self.update_status(f"Screen capture unavailable: {e}")
+                return None
+            self.start_glib_loop_integration()
+            self.screen_cast_handler = ScreenCastHandler(self)
+            self.screen_cast_handler.capture_successful.connect(self.on_capture_successful)
+            self.screen_cast_handler.clip_successful.connect(self.on_clip_successful)
+            self.screen_cast_handler.capture_failed.connect(self.on_capture_failed)
+        return self.screen_cast_handler
 
+    def start_glib_loop_integration(self):
+        """Pumps the GLib default main context from the Qt event loop."""
+        # Use a timer to periodically run the GLib default main context iteration.
+        # This allows DBus signals and GStreamer messages to be processed
+        # without blocking the Qt event loop or needing a separate GLib loop thread.
+        if self.glib_loop_timer is None:
+            from gi.repository import GLib
+            context = GLib.MainContext.default()
+            self.glib_loop_timer = QTimer(self)
+            self.glib_loop_timer.timeout.connect(lambda: context.iteration(False))
+            self.glib_loop_timer.start(50) # Check every 50ms
 
-    def capture_and_process(self):
-        """Initiates screen capture. Runs in the main thread."""
+    def capture_and_process(self, request=None):
+        """Initiates screen capture. Runs in the main thread.
+
+        Requests arriving while a capture is in progress share its frame; each is
+        analysed with its own prompt/model and answered on its own route.
+        """
+        request = request or Command("capture", source="local")
+        self.pending_capture_requests.append(request)
+        if self.capture_in_progress:
+            print("Capture already in progress, request will share its frame.") # DEBUG
+            # Links the request to the capture it joins
+            tracer.instant("capture.joined", (request.request_id, self.screen_cast_handler.capture_id))
+            return
+        handler = self.get_screen_cast_handler()
+        if handler is None:
+            self.fail_pending_captures("Screen capture unavailable.")
+            return
+        self.capture_in_progress = True
         self.update_status("Initiating window capture via ScreenCast portal...")
-        self.screen_cast_handler.start_capture()
+        with tracer.span("capture.request") as span:
+            handler.start_capture()
+            span.annotate((request.request_id, handler.capture_id))
+
+    def capture_clip(self, request):
+        """Records a short clip (clip_seconds at clip_fps) and analyses a few distinct keyframes of it together."""
+        if self.capture_in_progress:
+            self.publish_response(request, SENDER_ID_MAIN, "A capture is already in progress.", STATUS_ERROR)
+            return
+        try:
+            # numpy is only needed for clips
+            from ClipBuffer import ClipBuffer, DEFAULT_SECONDS, DEFAULT_FPS, DEFAULT_MAX_SIDE, DEFAULT_RING_MB
+        except ImportError as e:
+            self.publish_response(request, SENDER_ID_MAIN, f"Clip capture unavailable: {e}", STATUS_ERROR)
+            return
+        try:
+            seconds = float(request.extra.get('seconds', self.settings.get('clip_seconds', DEFAULT_SECONDS)))
+            fps = float(self.settings.get('clip_fps', DEFAULT_FPS))
+            max_side = int(self.settings.get('clip_max_side', DEFAULT_MAX_SIDE))
+            ring_mb = float(self.settings.get('clip_ring_mb', DEFAULT_RING_MB))
+            keyframes, _ = self.clip_limits(request)
+        except (ValueError, TypeError):
+            self.publish_response(request, SENDER_ID_MAIN, "Invalid clip settings or 'seconds'/'keyframes'.", STATUS_ERROR)
+            return
+        if not 0 < seconds <= 60 or keyframes < 1:
+            self.publish_response(request, SENDER_ID_MAIN, "'seconds' must be in (0, 60], 'keyframes' at least 1.",
+                                  STATUS_ERROR)
+            return
+        handler = self.get_screen_cast_handler()
+        if handler is None:
+            self.publish_response(request, SENDER_ID_MAIN, "Screen capture unavailable.", STATUS_ERROR)
+            return
+        self.publish_response(request, SENDER_ID_MAIN, f"Recording a {seconds:g} s clip.", STATUS_ACCEPTED)
+        self.pending_capture_requests.append(request)
+        self.capture_in_progress = True
+        self.update_status(f"Initiating {seconds:g} s clip capture via ScreenCast portal...")
+        with tracer.span("capture.request", clip=True) as span:
+            handler.start_clip(ClipBuffer(int(ring_mb * 1024 * 1024), max(64, max_side)), seconds, fps)
+            span.annotate((request.request_id, handler.capture_id))
+
+    def clip_limits(self, request):
+        """Returns (keyframes, min_change) for analysing a clip for request. Raises ValueError/TypeError."""
+        from ClipBuffer import DEFAULT_KEYFRAMES, DEFAULT_MIN_CHANGE
+        # A request may ask for fewer keyframes, never more: clip_keyframes bounds the image tokens
+        keyframes = int(self.settings.get('clip_keyframes', DEFAULT_KEYFRAMES))
+        if 'keyframes' in request.extra:
+            keyframes = min(int(request.extra['keyframes']), keyframes)
+        return keyframes, float(self.settings.get('clip_min_change', DEFAULT_MIN_CHANGE))
+
+    @pyqtSlot(object) # Receives a ClipBuffer
+    def on_clip_successful(self, clip):
+        """Hands a recorded clip to the analysis threads. Runs in the main thread."""
+        metrics.inc("captures_total", status="ok")
+        self.update_status(f"Clip recorded ({len(clip)} frames). Selecting keyframes...")
+        requests = self.pending_capture_requests
+        self.pending_capture_requests = []
+        self.capture_in_progress = False
+        capture_id = self.screen_cast_handler.capture_id if self.screen_cast_handler else None
+        with tracer.span("capture.delivered", (capture_id,) + tuple(r.request_id for r in requests), frames=len(clip)):
+            for request in requests:
+                # Each request's own limits: requests joining the capture may differ from the one that started it
+                try:
+                    keyframes, min_change = self.clip_limits(request)
+                except (ValueError, TypeError):
+                    keyframes = 0
+                if keyframes < 1:
+                    self.publish_response(request, SENDER_ID_MAIN, "Invalid 'keyframes': must be an integer of at least 1.", STATUS_ERROR)
+                    continue
+                threading.Thread(target=self.run_clip_analysis, args=(clip, request, keyframes, min_change),
+                                 daemon=True).start()
+
+    def run_clip_analysis(self, clip, request, keyframes, min_change):
+        """Sends up to keyframes distinct frames of the clip to the model in one request. Runs in a background thread."""
+        prompt = self.resolve_prompt(request.prompt)
+        model = request.model or self.ollama_model
+        with tracer.span("analysis", request.request_id, source=request.source, model=model, mode="clip"):
+            try:
+                with tracer.span("clip.keyframes", frames=len(clip)) as span:
+                    keyframes = clip.keyframes(keyframes, min_change)
+                    span.annotate(keyframes=len(keyframes))
+                images = [self.encode_image(frame, request.image) for _, frame in keyframes]
+                offsets = ", ".join(f"+{offset:.1f} s" for offset, _ in keyframes)
+                # Tell the model what it is looking at, so it describes the change rather than each frame
+                clip_prompt = (f"These {len(images)} screenshots were taken in this order from the same screen "
+                               f"over {clip.span_seconds():.1f} seconds (at {offsets}). Describe what happened.\n\n"
+                               f"{prompt}") if len(images) > 1 else prompt
+                start = time.perf_counter()
+                result = self.analyze_image(images, clip_prompt, model)
+                capture_hash = self.store_capture(images[-1], keyframes[-1][1], request, prompt, model,
+                                                  latency_ms=(time.perf_counter() - start) * 1000.0,
+                                                  status=STATUS_OK if result else STATUS_ERROR, result=result)
+                self.index_for_recall(result, request, prompt, capture_hash)
+                metrics.inc("analyses_total", status="ok" if result else "error")
+                if result:
+                    self.update_status(f"Clip analysis complete ({len(images)} keyframes). Publishing...")
+                    self.publish_output_message(SENDER_ID_ANALYSIS, result, request)
+                else:
+                    self.update_status("Clip analysis failed or produced no result.")
+                    self.publish_response(request, SENDER_ID_ANALYSIS, "Clip analysis failed or produced no result.",
+                                          STATUS_ERROR)
+            except Exception as e:
+                metrics.inc("analyses_total", status="error")
+                self.update_status(f"Error during clip analysis: {e}")
+                self.publish_response(request, SENDER_ID_ANALYSIS, f"Error during clip analysis: {e}", STATUS_ERROR)
+                import traceback
+                traceback.print_exc()
 
     @pyqtSlot(object) # Receives PIL Image
     def on_capture_successful(self, image):
         """Handles successful capture. Runs in the main thread."""
+        metrics.inc("captures_total", status="ok")
         self.update_status("Window capture successful.")
         try:
-            # Save a copy asynchronously
-            self.save_captured_image_async(image.copy())
             self.update_status("Analyzing captured image...")
-            # Move analysis to background thread
-            threading.Thread(target=self.run_analysis, args=(image,), daemon=True).start()
+            requests = self.pending_capture_requests or [Command("capture", source="local")]
+            self.pending_capture_requests = []
+            self.capture_in_progress = False
+            capture_id = self.screen_cast_handler.capture_id if self.screen_cast_handler else None
+            # Move analysis to background threads, one per waiting request
+            with tracer.span("capture.delivered", (capture_id,) + tuple(r.request_id for r in requests)):
+                for request in requests:
+                    threading.Thread(target=self.run_local_analysis, args=(image, request), daemon=True).start()
         except Exception as e:
             self.update_status(f"Error processing captured image: {e}")
             import traceback
@@ -420,34 +1364,212 @@ class MainApplication(QMainWindow):
     def on_capture_failed(self, error_message):
         """Handles failed capture. Runs in the main thread."""
         self.update_status(f"Capture failed: {error_message}")
+        self.fail_pending_captures(f"Capture failed: {error_message}")
+
+    def fail_pending_captures(self, error_message):
+        """Answers every request waiting on the current capture with an error."""
+        metrics.inc("captures_total", status="failed")
+        tracer.instant("capture.failed", tuple(r.request_id for r in self.pending_capture_requests), error=error_message)
+        requests = self.pending_capture_requests
+        self.pending_capture_requests = []
+        self.capture_in_progress = False
+        for request in requests:
+            self.publish_response(request, SENDER_ID_ANALYSIS, error_message, STATUS_ERROR)
 
-    def run_analysis(self, image):
+    def run_local_analysis(self, image, request=None):
+        """Runs run_analysis for a local capture, holding back remote ingest work meanwhile."""
+        if self.ingest_scheduler:
+            self.ingest_scheduler.local_started()
+        try:
+            self.run_analysis(image, request)
+        finally:
+            if self.ingest_scheduler:
+                self.ingest_scheduler.local_finished()
+
+    def run_analysis(self, image, request=None):
         """Performs image analysis in a background thread."""
+        request = request or Command("capture", source="local")
+        prompt = self.resolve_prompt(request.prompt)
+        model = request.model or self.ollama_model
+        with tracer.span("analysis", request.request_id, source=request.source, model=model,
+                         mode="distributed" if self.job_dispatcher else "local"):
+            if self.job_dispatcher:
+                try:
+                    img_bytes = self.encode_image(image, request.image)
+                    request.capture_hash = self.store_capture(img_bytes, image, request, prompt, model)
+                    self.job_dispatcher.submit(request, img_bytes, prompt, model)
+                    self.update_status("Analysis job sent to worker pool.")
+                except Exception as e:
+                    self.update_status(f"Error sending analysis job: {e}")
+                    self.publish_response(request, SENDER_ID_ANALYSIS, f"Error sending analysis job: {e}", STATUS_ERROR)
+                return
+            try:
+                diff = self.diff_enabled(request, image)
+                changes = self.analyze_changes(image, request, prompt, model) if diff else None
+                if changes is not None:
+                    # Only crops (or nothing) went to the model; the store still gets the full frame.
+                    # An unchanged frame adds nothing new, so it is neither stored nor indexed
+                    result, latency_ms, changed = changes
+                    capture_hash = None
+                    if self.capture_store and changed:
+                        capture_hash = self.store_capture(self.encode_image(image, request.image), image, request,
+                                                          prompt, model, latency_ms=latency_ms,
+                                                          status=STATUS_OK if result else STATUS_ERROR, result=result)
+                else:
+                    # Encode once: the same bytes go to the model and into the capture store
+                    img_bytes = self.encode_image(image, request.image)
+                    start = time.perf_counter()
+                    result = self.analyze_image(img_bytes, prompt, model)
+                    capture_hash = self.store_capture(img_bytes, image, request, prompt, model,
+                                                      latency_ms=(time.perf_counter() - start) * 1000.0,
+                                                      status=STATUS_OK if result else STATUS_ERROR, result=result)
+                    if diff and result:
+                        self.set_diff_baseline(request.source, image, result)
+                if changes is None or changed:
+                    self.index_for_recall(result, request, prompt, capture_hash)
+                metrics.inc("analyses_total", status="ok" if result else "error")
+                if result:
+                    self.update_status("Analysis complete. Publishing...")
+                    self.publish_output_message(SENDER_ID_ANALYSIS, result, request)
+                else:
+                     self.update_status("Analysis failed or produced no result.")
+                     self.publish_response(request, SENDER_ID_ANALYSIS, "Analysis failed or produced no result.", STATUS_ERROR)
+            except Exception as e:
+                 metrics.inc("analyses_total", status="error")
+                 self.update_status(f"Error during analysis thread: {e}")
+                 self.publish_response(request, SENDER_ID_ANALYSIS, f"Error during analysis: {e}", STATUS_ERROR)
+                 import traceback
+                 traceback.print_exc()
+
+    def diff_enabled(self, request, image):
+        """Whether request is analysed incrementally: the "diff" field, else diff_analysis. Needs a decoded frame."""
+        value = request.extra.get('diff', self.settings.get('diff_analysis', 'false'))
+        return not isinstance(image, EncodedImage) and str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+    def set_diff_baseline(self, source, image, description, changes=()):
+        """Remembers the frame and what is known about it for the next diff analysis of source.
+
+        description is the full-frame result and is always kept; changes are the
+        region results since, dropped oldest first to fit diff_context_chars.
+        """
+        try:
+            limit = int(self.settings.get('diff_context_chars', 2000))
+        except (ValueError, TypeError):
+            limit = 2000
+        changes = list(changes)
+        while limit > 0 and changes and len(self.diff_context(description, changes)) > limit:
+            changes.pop(0)
+        with self.diff_lock:
+            self.diff_baselines[source] = (image, description, tuple(changes))
+
+    def diff_context(self, description, changes):
+        """The text a diff prompt starts from: the full-frame result, then each change since."""
+        return "".join([description] + [f"\n\nThen: {change}" for change in changes])
+
+    def analyze_changes(self, image, request, prompt, model):
+        """Analyses only what changed since the last analysed frame of request.source.
+
+        Returns (result, latency_ms, changed), with result None if the model
+        failed and changed False if nothing changed (the model was not called),
+        or None when the frame has to be analysed in full: no baseline, a
+        different size, or too much changed. Runs in the analysis thread.
+        """
+        with self.diff_lock:
+            baseline = self.diff_baselines.get(request.source)
+        if baseline is None or baseline[0] is image: # Requests sharing a frame are each analysed in full
+            return None
+        previous, description, changes = baseline
+        context = self.diff_context(description, changes)
+        try:
+            # numpy is only needed with diff analysis
+            from DiffRegions import (changed_regions, DEFAULT_BLOCK, DEFAULT_THRESHOLD, DEFAULT_MAX_REGIONS,
+                                     DEFAULT_MAX_AREA, DEFAULT_PADDING)
+            block = int(self.settings.get('diff_block', DEFAULT_BLOCK))
+            threshold = int(self.settings.get('diff_threshold', DEFAULT_THRESHOLD))
+            max_regions = int(self.settings.get('diff_max_regions', DEFAULT_MAX_REGIONS))
+            max_area = float(self.settings.get('diff_max_area', DEFAULT_MAX_AREA))
+        except (ImportError, ValueError, TypeError) as e:
+            print(f"Diff analysis unavailable, analysing the full frame: {e}") # DEBUG
+            return None
+        with tracer.span("diff.regions", request.request_id) as span:
+            regions = changed_regions(previous, image, max(8, block), threshold, padding=DEFAULT_PADDING,
+                                      max_regions=max(1, max_regions), max_area=max_area)
+            span.annotate(regions=-1 if regions is None else len(regions))
+        if regions is None:
+            metrics.inc("diff_analyses_total", result="full")
+            return None
+        if not regions:
+            metrics.inc("diff_analyses_total", result="unchanged")
+            self.set_diff_baseline(request.source, image, description, changes)
+            return f"No visible change since the last capture. Previously: {context}", 0.0, False
+        crops = [self.encode_image(image.crop(box), request.image) for box in regions]
+        width, height = image.size
+        where = "; ".join(f"{x1 - x0}x{y1 - y0} at ({x0}, {y0})" for x0, y0, x1, y1 in regions)
+        diff_prompt = (f"Earlier, this {width}x{height} screen showed: {context}\n\n"
+                       f"Since then only the {len(crops)} region(s) in the attached image(s) changed, "
+                       f"cropped from the screen ({where}). Describe what changed.\n\n{prompt}")
+        start = time.perf_counter()
+        result = self.analyze_image(crops, diff_prompt, model)
+        latency_ms = (time.perf_counter() - start) * 1000.0
+        metrics.inc("diff_analyses_total", result="regions")
+        if result:
+            self.set_diff_baseline(request.source, image, description, changes + (result,))
+        return result, latency_ms, True
+
+    def store_capture(self, img_bytes, image, request, prompt, model, **meta):
+        """Records an analysed frame in the capture store; returns its content hash (None if disabled)."""
+        if not self.capture_store:
+            return None
         try:
-            result = self.analyze_image(image)
-            if result:
-                self.update_status("Analysis complete. Publishing...")
-                self.publish_output_message(SENDER_ID_ANALYSIS, result)
+            size = image.size
+        except Exception:
+            size = None
+        with tracer.span("capture_store.add"):
+            return self.capture_store.add(img_bytes, size, source=request.source, request_id=request.request_id,
+                                          prompt=prompt, model=model, **meta)
+
+    def encode_image(self, img, image_options=None):
+        """Encodes a PIL image (or EncodedImage) for the LLM, applying optional format/max_size/quality options."""
+        image_options = image_options or {}
+        start = time.perf_counter()
+        if isinstance(img, EncodedImage):
+            if img.acceptable(image_options):
+                metrics.inc("cache_hits_total", cache="encoded_image")
+                return img.data # Already encoded within limits: no decode/re-encode
+            with tracer.span("encode.decode", format=img.format):
+                img = img.to_pil()
+        with tracer.span("encode", width=img.size[0], height=img.size[1], pooled=bool(self.frame_pool)) as span:
+            if self.frame_pool:
+                # Pixels go to a worker through shared memory; only the encoded bytes come back
+                data, image_format = self.frame_pool.run(encode_pil, img, image_options)
             else:
-                 self.update_status("Analysis failed or produced no result.")
-        except Exception as e:
-             self.update_status(f"Error during analysis thread: {e}")
-             import traceback
-             traceback.print_exc()
+                data, image_format = encode_pil(img, image_options)
+            span.annotate(format=image_format, bytes=len(data))
+        metrics.observe("image_encode_seconds", time.perf_counter() - start, format=image_format.lower())
+        return data
 
-    def analyze_image(self, img):
-        """Sends image to Ollama for analysis."""
-        if not self.ollama_model or not self.ollama_server:
+    def analyze_image(self, img, prompt=None, model=None, image_options=None):
+        """Sends image (PIL/EncodedImage, bytes already encoded, or a list of encoded images) to Ollama for analysis."""
+        prompt = prompt or self.ollama_prompt
+        model = model or self.ollama_model
+        if not model or not self.ollama_server:
             self.update_status("Ollama model or server not configured.")
             return None
         try:
-            img_byte_arr = io.BytesIO()
-            if img.mode != 'RGB':
-                 img = img.convert('RGB')
-            img.save(img_byte_arr, format='PNG')
-            img_bytes = img_byte_arr.getvalue()
-            client = ollama.Client(host=self.ollama_server)
-            response = client.chat(model=self.ollama_model, messages=[{'role': 'user', 'content': self.ollama_prompt, 'images': [img_bytes]}])
+            if isinstance(img, list):
+                images = img
+            else:
+                images = [img if isinstance(img, bytes) else self.encode_image(img, image_options)]
+            client = self.get_ollama_client()
+            start = time.perf_counter()
+            with tracer.span("ollama.chat", model=model, images=len(images), image_bytes=sum(map(len, images))):
+                response = client.chat(model=model, messages=[{'role': 'user', 'content': prompt, 'images': images}])
+            elapsed = time.perf_counter() - start
+            metrics.observe("ollama_generation_seconds", elapsed, kind="analysis")
+            # Not streamed: time to first token is the wall time minus the server's token generation time
+            eval_ns = response.get('eval_duration')
+            if eval_ns:
+                metrics.observe("ollama_ttft_seconds", max(0.0, elapsed - eval_ns / 1e9), kind="analysis")
             return response['message']['content'].strip()
         except Exception as e:
             self.update_status(f"Error during image analysis: {e}")
@@ -455,26 +1577,6 @@ class MainApplication(QMainWindow):
             traceback.print_exc()
             return None
 
-    def save_captured_image_async(self, image):
-        threading.Thread(target=self._save_image_sync, args=(image,), daemon=True).start()
-
-    def _save_image_sync(self, image):
-        """Synchronous part of saving the image."""
-        try:
-            os.makedirs("captures", exist_ok=True)
-            timestamp = time.strftime('%Y%m%d-%H%M%S')
-            capture_files = sorted(glob.glob(os.path.join("captures", "capture-*.png")))
-            while len(capture_files) >= 5:
-                os.remove(capture_files.pop(0))
-            filename = f"capture-{timestamp}.png"
-            filepath = os.path.join("captures", filename)
-            image.save(filepath)
-            print(f"Saved captured image to {filepath}") # DEBUG
-        except Exception as e:
-            print(f"Error saving captured image: {e}")
-            import traceback
-            traceback.print_exc()
-
     def update_status(self, message):
         print(f"Status: {message}")
         self.status_update_signal.emit(message)
@@ -483,6 +1585,28 @@ class MainApplication(QMainWindow):
         print("Closing application...")
         if hasattr(self, 'screen_cast_handler') and self.screen_cast_handler:
             self.screen_cast_handler.cleanup()
+        if self.command_socket_server:
+            self.command_socket_server.stop()
+        if self.job_dispatcher:
+            self.job_dispatcher.stop()
+        if self.ingest_scheduler:
+            self.ingest_scheduler.stop()
+        if self.outbox:
+            self.outbox.close()
+        if self.capture_store:
+            self.capture_store.close()
+        if self.history_store:
+            self.history_store.close()
+        if self.recall_service:
+            self.recall_service.stop()
+        if self.metrics_timer:
+            self.metrics_timer.stop()
+        if self.memory_watchdog:
+            self.memory_watchdog.stop()
+        if self.frame_pool:
+            self.frame_pool.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
         if hasattr(self, 'mqtt_timer') and self.mqtt_timer.isActive():
             self.mqtt_timer.stop()
         if hasattr(self, 'mqtt_client') and self.mqtt_client:
@@ -503,9 +1627,12 @@ class MainApplication(QMainWindow):
 
 # --- Corrected if __name__ == "__main__": block ---
 if __name__ == "__main__":
-    multiprocessing.freeze_support()
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
     print("Creating QApplication...") # DEBUG
     q_app = QApplication(sys.argv)
+    startup_timer.mark("qapplication")
 
     # --- Add SIGINT Handler (KEEP THIS) ---
     def sigint_handler(*args):
@@ -516,21 +1643,20 @@ if __name__ == "__main__":
     signal.signal(signal.SIGINT, sigint_handler)
     # --- End SIGINT Handler ---
 
-    # --- GLib Main Loop Integration (KEEP/ADD THIS) ---
-    # Use a timer to periodically run the GLib default main context iteration.
-    # This allows DBus signals and GStreamer messages to be processed
-    # without blocking the Qt event loop or needing a separate GLib loop thread.
-    glib_loop_timer = QTimer()
-    glib_loop_timer.timeout.connect(lambda: GLib.MainContext.default().iteration(may_block=False))
-    glib_loop_timer.start(50) # Check every 50ms
-    # --- End GLib Main Loop Integration ---
+    # --- GLib Main Loop Integration ---
+    # Started by MainApplication.start_glib_loop_integration() on first capture,
+    # once GStreamer/Gio have actually been imported.
+    # ---
 
     print("Creating MainApplication...") # DEBUG
     main_app = MainApplication() # Create instance (it's hidden by default)
+    startup_timer.mark("main_window_init")
+    signal.signal(TRACE_SIGNAL, lambda *args: main_app.dump_trace())
+    signal.signal(PROFILE_SIGNAL, lambda *args: main_app.start_profile())
 
-    # --- Delay showing settings window until event loop starts ---
-    print("Scheduling main_app.show_settings_window() via QTimer...") # DEBUG
-    QTimer.singleShot(0, main_app.show_settings_window) # Delay = 0ms, runs ASAP after loop starts
+    # --- Delay showing settings window (or auto-starting) until event loop starts ---
+    print("Scheduling main_app.launch() via QTimer...") # DEBUG
+    QTimer.singleShot(0, main_app.launch) # Delay = 0ms, runs ASAP after loop starts
     # ---
 
     print("Starting QApplication event loop (q_app.exec_())...") # DEBUG
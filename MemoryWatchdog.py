@@ -0,0 +1,164 @@
+import gc
+import os
+import ctypes
+import threading
+import tracemalloc
+
+DEFAULT_INTERVAL = 60    # Seconds between RSS samples
+DEFAULT_BUDGET_MB = 64   # RSS growth that triggers an allocation report
+DEFAULT_TRACE_FRAMES = 10
+TOP_SITES = 10
+WARMUP_SAMPLES = 2       # Samples before the baseline is set (startup and first capture allocate a lot)
+# Frames of tracemalloc, this watchdog and the import system are not leaks worth reporting
+IGNORED_FILES = (tracemalloc.__file__, __file__, "<frozen importlib._bootstrap>",
+                 "<frozen importlib._bootstrap_external>", "<unknown>")
+
+
+def rss_bytes():
+    """Returns the resident set size of this process in bytes, or None if unknown."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def malloc_trim():
+    """Returns freed heap memory to the OS (glibc only). Returns True if it did anything."""
+    try:
+        return bool(ctypes.CDLL("libc.so.6").malloc_trim(0))
+    except (OSError, AttributeError):
+        return False
+
+
+class MemoryWatchdog:
+    """Samples RSS periodically and reports where memory grows, using tracemalloc only when needed.
+
+    After WARMUP_SAMPLES samples the current RSS becomes the baseline. When
+    RSS exceeds it by budget_mb, tracemalloc is started (it slows allocation
+    noticeably, so it is off otherwise) and a snapshot taken; on the next
+    sample the snapshot diff is reported as the top allocation sites, tracing
+    stops again and the baseline moves up. With trace_always, tracing runs
+    from the start and the diff covers everything since the baseline.
+
+    Above ceiling_mb (0 = none) the registered shedders run, followed by
+    gc.collect() and malloc_trim(). on_report(report) is called from the
+    watchdog thread with a dict; report['kind'] is "growth", "tracing" or "shed".
+    """
+
+    def __init__(self, on_report, interval=DEFAULT_INTERVAL, budget_mb=DEFAULT_BUDGET_MB, ceiling_mb=0,
+                 trace_frames=DEFAULT_TRACE_FRAMES, trace_always=False):
+        self.on_report = on_report
+        self.interval = interval
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.ceiling = int(ceiling_mb * 1024 * 1024)
+        self.trace_frames = max(1, trace_frames)
+        self.trace_always = trace_always
+        self.shedders = [] # (name, callable)
+        self.baseline = None
+        self.reference = None # tracemalloc snapshot the next report is diffed against
+        self.owns_tracing = False
+        self.pending = False  # Tracing started at the last sample; report on this one
+        self.samples = 0
+        self.stats = {'rss': None, 'peak_rss': 0, 'baseline': None, 'reports': 0, 'sheds': 0}
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def add_shedder(self, name, func):
+        """Registers func() to free memory above the ceiling. Called from the watchdog thread."""
+        self.shedders.append((name, func))
+
+    def start(self):
+        if self.trace_always and not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+            self.owns_tracing = True
+        self.thread = threading.Thread(target=self._run, name="MemoryWatchdog", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.owns_tracing:
+            tracemalloc.stop()
+            self.owns_tracing = False
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Memory watchdog check failed: {e}")
+
+    def check(self):
+        rss = rss_bytes()
+        if rss is None:
+            return
+        self.samples += 1
+        self.stats['rss'] = rss
+        self.stats['peak_rss'] = max(self.stats['peak_rss'], rss)
+        if self.samples <= WARMUP_SAMPLES:
+            self.baseline = self.stats['baseline'] = rss
+            if self.trace_always and tracemalloc.is_tracing():
+                self.reference = tracemalloc.take_snapshot()
+            return
+        if self.ceiling and rss > self.ceiling:
+            rss = self.shed(rss)
+        growth = rss - self.baseline
+        if self.pending:
+            self._report(rss, growth)
+        elif growth > self.budget:
+            if self.reference is None:
+                self._start_tracing()
+                self.on_report({'kind': "tracing", 'rss': rss, 'baseline': self.baseline, 'growth': growth,
+                                'interval': self.interval})
+            else:
+                self._report(rss, growth)
+
+    def _start_tracing(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+            self.owns_tracing = True
+        self.reference = tracemalloc.take_snapshot()
+        self.pending = True
+
+    def _report(self, rss, growth):
+        snapshot = tracemalloc.take_snapshot()
+        filters = [tracemalloc.Filter(False, name) for name in IGNORED_FILES]
+        stats = snapshot.filter_traces(filters).compare_to(self.reference.filter_traces(filters), 'traceback')
+        sites = []
+        for stat in stats[:TOP_SITES]:
+            if stat.size_diff <= 0:
+                break
+            # Tracebacks run oldest to newest; report the allocating line first
+            frames = [f"{frame.filename}:{frame.lineno}" for frame in reversed(stat.traceback)][:4]
+            sites.append({'size_diff': stat.size_diff, 'count_diff': stat.count_diff, 'size': stat.size,
+                          'where': frames[0] if frames else "?", 'traceback': frames})
+        report = {'kind': "growth", 'rss': rss, 'baseline': self.baseline, 'growth': growth,
+                  'traced': tracemalloc.get_traced_memory()[0], 'sites': sites}
+        self.pending = False
+        if self.owns_tracing and not self.trace_always:
+            tracemalloc.stop()
+            self.owns_tracing = False
+            self.reference = None
+        else:
+            self.reference = snapshot # Still tracing: the next report covers growth from here
+        self.baseline = self.stats['baseline'] = rss
+        self.stats['reports'] += 1
+        self.on_report(report)
+
+    def shed(self, rss=None):
+        """Runs every shedder, then gc.collect() and malloc_trim(). Returns RSS afterwards."""
+        before = rss if rss is not None else rss_bytes()
+        shed = []
+        for name, func in self.shedders:
+            try:
+                func()
+                shed.append(name)
+            except Exception as e:
+                print(f"Memory shedder {name} failed: {e}")
+        collected = gc.collect()
+        trimmed = malloc_trim()
+        after = rss_bytes() or before
+        self.stats['sheds'] += 1
+        self.on_report({'kind': "shed", 'rss_before': before, 'rss': after, 'ceiling': self.ceiling,
+                        'shed': shed, 'gc_collected': collected, 'malloc_trim': trimmed})
+        return after
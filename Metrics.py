@@ -0,0 +1,272 @@
+import json
+import time
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds in seconds: sub-millisecond publishes up to multi-minute generations
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+PREFIX = "sauroneye_"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size):
+        self.counts = [0] * (size + 1) # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+
+class _Timer:
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """Counters, histograms and callback gauges, rendered in Prometheus text format.
+
+    Recording is a dict lookup and a few additions under one lock (a few
+    microseconds), so it is safe to leave on. Metrics appear on first use;
+    describe() only adds the HELP text and fixes a histogram's buckets.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.help = {}       # name -> (type, help)
+        self.buckets = {}    # histogram name -> bucket bounds
+        self.counters = {}   # name -> {label key: value}
+        self.histograms = {} # name -> {label key: _Histogram}
+        self.callbacks = {}  # name -> (callback, label name)
+
+    def describe(self, name, kind, help_text, buckets=None):
+        with self.lock:
+            self.help[name] = (kind, help_text)
+            if kind == "histogram":
+                self.buckets[name] = tuple(buckets or DEFAULT_BUCKETS)
+
+    def inc(self, name, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            buckets = self.buckets.get(name) or self.buckets.setdefault(name, DEFAULT_BUCKETS)
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(len(buckets))
+            histogram.counts[bisect.bisect_left(buckets, seconds)] += 1
+            histogram.sum += seconds
+            histogram.count += 1
+
+    def time(self, name, **labels):
+        """Context manager that observes the duration of its block."""
+        return _Timer(self, name, labels)
+
+    def gauge(self, name, callback, help_text, label="key", kind="gauge"):
+        """Registers a value read at render time.
+
+        callback() returns a number, a dict {label value: number} or None to
+        skip. kind "counter" exposes counts kept elsewhere (e.g. a queue's
+        stats dict) as counters.
+        """
+        with self.lock:
+            self.help[name] = (kind, help_text)
+            self.callbacks[name] = (callback, label)
+
+    def _read_callbacks(self):
+        with self.lock:
+            callbacks = list(self.callbacks.items())
+        values = {}
+        for name, (callback, label) in callbacks:
+            try:
+                value = callback()
+            except Exception as e:
+                print(f"Metrics: gauge {name} failed: {e}") # DEBUG
+                continue
+            if value is None:
+                continue
+            if isinstance(value, dict):
+                values[name] = {((label, str(k)),): v for k, v in value.items() if v is not None}
+            else:
+                values[name] = {(): value}
+        return values
+
+    def _copy(self):
+        with self.lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {name: {key: (list(h.counts), h.sum, h.count) for key, h in series.items()}
+                          for name, series in self.histograms.items()}
+            buckets = dict(self.buckets)
+            help_texts = dict(self.help)
+        return counters, histograms, buckets, help_texts
+
+    def render(self):
+        """Returns all metrics in Prometheus text exposition format 0.0.4."""
+        counters, histograms, buckets, help_texts = self._copy()
+        lines = []
+
+        def header(name, kind):
+            declared_kind, help_text = help_texts.get(name, (kind, None))
+            if help_text:
+                lines.append(f"# HELP {PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}{name} {declared_kind}")
+
+        for name, series in sorted(counters.items()):
+            header(name, "counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{PREFIX}{name}{_format_labels(key)} {_format_value(value)}")
+        for name, series in sorted(histograms.items()):
+            header(name, "histogram")
+            bounds = buckets[name]
+            for key, (counts, total, count) in sorted(series.items()):
+                cumulative = 0
+                for bound, n in zip(bounds + (float("inf"),), counts):
+                    cumulative += n
+                    lines.append(f"{PREFIX}{name}_bucket{_format_labels(key, ('le', _format_value(float(bound))))} "
+                                 f"{cumulative}")
+                lines.append(f"{PREFIX}{name}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{PREFIX}{name}_count{_format_labels(key)} {count}")
+        for name, series in sorted(self._read_callbacks().items()):
+            header(name, "gauge")
+            for key, value in sorted(series.items()):
+                lines.append(f"{PREFIX}{name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Returns a JSON-friendly summary: counter values, and count/sum/p50/p95/p99 per histogram series."""
+        counters, histograms, buckets, _ = self._copy()
+
+        def series_name(name, key):
+            return name + ("{" + ",".join(f"{k}={v}" for k, v in key) + "}" if key else "")
+
+        result = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'counters': {}, 'histograms': {}, 'gauges': {}}
+        for name, series in counters.items():
+            for key, value in series.items():
+                result['counters'][series_name(name, key)] = value
+        for name, series in histograms.items():
+            bounds = buckets[name]
+            for key, (counts, total, count) in series.items():
+                result['histograms'][series_name(name, key)] = {
+                    'count': count, 'sum': round(total, 6),
+                    'p50': _quantile(bounds, counts, count, 0.50),
+                    'p95': _quantile(bounds, counts, count, 0.95),
+                    'p99': _quantile(bounds, counts, count, 0.99),
+                }
+        for name, series in self._read_callbacks().items():
+            for key, value in series.items():
+                result['gauges'][series_name(name, key)] = value
+        return result
+
+
+def _quantile(bounds, counts, count, q):
+    """Upper bound of the bucket holding the q-quantile (None if empty, or beyond the last bucket)."""
+    if not count:
+        return None
+    rank = q * count
+    cumulative = 0
+    for bound, n in zip(bounds, counts):
+        cumulative += n
+        if cumulative >= rank:
+            return bound
+    return None
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] == "/metrics":
+            body = self.server.registry.render().encode()
+            content_type = CONTENT_TYPE
+        elif self.path.split("?", 1)[0] == "/metrics.json":
+            body = json.dumps(self.server.registry.snapshot()).encode()
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """Serves GET /metrics (Prometheus text) and /metrics.json from a daemon thread."""
+
+    daemon_threads = True
+
+    def __init__(self, registry, port, host="127.0.0.1"):
+        super().__init__((host, port), MetricsHandler)
+        self.registry = registry
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="MetricsServer", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+metrics = MetricsRegistry()
+
+metrics.describe("portal_handshake_seconds", "histogram",
+                 "start_capture() until the portal's Start response (CreateSession, SelectSources, Start).")
+metrics.describe("pipeline_preroll_seconds", "histogram", "GStreamer pipeline set to PLAYING until the first frame.")
+metrics.describe("frame_convert_seconds", "histogram", "Mapping the appsink buffer into a PIL image.")
+metrics.describe("image_encode_seconds", "histogram", "Encoding a frame for the model, by format.")
+metrics.describe("ollama_ttft_seconds", "histogram", "Ollama request until the first token, by kind.")
+metrics.describe("ollama_generation_seconds", "histogram", "Ollama request until the last token, by kind.")
+metrics.describe("mqtt_publish_seconds", "histogram", "Handing a message to the MQTT client, by message class.")
+metrics.describe("queue_wait_seconds", "histogram", "Time spent waiting in a queue before being processed, by queue.")
+metrics.describe("captures_total", "counter", "Screen captures by result.")
+metrics.describe("analyses_total", "counter", "Image analyses by result.")
+metrics.describe("cache_hits_total", "counter", "Work skipped because an earlier result was reused, by cache.")
+metrics.describe("mqtt_connects_total", "counter", "MQTT connection attempts by result (reconnects included).")
+metrics.describe("mqtt_disconnects_total", "counter", "MQTT disconnects, by whether they were expected.")
+metrics.describe("mqtt_publish_errors_total", "counter", "Publishes that raised, by message class.")
+metrics.describe("diff_analyses_total", "counter",
+                 "Diff-mode analyses by outcome (unchanged, regions, full when the change was too large).")
+metrics.describe("memory_reports_total", "counter", "Memory watchdog reports by kind (tracing, growth, shed).")
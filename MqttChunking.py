@@ -0,0 +1,269 @@
+import io
+import time
+import uuid
+import zlib
+import struct
+
+# --- Chunk frame format ---
+# Payloads up to the chunk size are published unchanged, so plain MQTT clients
+# keep working. Larger payloads, and payloads of message classes that opt in to
+# compression (jobs, whose receivers always reassemble), are sent as one or more
+# frames, each starting with this header (big-endian):
+#   magic    4s  b"\x00SEC" (a NUL never starts a text command or JSON)
+#   version  B   FRAME_VERSION
+#   codec    B   CODEC_NONE / CODEC_ZLIB / CODEC_ZSTD, applies to the whole message
+#   msg_id   16s random id shared by all chunks of one message
+#   seq      H   chunk index, 0-based
+#   total    H   number of chunks
+# The receiver concatenates chunks 0..total-1 and then decompresses with codec.
+FRAME_MAGIC = b"\x00SEC"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct(">4sBB16sHH")
+MAX_CHUNKS = 0xFFFF
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODEC_NAMES = {"none": CODEC_NONE, "zlib": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+
+# --- Message classes, each with its own QoS setting ---
+CLASS_OUTPUT = "output"     # Shared output topic (chat lines, status)
+CLASS_RESPONSE = "response" # Per-request responses
+CLASS_CHUNKED = "chunked"   # Minimum QoS for multi-chunk messages: one lost chunk loses all of it
+CLASS_JOB = "job"           # Distributed analysis jobs and their status/results
+DEFAULT_QOS = {CLASS_OUTPUT: 0, CLASS_RESPONSE: 1, CLASS_CHUNKED: 1, CLASS_JOB: 1}
+# Classes compressed even when they would fit in one plain message. Only worker
+# traffic: output, metrics and memory topics have plain subscribers
+DEFAULT_COMPRESS_CLASSES = (CLASS_JOB,)
+
+DEFAULT_CHUNK_SIZE = 32768   # Fits the 128 KB limit of most hosted brokers with room to spare
+DEFAULT_COMPRESS_MIN = 4096  # Below this, compression rarely pays for the frame header
+DEFAULT_REASSEMBLY_TIMEOUT = 30.0
+DEFAULT_MAX_PENDING_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_MESSAGE_BYTES = 64 * 1024 * 1024 # Decompressed size limit: a few KB of zlib can expand to GBs
+MAX_TOPIC_BYTES = 65535
+MQTT_ERR_NO_CONN = 4 # paho's rc for a publish while not connected
+
+
+def _zstd():
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+def codec_from_name(name):
+    """Maps the mqtt_compression setting to a codec, falling back to zlib if zstd is not installed."""
+    codec = CODEC_NAMES.get((name or "none").strip().lower())
+    if codec is None:
+        print(f"Warning: Unknown mqtt_compression '{name}', using zlib.")
+        codec = CODEC_ZLIB
+    if codec == CODEC_ZSTD and _zstd() is None:
+        print("Warning: mqtt_compression = zstd but the 'zstandard' package is not installed, using zlib.")
+        codec = CODEC_ZLIB
+    return codec
+
+
+def compress(data, codec):
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, 6)
+    if codec == CODEC_ZSTD:
+        return _zstd().ZstdCompressor(level=3).compress(data)
+    return data
+
+
+def decompress(data, codec, max_size=DEFAULT_MAX_MESSAGE_BYTES):
+    """Decompresses data, raising ValueError if the result would exceed max_size bytes."""
+    if codec == CODEC_ZLIB:
+        decompressor = zlib.decompressobj()
+        try:
+            result = decompressor.decompress(data, max_size + 1)
+        except zlib.error as e:
+            raise ValueError(f"corrupt zlib message: {e}")
+        if len(result) > max_size or decompressor.unconsumed_tail:
+            raise ValueError(f"message expands beyond {max_size} bytes")
+        if not decompressor.eof:
+            raise ValueError("truncated zlib message")
+        return result
+    if codec == CODEC_ZSTD:
+        zstandard = _zstd()
+        if zstandard is None:
+            raise ValueError("zstd-compressed message but 'zstandard' is not installed")
+        # A stream reader never allocates more than it is asked for, whatever size the frame header claims
+        try:
+            with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)) as reader:
+                result = reader.read(max_size + 1)
+        except zstandard.ZstdError as e:
+            raise ValueError(f"corrupt zstd message: {e}")
+        if len(result) > max_size:
+            raise ValueError(f"message expands beyond {max_size} bytes")
+        return result
+    if codec == CODEC_NONE:
+        if len(data) > max_size:
+            raise ValueError(f"message larger than {max_size} bytes")
+        return data
+    raise ValueError(f"unknown codec {codec}")
+
+
+def is_publish_topic(topic):
+    """True if paho accepts topic for publishing: a non-empty str without wildcards that fits a packet."""
+    return (isinstance(topic, str) and bool(topic) and '+' not in topic and '#' not in topic
+            and len(topic.encode()) <= MAX_TOPIC_BYTES)
+
+
+def is_frame(payload):
+    return payload[:len(FRAME_MAGIC)] == FRAME_MAGIC
+
+
+def encode_frames(payload, chunk_size=DEFAULT_CHUNK_SIZE, codec=CODEC_ZLIB, compress_min=DEFAULT_COMPRESS_MIN,
+                  compress_small=False):
+    """Splits one payload into publishable frames.
+
+    Returns [payload] unchanged when it fits in chunk_size (0 disables
+    chunking), unless compress_small is set: then payloads of compress_min
+    bytes or more are compressed into a frame whenever that makes them smaller.
+    chunk_size is the maximum size of each published frame, header included.
+    """
+    if isinstance(payload, str):
+        payload = payload.encode()
+    if not compress_small and (chunk_size <= 0 or len(payload) <= chunk_size):
+        return [payload]
+    body = payload
+    if codec != CODEC_NONE and len(payload) >= compress_min:
+        packed = compress(payload, codec)
+        if len(packed) + FRAME_HEADER.size < len(payload):
+            body = packed
+        else:
+            codec = CODEC_NONE # Incompressible (e.g. already-encoded images)
+    else:
+        codec = CODEC_NONE
+    if body is payload and (chunk_size <= 0 or len(payload) <= chunk_size):
+        return [payload]
+
+    step = chunk_size - FRAME_HEADER.size if chunk_size > 0 else len(body)
+    if step <= 0:
+        raise ValueError(f"chunk size {chunk_size} is smaller than the frame header")
+    total = max(1, -(-len(body) // step))
+    if total > MAX_CHUNKS:
+        raise ValueError(f"payload of {len(payload)} bytes needs {total} chunks (max {MAX_CHUNKS})")
+    msg_id = uuid.uuid4().bytes
+    return [FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, codec, msg_id, seq, total)
+            + body[seq * step:(seq + 1) * step]
+            for seq in range(total)]
+
+
+class Reassembler:
+    """Collects chunk frames per message id and returns the decoded payload once complete.
+
+    Not thread-safe; feed it from one thread (paho's network thread).
+    """
+
+    def __init__(self, timeout=DEFAULT_REASSEMBLY_TIMEOUT, max_pending_bytes=DEFAULT_MAX_PENDING_BYTES,
+                 max_message_bytes=DEFAULT_MAX_MESSAGE_BYTES):
+        self.timeout = timeout
+        self.max_pending_bytes = max_pending_bytes
+        self.max_message_bytes = max_message_bytes # Limit on the decompressed size of one message
+        self.pending = {} # (topic, msg_id) -> {'codec', 'total', 'parts', 'size', 'started'}
+        self.pending_bytes = 0
+        self.expired = 0
+
+    def add(self, payload, topic=None):
+        """Returns the full payload (bytes), or None while chunks are still missing.
+
+        Non-frame payloads are returned unchanged. Raises ValueError for corrupt frames
+        and for messages that decompress to more than max_message_bytes.
+        """
+        if not is_frame(payload):
+            return payload
+        self.expire()
+        if len(payload) < FRAME_HEADER.size:
+            raise ValueError("truncated chunk header")
+        _, version, codec, msg_id, seq, total = FRAME_HEADER.unpack_from(payload)
+        if version != FRAME_VERSION:
+            raise ValueError(f"unsupported chunk frame version {version}")
+        if total == 0 or seq >= total:
+            raise ValueError(f"bad chunk {seq}/{total}")
+        data = payload[FRAME_HEADER.size:]
+        if total == 1:
+            return decompress(data, codec, self.max_message_bytes)
+
+        key = (topic, msg_id)
+        entry = self.pending.get(key)
+        if entry is None:
+            entry = {'codec': codec, 'total': total, 'parts': {}, 'size': 0, 'started': time.monotonic()}
+            self.pending[key] = entry
+        elif entry['total'] != total or entry['codec'] != codec:
+            self._drop(key)
+            raise ValueError("chunk header does not match earlier chunks of the same message")
+        if seq in entry['parts']:
+            return None # QoS 1 redelivery
+        entry['parts'][seq] = data
+        entry['size'] += len(data)
+        self.pending_bytes += len(data)
+        if self.pending_bytes > self.max_pending_bytes:
+            self._drop_oldest()
+            if key not in self.pending:
+                return None
+        if len(entry['parts']) < total:
+            return None
+        self._drop(key)
+        return decompress(b"".join(entry['parts'][i] for i in range(total)), codec, self.max_message_bytes)
+
+    def expire(self, now=None):
+        """Drops messages whose chunks have not all arrived within the timeout."""
+        now = time.monotonic() if now is None else now
+        for key in [k for k, e in self.pending.items() if now - e['started'] > self.timeout]:
+            entry = self.pending[key]
+            print(f"Dropping incomplete chunked message on {key[0]}: "
+                  f"{len(entry['parts'])}/{entry['total']} chunks after {self.timeout:.0f}s")
+            self._drop(key)
+            self.expired += 1
+
+    def _drop(self, key):
+        entry = self.pending.pop(key, None)
+        if entry:
+            self.pending_bytes -= entry['size']
+
+    def _drop_oldest(self):
+        while self.pending and self.pending_bytes > self.max_pending_bytes:
+            key = min(self.pending, key=lambda k: self.pending[k]['started'])
+            print(f"Reassembly buffer over {self.max_pending_bytes} bytes, dropping message on {key[0]}")
+            self._drop(key)
+
+
+class ChunkedPublisher:
+    """Publishes payloads through a paho client, chunking/compressing as needed and picking QoS by message class."""
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, codec=CODEC_ZLIB, compress_min=DEFAULT_COMPRESS_MIN, qos=None,
+                 compress_classes=DEFAULT_COMPRESS_CLASSES):
+        self.chunk_size = chunk_size
+        self.codec = codec
+        self.compress_min = compress_min
+        self.compress_classes = frozenset(compress_classes)
+        self.qos = dict(DEFAULT_QOS)
+        self.qos.update(qos or {})
+
+    def publish(self, client, topic, payload, message_class=CLASS_OUTPUT, properties=None, single=False, min_qos=0):
+        """Publishes payload; returns the MQTTMessageInfo of each frame sent. Raises on publish errors.
+
+        While the client is disconnected, QoS >= 1 frames are accepted: paho keeps
+        them and sends them after reconnecting. A QoS 0 frame is dropped by paho
+        and raises ConnectionError, so the caller can keep it elsewhere.
+        single=True compresses but never splits, for shared subscriptions where
+        the broker could hand the chunks of one message to different subscribers.
+        """
+        frames = encode_frames(payload, 0 if single else self.chunk_size, self.codec, self.compress_min,
+                               message_class in self.compress_classes)
+        qos = max(self.qos.get(message_class, 0), min_qos)
+        if len(frames) > 1:
+            qos = max(qos, self.qos[CLASS_CHUNKED])
+        infos = []
+        for frame in frames:
+            info = client.publish(topic, frame, qos=qos, properties=properties)
+            if info.rc == MQTT_ERR_NO_CONN and qos == 0:
+                raise ConnectionError(f"MQTT publish to {topic} failed: not connected")
+            if info.rc not in (0, MQTT_ERR_NO_CONN):
+                raise OSError(f"MQTT publish to {topic} failed (rc={info.rc})")
+            infos.append(info)
+        return infos
@@ -0,0 +1,228 @@
+import time
+import sqlite3
+import threading
+
+from Metrics import metrics
+
+DEFAULT_MAX_MESSAGES = 10000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_FLUSH_INTERVAL = 0.2 # Seconds between batched commits
+REPLAY_BATCH = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created REAL NOT NULL,
+    topic TEXT NOT NULL,
+    message_class TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    correlation_data BLOB
+)
+"""
+
+
+class OutboundQueue:
+    """Append-only on-disk queue for MQTT messages that could not be published yet.
+
+    Messages are buffered in memory and committed in batches every
+    flush_interval seconds by a writer thread (sqlite in WAL mode with
+    synchronous=NORMAL, so a commit is an append to the WAL rather than an
+    fsync per message). replay() publishes everything in insertion order and
+    deletes each batch once the MQTT client has taken it. The queue is
+    bounded by max_messages and max_bytes; the oldest messages are dropped first.
+    """
+
+    def __init__(self, path, max_messages=DEFAULT_MAX_MESSAGES, max_bytes=DEFAULT_MAX_BYTES,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.path = path
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(SCHEMA)
+        self.db_lock = threading.Lock()
+        self.lock = threading.Condition()
+        self.buffer = [] # Appended rows not committed yet
+        self.committing = 0 # Flushes that took rows from buffer but have not committed them yet
+        row = self.db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM outbox").fetchone()
+        self.depth, self.depth_bytes = row
+        self.replaying = False
+        self.running = True
+        self.stats = {'queued': 0, 'replayed': 0, 'dropped': 0, 'last_replay_ms': None, 'last_replay_count': 0}
+        self.writer = threading.Thread(target=self._run_writer, name="OutboundQueueWriter", daemon=True)
+        self.writer.start()
+        if self.depth:
+            print(f"Outbound queue {path}: {self.depth} message(s) waiting from a previous run.")
+
+    def has_backlog(self):
+        """True while messages are waiting; new messages must then queue behind them to keep order."""
+        with self.lock:
+            return self.depth > 0 or self.replaying
+
+    def append(self, topic, payload, message_class, correlation_data=None):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        if not isinstance(topic, str) or not isinstance(payload, bytes) \
+                or not isinstance(correlation_data, (bytes, type(None))):
+            raise TypeError("topic must be str, payload and correlation_data bytes")
+        with self.lock:
+            self.buffer.append((time.time(), topic, message_class, payload, correlation_data))
+            self.depth += 1
+            self.depth_bytes += len(payload)
+            self.stats['queued'] += 1
+            self.lock.notify_all() # The writer and a replay waiting on a commit share this condition
+
+    def _run_writer(self):
+        while True:
+            with self.lock:
+                while self.running and not self.buffer:
+                    self.lock.wait()
+                if not self.running and not self.buffer:
+                    return
+            time.sleep(self.flush_interval) # Collect a batch: one commit for everything queued meanwhile
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            rows, self.buffer = self.buffer, []
+            if not rows:
+                return
+            self.committing += 1
+        try:
+            with self.db_lock:
+                try:
+                    self.db.execute("BEGIN")
+                    self.db.executemany("INSERT INTO outbox (created, topic, message_class, payload, correlation_data) "
+                                        "VALUES (?, ?, ?, ?, ?)", rows)
+                    self._enforce_bounds()
+                    self.db.execute("COMMIT")
+                except sqlite3.Error as e:
+                    # Roll back so the next flush can start its own transaction; these rows are lost
+                    if self.db.in_transaction:
+                        self.db.execute("ROLLBACK")
+                    with self.lock:
+                        self.depth -= len(rows)
+                        self.depth_bytes -= sum(len(row[3]) for row in rows)
+                        self.stats['dropped'] += len(rows)
+                    print(f"Outbound queue: could not store {len(rows)} message(s): {e}")
+        finally:
+            with self.lock:
+                self.committing -= 1
+                self.lock.notify_all()
+
+    def _enforce_bounds(self):
+        with self.lock:
+            excess = max(0, self.depth - self.max_messages)
+            over_bytes = self.depth_bytes > self.max_bytes
+        if not excess and not over_bytes:
+            return
+        # Oldest first; walk ids until both limits hold
+        dropped, dropped_bytes, last_id = 0, 0, None
+        with self.lock:
+            depth, depth_bytes = self.depth, self.depth_bytes
+        for row_id, size in self.db.execute("SELECT id, LENGTH(payload) FROM outbox ORDER BY id"):
+            if depth - dropped <= self.max_messages and depth_bytes - dropped_bytes <= self.max_bytes:
+                break
+            dropped += 1
+            dropped_bytes += size
+            last_id = row_id
+        if last_id is not None:
+            self.db.execute("DELETE FROM outbox WHERE id <= ?", (last_id,))
+            with self.lock:
+                self.depth -= dropped
+                self.depth_bytes -= dropped_bytes
+                self.stats['dropped'] += dropped
+            print(f"Outbound queue full, dropped {dropped} oldest message(s).")
+
+    def replay(self, publish):
+        """Publishes all queued messages in order. Runs in a background thread.
+
+        publish(topic, payload, message_class, correlation_data) returns the paho
+        MQTTMessageInfo list for the message. A batch is deleted once its last
+        message is acknowledged, or once the acknowledgement fails: the client
+        then owns the messages and resends them after reconnecting, so keeping
+        them here too would deliver them twice. Messages publish() rejects with
+        ValueError/TypeError (e.g. an invalid topic) can never be sent and are
+        dropped. Stops (keeping the rest) on any other error.
+        """
+        with self.lock:
+            if self.replaying:
+                return
+            self.replaying = True
+        start = time.perf_counter()
+        count = 0
+        try:
+            while True:
+                self.flush()
+                with self.db_lock:
+                    rows = self.db.execute("SELECT id, topic, message_class, payload, correlation_data, created "
+                                           "FROM outbox ORDER BY id LIMIT ?", (REPLAY_BATCH,)).fetchall()
+                if not rows:
+                    with self.lock:
+                        if self.buffer or self.committing:
+                            # Appended meanwhile, or popped by the writer and not committed yet:
+                            # look again once those rows are in the table
+                            self.lock.wait_for(lambda: self.buffer or not self.committing)
+                            continue
+                        # Cleared under the lock, so no append can slip in behind an ended replay
+                        self.replaying = False
+                    break
+                infos, taken, dropped, error = [], [], 0, None
+                now = time.time()
+                for row in rows:
+                    row_id, topic, message_class, payload, correlation_data, created = row
+                    metrics.observe("queue_wait_seconds", max(0.0, now - created), queue="outbox")
+                    try:
+                        infos.extend(publish(topic, payload, message_class, correlation_data))
+                    except (ValueError, TypeError) as e:
+                        # Would fail on every attempt and block everything queued behind it
+                        print(f"Outbound queue: dropping message to {topic!r}: {e}")
+                        dropped += 1
+                    except Exception as e:
+                        error = e # Not taken by the client: this row and the rest stay queued
+                        break
+                    taken.append(row)
+                if infos and error is None:
+                    try:
+                        infos[-1].wait_for_publish(30)
+                        if not infos[-1].is_published():
+                            raise OSError("broker did not acknowledge replayed messages")
+                    except Exception as e: # RuntimeError from paho if the connection dropped
+                        error = e
+                if taken:
+                    with self.db_lock:
+                        self.db.execute("DELETE FROM outbox WHERE id <= ?", (taken[-1][0],))
+                    with self.lock:
+                        self.depth -= len(taken)
+                        self.depth_bytes -= sum(len(row[3]) for row in taken)
+                        self.stats['replayed'] += len(taken) - dropped
+                        self.stats['dropped'] += dropped
+                    count += len(taken) - dropped
+                if error is not None:
+                    raise error
+        except Exception as e:
+            print(f"Outbound queue replay stopped after {count} message(s): {e}")
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            with self.lock:
+                self.replaying = False
+                self.stats['last_replay_ms'] = round(elapsed_ms, 1)
+                self.stats['last_replay_count'] = count
+        if count:
+            print(f"Outbound queue: replayed {count} message(s) in {elapsed_ms:.0f} ms.")
+        return count
+
+    def metrics(self):
+        with self.lock:
+            return dict(self.stats, depth=self.depth, depth_bytes=self.depth_bytes)
+
+    def close(self):
+        with self.lock:
+            self.running = False
+            self.lock.notify_all()
+        self.writer.join(timeout=2)
+        self.flush()
+        with self.db_lock:
+            self.db.close()
@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import queue
+import threading
+
+import numpy as np
+
+# --- On-disk layout (all files share the recall_index_path prefix) ---
+#   <path>.json   {"dim": 768, "model": "nomic-embed-text"}
+#   <path>.f16    row-major float16 matrix, one L2-normalised embedding per row
+#   <path>.jsonl  one metadata object per row, same order
+#   <path>.proj.npz  PCA projection for the coarse search stage, once the index is big enough
+# Appending writes to the end of both files, so the index never needs a rebuild.
+DTYPE = np.float16
+CHUNK_ROWS = 32768  # Rows converted per step when scanning the memory map
+COARSE_DIM = 128    # Dimensions of the resident coarse matrix
+COARSE_MIN_ROWS = 4096 # Below this an exact scan is already fast; the projection is fitted here
+RERANK = 256        # Candidates from the coarse stage rescored exactly (at least 20 * k)
+SNIPPET_CHARS = 500
+
+
+def normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class RecallIndex:
+    """Append-only cosine-similarity index over float16 embeddings.
+
+    The float16 matrix is memory-mapped from disk and only read in full while
+    the index is small. Once it reaches COARSE_MIN_ROWS, a PCA projection to
+    COARSE_DIM dimensions is fitted (once) and a float32 coarse matrix is kept
+    in memory: a search scores every row on that matrix (one BLAS product over
+    ~1/6 of the bytes), then rescores the best RERANK candidates exactly from
+    the memory map. Appends project only the new rows, so nothing is rebuilt.
+    """
+
+    def __init__(self, path):
+        self.vectors_path = path + ".f16"
+        self.meta_path = path + ".jsonl"
+        self.header_path = path + ".json"
+        self.projection_path = path + ".proj.npz"
+        self.lock = threading.Lock()
+        self.dim = None
+        self.model = None
+        self.metadata = []
+        self._map = None
+        self.mean = None       # PCA mean and projection (COARSE_DIM x dim), once fitted
+        self.projection = None
+        self._coarse = None    # Resident coarse matrix, grown by doubling
+        self._coarse_rows = 0
+        if os.path.exists(self.header_path):
+            with open(self.header_path) as f:
+                header = json.load(f)
+            self.dim, self.model = header['dim'], header.get('model')
+            with open(self.meta_path) as f:
+                self.metadata = [json.loads(line) for line in f if line.strip()]
+            rows = os.path.getsize(self.vectors_path) // (self.dim * np.dtype(DTYPE).itemsize)
+            if rows != len(self.metadata):
+                # Interrupted append: keep the rows both files agree on
+                rows = min(rows, len(self.metadata))
+                self._truncate(rows)
+            if os.path.exists(self.projection_path):
+                saved = np.load(self.projection_path)
+                self.mean, self.projection = saved['mean'], saved['projection']
+                self._coarse_append_range(0, rows)
+            else:
+                self._maybe_fit()
+
+    def __len__(self):
+        return len(self.metadata)
+
+    def _truncate(self, rows):
+        self.metadata = self.metadata[:rows]
+        with open(self.vectors_path, 'r+b') as f:
+            f.truncate(rows * self.dim * np.dtype(DTYPE).itemsize)
+        with open(self.meta_path, 'w') as f:
+            f.writelines(json.dumps(m) + "\n" for m in self.metadata)
+
+    def _matrix(self):
+        rows = len(self.metadata)
+        if not rows:
+            return None
+        if self._map is None or self._map.shape[0] != rows:
+            self._map = np.memmap(self.vectors_path, dtype=DTYPE, mode='r', shape=(rows, self.dim))
+        return self._map
+
+    def release(self):
+        """Drops the memory map (reopened by the next search) and the coarse matrix's spare capacity."""
+        with self.lock:
+            self._map = None
+            if self._coarse is not None and len(self._coarse) > self._coarse_rows:
+                self._coarse = self._coarse[:self._coarse_rows].copy()
+
+    def _maybe_fit(self):
+        """Fits the coarse PCA projection once the index is big enough (one-time cost)."""
+        rows = len(self.metadata)
+        if self.projection is not None or rows < COARSE_MIN_ROWS or self.dim <= COARSE_DIM:
+            return
+        sample = np.asarray(self._matrix()[np.linspace(0, rows - 1, min(rows, 8192)).astype(int)], dtype=np.float32)
+        mean = sample.mean(axis=0)
+        _, _, vt = np.linalg.svd(sample - mean, full_matrices=False)
+        self.mean, self.projection = mean, np.ascontiguousarray(vt[:COARSE_DIM])
+        np.savez(self.projection_path, mean=self.mean, projection=self.projection)
+        self._coarse_append_range(0, rows)
+
+    def _coarse_append_range(self, start, end):
+        matrix = self._matrix()
+        for s in range(start, end, CHUNK_ROWS):
+            block = np.asarray(matrix[s:min(end, s + CHUNK_ROWS)], dtype=np.float32)
+            self._coarse_append((block - self.mean) @ self.projection.T)
+
+    def _coarse_append(self, vectors):
+        used = self._coarse_rows
+        needed = used + len(vectors)
+        if self._coarse is None or needed > len(self._coarse):
+            grown = np.empty((max(needed, 2 * (0 if self._coarse is None else len(self._coarse)), 1024),
+                              COARSE_DIM), dtype=np.float32)
+            if used:
+                grown[:used] = self._coarse[:used]
+            self._coarse = grown
+        self._coarse[used:needed] = vectors
+        self._coarse_rows = needed
+
+    def append(self, vectors, metadata, model=None):
+        """Adds embeddings (one row per metadata dict)."""
+        vectors = normalize(vectors)
+        if len(vectors) != len(metadata):
+            raise ValueError("one metadata entry per vector is required")
+        with self.lock:
+            if self.dim is None:
+                self.dim, self.model = vectors.shape[1], model
+                with open(self.header_path, 'w') as f:
+                    json.dump({'dim': self.dim, 'model': model}, f)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"embedding size {vectors.shape[1]} does not match index ({self.dim}); "
+                                 f"was recall_model changed? Remove {self.header_path} to start over.")
+            half = vectors.astype(DTYPE)
+            with open(self.vectors_path, 'ab') as f:
+                f.write(half.tobytes())
+            with open(self.meta_path, 'a') as f:
+                f.writelines(json.dumps(m) + "\n" for m in metadata)
+            self.metadata.extend(metadata)
+            if self.projection is not None:
+                self._coarse_append((half.astype(np.float32) - self.mean) @ self.projection.T)
+            else:
+                self._maybe_fit()
+
+    def search(self, queries, k=5):
+        """Batched top-k cosine search. Returns one [(score, metadata), ...] list per query."""
+        queries = normalize(queries)
+        with self.lock:
+            rows = len(self.metadata)
+            if not rows:
+                return [[] for _ in queries]
+            metadata = self.metadata
+            matrix = self._matrix()
+            coarse = self._coarse[:rows] if self.projection is not None else None
+            projection = self.projection
+        k = min(k, rows)
+        if coarse is None:
+            candidates = None # Small index: exact scan of everything
+        else:
+            scores = coarse @ (queries @ projection.T).T # (rows, queries)
+            want = min(rows, max(RERANK, 20 * k))
+            candidates = np.argpartition(-scores, want - 1, axis=0)[:want]
+        results = []
+        for q in range(len(queries)):
+            if candidates is None:
+                rows_idx = np.arange(rows)
+                exact = np.concatenate([np.asarray(matrix[s:s + CHUNK_ROWS], dtype=np.float32) @ queries[q]
+                                        for s in range(0, rows, CHUNK_ROWS)])
+            else:
+                rows_idx = np.sort(candidates[:, q]) # Sorted for sequential reads from the memory map
+                exact = np.asarray(matrix[rows_idx], dtype=np.float32) @ queries[q]
+            top = np.argsort(-exact)[:k]
+            results.append([(float(exact[i]), metadata[int(rows_idx[i])]) for i in top])
+        return results
+
+
+def ollama_embed(client, model, texts):
+    """Embeds a batch of texts with the Ollama embeddings endpoint."""
+    try:
+        return client.embed(model=model, input=texts)['embeddings']
+    except AttributeError:
+        # ollama-python < 0.3 only has the single-prompt endpoint
+        return [client.embeddings(model=model, prompt=text)['embedding'] for text in texts]
+
+
+class RecallService:
+    """Background thread that embeds new analyses and answers recall queries.
+
+    Jobs waiting at the same time are batched: one embed call for all new
+    texts, one for all queries, and one index search for all queries.
+    """
+
+    def __init__(self, index, get_client, model, top_k=5):
+        self.index = index
+        self.get_client = get_client
+        self.model = model
+        self.top_k = top_k
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="RecallService", daemon=True)
+        self.thread.start()
+
+    def add(self, text, **metadata):
+        metadata.update(created=time.time(), text=text[:SNIPPET_CHARS])
+        self.jobs.put(('add', text, metadata))
+
+    def recall(self, query, callback, k=None):
+        """callback(results or None, error) is called from the service thread."""
+        self.jobs.put(('recall', query, (callback, k or self.top_k)))
+
+    def _run(self):
+        while True:
+            jobs = [self.jobs.get()]
+            while True:
+                try:
+                    jobs.append(self.jobs.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = None in jobs
+            if stopping:
+                jobs = jobs[:jobs.index(None)] # Still index what was queued before stop()
+            adds = [(text, meta) for kind, text, meta in jobs if kind == 'add']
+            recalls = [(query, extra) for kind, query, extra in jobs if kind == 'recall']
+            try:
+                if adds:
+                    vectors = ollama_embed(self.get_client(), self.model, [text for text, _ in adds])
+                    self.index.append(vectors, [meta for _, meta in adds], self.model)
+            except Exception as e:
+                print(f"Error indexing {len(adds)} analysis result(s) for recall: {e}")
+            if recalls:
+                self._answer(recalls)
+            if stopping:
+                return
+
+    def _answer(self, recalls):
+        try:
+            vectors = ollama_embed(self.get_client(), self.model, [query for query, _ in recalls])
+            start = time.perf_counter()
+            k = max(extra[1] for _, extra in recalls)
+            results = self.index.search(vectors, k)
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            print(f"Recall: {len(recalls)} quer(y/ies) over {len(self.index)} entries in {elapsed_ms:.1f} ms") # DEBUG
+            for (query, (callback, want)), found in zip(recalls, results):
+                callback(found[:want], None)
+        except Exception as e:
+            for _, (callback, _) in recalls:
+                callback(None, e)
+
+    def stop(self, timeout=5.0):
+        """Stops after the jobs already queued; waits up to timeout seconds for them to be written."""
+        self.jobs.put(None)
+        self.thread.join(timeout)
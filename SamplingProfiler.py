@@ -0,0 +1,123 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+DEFAULT_SECONDS = 30
+DEFAULT_INTERVAL = 0.01 # 100 samples per second
+THREAD_REFRESH = 50     # Samples between re-reading thread names
+# Innermost frames of threads that are blocked rather than working; the
+# MainApplication module frame is the main thread sitting in the Qt event loop
+IDLE_FUNCTIONS = {"threading.wait", "threading._wait_for_tstate_lock", "selectors.select",
+                  "socketserver.serve_forever", "client._loop", "MainApplication.<module>"}
+
+
+class SamplingProfiler:
+    """Statistical stack sampler over all Python threads, started on demand.
+
+    While running, a daemon thread wakes every `interval` seconds, reads every
+    thread's current frame (sys._current_frames) and counts the stacks. The
+    result is written in the collapsed ("folded") format used by
+    flamegraph.pl, inferno and speedscope: one line per distinct stack,
+    `thread;outer;...;inner count`. Nothing is installed in the other threads
+    (no settrace/setprofile), so there is no cost while it is not running and
+    only the sampling thread's GIL time while it is.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.labels = {} # code object -> "module.function:line"
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    def start(self, seconds, path, on_done, interval=DEFAULT_INTERVAL):
+        """Samples for `seconds`, writes the folded stacks to path, then calls on_done(path, summary, error).
+
+        Returns False if a profile is already being taken. Raises ValueError for a
+        non-finite or non-positive length, which would never end.
+        """
+        if not 0 < seconds < float("inf"):
+            raise ValueError(f"invalid profile length {seconds}")
+        with self.lock:
+            if self.thread is not None:
+                return False
+            self.thread = threading.Thread(target=self._run, args=(seconds, path, on_done, interval),
+                                           name="SamplingProfiler", daemon=True)
+            self.thread.start()
+            return True
+
+    def _label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            module = os.path.splitext(os.path.basename(code.co_filename))[0]
+            label = self.labels[code] = f"{module}.{code.co_name}:{code.co_firstlineno}"
+        return label
+
+    def _run(self, seconds, path, on_done, interval):
+        stacks = Counter()
+        own = threading.get_ident()
+        names = {}
+        samples = 0
+        start = time.perf_counter()
+        deadline = start + seconds
+        cpu_start = time.thread_time()
+        try:
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                if samples % THREAD_REFRESH == 0:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(self._label(frame.f_code))
+                        frame = frame.f_back
+                    stack.append(names.get(ident, f"thread-{ident}"))
+                    stack.reverse()
+                    stacks[";".join(stack)] += 1
+                samples += 1
+                # Sleep to the next tick rather than a fixed interval, so sampling cost doesn't skew the rate
+                time.sleep(max(0.0, interval - (time.perf_counter() - now)))
+            elapsed = time.perf_counter() - start
+            overhead = time.thread_time() - cpu_start
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path, "w") as f:
+                for stack, count in sorted(stacks.items()):
+                    f.write(f"{stack} {count}\n")
+            summary = {'samples': samples, 'stacks': len(stacks), 'seconds': round(elapsed, 2),
+                       'sampler_cpu_ms': round(overhead * 1000.0, 1), 'hottest': top_functions(stacks)}
+            error = None
+        except Exception as e:
+            summary, error = None, e
+        finally:
+            with self.lock:
+                self.thread = None
+        on_done(path, summary, error)
+
+
+def top_functions(stacks, limit=5, skip_idle=True):
+    """Returns [(function, share of samples)] for the innermost frames, busiest first.
+
+    Threads parked in a wait (IDLE_FUNCTIONS: lock waits, select, the Qt loop) are left out
+    when skip_idle is set, since they dominate every profile otherwise.
+    """
+    leaves = Counter()
+    for stack, count in stacks.items():
+        leaf = stack.rsplit(";", 1)[-1]
+        if skip_idle and leaf.split(":", 1)[0] in IDLE_FUNCTIONS:
+            continue
+        leaves[leaf] += count
+    total = sum(leaves.values()) or 1
+    return [(leaf, round(count / total, 3)) for leaf, count in leaves.most_common(limit)]
+
+
+profiler = SamplingProfiler()
@@ -1,7 +1,11 @@
 import os
 import uuid
 import time
+import threading
 # --- Use Gio directly ---
+import gi
+gi.require_version('Gst', '1.0')
+gi.require_version('GstBase', '1.0')
 from gi.repository import GLib, Gst, GObject, Gio
 # --- Remove dasbus/pydbus imports ---
 # from dasbus.connection import SessionMessageBus
@@ -10,9 +14,12 @@ from gi.repository import GLib, Gst, GObject, Gio
 from PyQt5.QtCore import QObject, pyqtSignal, QTimer
 from PIL import Image
 import traceback
+from Metrics import metrics
+from TraceRecorder import tracer, traced
 
-# Initialize GStreamer
+# Initialize GStreamer (only here; this module is imported on first capture)
 Gst.init(None)
+print("GStreamer initialized successfully.")
 
 # --- Portal Constants ---
 PORTAL_BUS_NAME = "org.freedesktop.portal.Desktop"
@@ -20,16 +27,21 @@ PORTAL_OBJECT_PATH = "/org/freedesktop/portal/desktop"
 PORTAL_IFACE_SCREENCAST = "org.freedesktop.portal.ScreenCast"
 PORTAL_IFACE_REQUEST = "org.freedesktop.portal.Request"
 PORTAL_IFACE_SESSION = "org.freedesktop.portal.Session"
+# GStreamer source for the portal's stream; {node}, {width} and {height} come from the Start response.
+# Test harnesses (benchmarks/portal_capture.py) substitute e.g. videotestsrc here.
+PIPEWIRE_SOURCE = "pipewiresrc path={node}"
 # --- Remove dasbus XML Interface Definitions ---
 
 
 class ScreenCastHandler(QObject):
     capture_successful = pyqtSignal(object) # Emits PIL Image
+    clip_successful = pyqtSignal(object)    # Emits the ClipBuffer of a clip capture
     capture_failed = pyqtSignal(str)
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, source_template=PIPEWIRE_SOURCE):
         super().__init__(parent)
         self.portal_bus_name = PORTAL_BUS_NAME
+        self.source_template = source_template
         self.portal_proxy = None
         self.connection = None
         self.signal_subscription_id = 0 # Store Gio signal subscription ID
@@ -70,9 +82,22 @@ class ScreenCastHandler(QObject):
         self.session_object_path = None
         self.request_object_path = None
         self.pipewire_node_id = None
+        self.stream_size = None # (width, height) reported by the portal, if any
         self.pipeline = None
         self.appsink = None
         self.source = None
+        self.capture_started = None # perf_counter stamps for the capture metrics
+        self.playing_requested = None
+        self.capture_counter = 0
+        self.capture_id = None      # Trace id of the current/last capture
+        self.capture_traced = False # Async "capture" span still open
+        self.clip = None            # ClipBuffer being filled by a clip capture (see start_clip)
+        self.clip_mode = False
+        self.clip_seconds = 0
+        self.clip_interval = 0
+        self.clip_last = 0
+        self.clip_timeout_id = 0
+        self.clip_lock = threading.Lock() # Frames are added on the streaming thread
 
         print("ScreenCastHandler initialized (using Gio).")
 
@@ -86,7 +111,18 @@ class ScreenCastHandler(QObject):
         return f"sauroneye_sess_{os.getpid()}_{self.session_token_counter}"
 
     # --- Start Capture Process ---
-    def start_capture(self):
+    def start_clip(self, clip, seconds, fps):
+        """Records a clip instead of a single frame: fps frames per second for `seconds`, into clip.
+
+        Frames are reduced to clip.max_side as they arrive; clip_successful is
+        emitted with the filled ClipBuffer once the time is up.
+        """
+        self.clip_seconds = seconds
+        self.clip_interval = 1.0 / fps if fps > 0 else 0
+        self.start_capture(clip)
+
+    @traced("capture.start", "capture_id")
+    def start_capture(self, clip=None):
         """Initiates the screen capture process via the portal."""
         print("Starting screen capture process...") # DEBUG
 
@@ -102,6 +138,16 @@ class ScreenCastHandler(QObject):
         self.session_object_path = None
         self.request_object_path = None
         self.pipewire_node_id = None
+        self.capture_started = time.perf_counter()
+        self.playing_requested = None
+        self.capture_counter += 1
+        self.capture_id = f"capture-{os.getpid()}-{self.capture_counter}"
+        self.capture_traced = True
+        tracer.begin("capture", self.capture_id, clip=clip is not None)
+        with self.clip_lock:
+            self.clip = clip
+        self.clip_mode = clip is not None
+        self.clip_last = 0
         if self.pipeline:
              print("Stopping lingering pipeline before new capture.")
              try:
@@ -178,6 +224,7 @@ class ScreenCastHandler(QObject):
             self.cleanup()
 
     # --- Gio Signal Callback ---
+    @traced("portal.response", "capture_id")
     def _on_portal_response_gio(self, connection, sender_name, object_path, interface_name, signal_name, parameters, user_data):
         """Callback for the portal's Response signal connected via Gio."""
         print(f"Gio Signal: sender='{sender_name}', object='{object_path}', iface='{interface_name}', signal='{signal_name}'") # DEBUG
@@ -264,6 +311,8 @@ class ScreenCastHandler(QObject):
 
             elif 'streams' in results: # Response from Start
                 print("Start successful. Received streams.") # DEBUG
+                if self.capture_started is not None:
+                    metrics.observe("portal_handshake_seconds", time.perf_counter() - self.capture_started)
                 streams = results.get('streams', []) # Should be list of tuples [(uint32, dict), ...]
                 if not streams:
                     print("Error: No streams found in portal response.") # DEBUG
@@ -285,7 +334,7 @@ class ScreenCastHandler(QObject):
                      return
 
                 print(f"PipeWire Node ID: {self.pipewire_node_id}") # DEBUG
-                # You can optionally print properties from stream_props if needed
+                self.stream_size = stream_props.get('size') if isinstance(stream_props, dict) else None
                 # print(f"Stream Properties: {stream_props}")
 
                 # 4. Setup GStreamer pipeline
@@ -343,6 +392,7 @@ class ScreenCastHandler(QObject):
 
 
     # --- GStreamer Pipeline Setup and Handling (remains the same) ---
+    @traced("gst.setup", "capture_id")
     def _setup_and_run_gstreamer(self):
         print("Setting up GStreamer pipeline...") # DEBUG
         if not self.pipewire_node_id:
@@ -350,8 +400,10 @@ class ScreenCastHandler(QObject):
             self.cleanup()
             return
         try:
+            width, height = self.stream_size or (0, 0)
+            source = self.source_template.format(node=self.pipewire_node_id, width=width, height=height)
             pipeline_str = (
-                f"pipewiresrc path={self.pipewire_node_id} ! "
+                f"{source} ! "
                 "videoconvert ! "
                 "video/x-raw,format=RGB ! "
                 "appsink name=sink emit-signals=true max-buffers=1 drop=true"
@@ -367,6 +419,9 @@ class ScreenCastHandler(QObject):
             bus.connect("message::error", self._on_gst_error)
             bus.connect("message::eos", self._on_gst_eos)
             print("Starting GStreamer pipeline...") # DEBUG
+            self.playing_requested = time.perf_counter()
+            if self.clip_mode:
+                self.clip_timeout_id = GLib.timeout_add(int(self.clip_seconds * 1000), self._finish_clip)
             ret = self.pipeline.set_state(Gst.State.PLAYING)
             if ret == Gst.StateChangeReturn.FAILURE:
                 print("Error: Unable to set the pipeline to the playing state.") # DEBUG
@@ -383,6 +438,7 @@ class ScreenCastHandler(QObject):
             self.cleanup()
 
     # --- _on_new_sample, _on_gst_error, _on_gst_eos (remain the same) ---
+    @traced("gst.new_sample", "capture_id")
     def _on_new_sample(self, appsink_param): # Rename param to avoid confusion with self.appsink
         """Callback for the 'new-sample' signal from appsink."""
         # --- Debug Prints ---
@@ -406,6 +462,11 @@ class ScreenCastHandler(QObject):
 
         # --- Sample processing logic remains the same ---
         if sample:
+            if self.playing_requested is not None:
+                metrics.observe("pipeline_preroll_seconds", time.perf_counter() - self.playing_requested)
+                self.playing_requested = None
+            if self.clip_mode:
+                return self._on_clip_sample(sample)
             try:
                 # Check if the returned object is actually a Gst.Sample
                 if not isinstance(sample, Gst.Sample):
@@ -414,23 +475,11 @@ class ScreenCastHandler(QObject):
                     self.cleanup()
                     return Gst.FlowReturn.ERROR
 
-                buffer = sample.get_buffer()
-                caps = sample.get_caps()
-                structure = caps.get_structure(0)
-                width = structure.get_value("width")
-                height = structure.get_value("height")
-                success, map_info = buffer.map(Gst.MapFlags.READ)
-                if not success: raise RuntimeError("Could not map GStreamer buffer")
-                expected_size = width * height * 3
-                if map_info.size < expected_size:
-                    print(f"Warning: Buffer size ({map_info.size}) < expected ({expected_size}).")
-                    buffer.unmap(map_info)
-                    self.capture_failed.emit("Received incomplete frame buffer.")
-                    self.cleanup(); return Gst.FlowReturn.ERROR
-                image = Image.frombytes("RGB", (width, height), map_info.data[:expected_size])
-                buffer.unmap(map_info)
-                print(f"Frame captured successfully ({width}x{height}).") # DEBUG
-                self.capture_successful.emit(image.copy())
+                convert_start = time.perf_counter()
+                image = self._sample_to_image(sample)
+                metrics.observe("frame_convert_seconds", time.perf_counter() - convert_start)
+                print(f"Frame captured successfully ({image.size[0]}x{image.size[1]}).") # DEBUG
+                self.capture_successful.emit(image)
             except Exception as e:
                 print(f"Error processing GStreamer sample: {e}") # DEBUG
                 traceback.print_exc()
@@ -450,8 +499,69 @@ class ScreenCastHandler(QObject):
         # Return OK if we pulled a sample but didn't hit the finally block (shouldn't happen here)
         return Gst.FlowReturn.OK
 
+    def _sample_to_image(self, sample):
+        """Copies an RGB Gst.Sample into a PIL image."""
+        buffer = sample.get_buffer()
+        structure = sample.get_caps().get_structure(0)
+        width = structure.get_value("width")
+        height = structure.get_value("height")
+        success, map_info = buffer.map(Gst.MapFlags.READ)
+        if not success: raise RuntimeError("Could not map GStreamer buffer")
+        try:
+            expected_size = width * height * 3
+            if map_info.size < expected_size:
+                print(f"Warning: Buffer size ({map_info.size}) < expected ({expected_size}).")
+                raise RuntimeError("Received incomplete frame buffer.")
+            # frombytes copies, so the image outlives the mapping
+            return Image.frombytes("RGB", (width, height), map_info.data[:expected_size])
+        finally:
+            buffer.unmap(map_info)
+
+    def _on_clip_sample(self, sample):
+        """Adds a reduced frame to the clip, at most one per clip_interval. Runs on the streaming thread."""
+        now = time.monotonic()
+        if self.clip_last and now - self.clip_last < self.clip_interval:
+            return Gst.FlowReturn.OK # Skipped without converting
+        try:
+            convert_start = time.perf_counter()
+            image = self._sample_to_image(sample)
+            with self.clip_lock:
+                if self.clip is None: # Finished meanwhile
+                    return Gst.FlowReturn.EOS
+                factor = -(-max(image.size) // self.clip.max_side)
+                if factor > 1:
+                    image = image.reduce(factor) # Box filter in C, much cheaper than resize()
+                self.clip.add(image, now)
+            self.clip_last = now
+            metrics.observe("frame_convert_seconds", time.perf_counter() - convert_start)
+            return Gst.FlowReturn.OK
+        except Exception as e:
+            print(f"Error processing GStreamer sample: {e}") # DEBUG
+            traceback.print_exc()
+            self.capture_failed.emit(f"Failed to process frame: {e}")
+            self.cleanup()
+            return Gst.FlowReturn.ERROR
+
+    def _finish_clip(self):
+        """GLib timeout at the end of a clip: stops the capture and emits the recorded frames."""
+        self.clip_timeout_id = 0
+        with self.clip_lock:
+            clip, self.clip = self.clip, None
+        if clip is None:
+            return False
+        if self.pipeline:
+            self.pipeline.set_state(Gst.State.NULL)
+        if len(clip):
+            print(f"Clip captured: {len(clip)} frames, {clip.bytes / 1048576:.1f} MB.") # DEBUG
+            self.clip_successful.emit(clip)
+        else:
+            self.capture_failed.emit("No frames arrived during the clip.")
+        self.cleanup()
+        return False # GLib.SOURCE_REMOVE
+
     def _on_gst_error(self, bus, message):
         err, debug = message.parse_error()
+        tracer.instant("gst.error", self.capture_id, error=str(err))
         print(f"GStreamer Error: {err}, {debug}") # DEBUG
         self.capture_failed.emit(f"GStreamer error: {err}")
         self.cleanup()
@@ -462,13 +572,24 @@ class ScreenCastHandler(QObject):
 
 
     # --- Cleanup Method (Updated for Gio) ---
+    @traced("capture.cleanup", "capture_id")
     def cleanup(self):
         """Cleans up GStreamer pipeline and portal session."""
         print("Cleaning up ScreenCastHandler resources...") # DEBUG
+        if self.capture_traced:
+            self.capture_traced = False
+            tracer.end("capture", self.capture_id)
 
         # --- Unsubscribe signal handler ---
         self._unsubscribe_signal()
 
+        # --- Drop an unfinished clip ---
+        if self.clip_timeout_id:
+            GLib.source_remove(self.clip_timeout_id)
+            self.clip_timeout_id = 0
+        with self.clip_lock:
+            self.clip = None
+
         # --- Stop GStreamer pipeline (remains the same) ---
         if hasattr(self, 'pipeline') and self.pipeline:
             print("Setting pipeline state to NULL.") # DEBUG
@@ -489,17 +610,11 @@ class ScreenCastHandler(QObject):
                  print("Warning: No DBus connection available to close session.")
             else:
                 try:
-                    # Create a temporary proxy for the session object
-                    session_proxy = Gio.DBusProxy.new_sync(
-                        self.connection, Gio.DBusProxyFlags.NONE, None,
-                        self.portal_bus_name, current_session_path, PORTAL_IFACE_SESSION, None
-                    )
-                    if session_proxy:
-                        # Close takes no arguments (pass None) and returns nothing
-                        session_proxy.call_sync("Close", None, Gio.DBusCallFlags.NONE, -1, None)
-                        print("Portal session Close called via Gio.") # DEBUG
-                    else:
-                        print(f"Warning: Failed to create proxy for session {current_session_path} to close it.")
+                    # Call Close on the connection directly: a throwaway DBusProxy per capture
+                    # costs a property round-trip and a GObject that lingers until collected
+                    self.connection.call_sync(self.portal_bus_name, current_session_path, PORTAL_IFACE_SESSION,
+                                              "Close", None, None, Gio.DBusCallFlags.NONE, -1, None)
+                    print("Portal session Close called via Gio.") # DEBUG
                 except GLib.Error as e: # Catch Gio/GLib errors
                      # Handle specific errors, e.g., session already closed or object path invalid
                      print(f"GLib Error closing portal session {current_session_path}: {e.message}")
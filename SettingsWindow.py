@@ -1,5 +1,6 @@
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
-                             QPushButton, QComboBox, QSpinBox, QDialogButtonBox, QDialog) # Add QDialog
+                             QPushButton, QComboBox, QSpinBox, QDialogButtonBox, QDialog, # Add QDialog
+                             QCheckBox)
 from PyQt5.QtCore import pyqtSlot, QTimer
 
 class SettingsWindow(QDialog):
@@ -66,6 +67,10 @@ class SettingsWindow(QDialog):
         self.llm_type_combo.addItems(["Local Ollama", "Other Option"]) # Add relevant options
         layout.addWidget(self.llm_type_label)
         layout.addWidget(self.llm_type_combo)
+
+        # Auto Start
+        self.auto_start_checkbox = QCheckBox("Skip this dialog on next launch if settings are valid")
+        layout.addWidget(self.auto_start_checkbox)
         # --- End of field setup ---
 
         # --- Add a single QPushButton ---
@@ -93,6 +98,8 @@ class SettingsWindow(QDialog):
         self.ollama_model_input.setText(self.current_settings.get('ollama_model', ''))
         self.ollama_prompt_input.setText(self.current_settings.get('ollama_prompt', 'Describe this image.'))
         self.llm_type_combo.setCurrentText(self.current_settings.get('llm_type', 'Local Ollama'))
+        auto_start = str(self.current_settings.get('auto_start', 'false')).strip().lower()
+        self.auto_start_checkbox.setChecked(auto_start in ('1', 'true', 'yes', 'on'))
 
     @pyqtSlot()
     def accept_settings(self):
@@ -104,7 +111,8 @@ class SettingsWindow(QDialog):
             'ollama_server': self.ollama_server_input.text(),
             'ollama_model': self.ollama_model_input.text(),
             'ollama_prompt': self.ollama_prompt_input.text(),
-            'llm_type': self.llm_type_combo.currentText()
+            'llm_type': self.llm_type_combo.currentText(),
+            'auto_start': 'true' if self.auto_start_checkbox.isChecked() else 'false'
         }
         print("Gathered settings:", self.updated_settings) # DEBUG
         # Call QDialog's accept() method to close the dialog with Accepted status
@@ -0,0 +1,90 @@
+import os
+import time
+import json
+import threading
+
+
+def process_age_seconds():
+    """Returns how long ago this process was started, or None if unknown."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Field 22 (starttime) is in clock ticks since boot; skip past the comm field
+            fields = f.read().rsplit(")", 1)[1].split()
+        start_ticks = int(fields[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except Exception:
+        return None
+
+
+class StartupTimer:
+    """Records named startup phases and reports time from launch to ready-for-capture."""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        # Time spent in the interpreter before this module was imported
+        self.pre_import = process_age_seconds()
+        self.phases = [] # List of (name, perf_counter timestamp, idle)
+        self.reported = False
+        self._lock = threading.Lock()
+
+    def mark(self, phase, idle=False):
+        """Records the end of a startup phase. Safe to call from any thread.
+
+        Idle phases (e.g. waiting for the user in a dialog) are reported but
+        not counted towards launch-to-ready time.
+        """
+        with self._lock:
+            if not self.reported:
+                self.phases.append((phase, time.perf_counter(), idle))
+
+    def has(self, phase):
+        return any(name == phase for name, _, _ in self.phases)
+
+    def summary(self):
+        """Returns a dict with per-phase durations and totals in milliseconds."""
+        with self._lock:
+            phases = list(self.phases)
+        durations = []
+        previous = self.t0
+        total_ms = 0.0
+        for name, stamp, idle in phases:
+            ms = (stamp - previous) * 1000.0
+            durations.append((name, ms))
+            if not idle:
+                total_ms += ms
+            previous = stamp
+        pre_ms = (self.pre_import or 0.0) * 1000.0
+        return {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'interpreter_ms': round(pre_ms, 1),
+            'phases_ms': {name: round(ms, 1) for name, ms in durations},
+            'total_ms': round(total_ms, 1),
+            'launch_to_ready_ms': round(pre_ms + total_ms, 1),
+        }
+
+    def report(self, log_path=None):
+        """Prints the startup report once and optionally appends it to a JSON-lines log."""
+        with self._lock:
+            if self.reported:
+                return None
+            self.reported = True
+        summary = self.summary()
+        print("--- Startup timing ---")
+        if self.pre_import is not None:
+            print(f"  {'interpreter':<20} {summary['interpreter_ms']:>8.1f} ms")
+        for name, ms in summary['phases_ms'].items():
+            print(f"  {name:<20} {ms:>8.1f} ms")
+        print(f"  {'launch to ready':<20} {summary['launch_to_ready_ms']:>8.1f} ms")
+        print("----------------------")
+        if log_path:
+            try:
+                log_dir = os.path.dirname(log_path)
+                if log_dir:
+                    os.makedirs(log_dir, exist_ok=True)
+                with open(log_path, 'a') as f:
+                    f.write(json.dumps(summary) + "\n")
+            except Exception as e:
+                print(f"Error writing startup log {log_path}: {e}")
+        return summary
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import functools
+import threading
+from collections import deque
+
+DEFAULT_CAPACITY = 65536 # Events kept; the oldest are overwritten
+DEFAULT_SECONDS = 30
+
+
+class _NullSpan:
+    """Returned by span() while tracing is disabled."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def annotate(self, trace_id=None, **args):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("recorder", "name", "trace_id", "args", "start")
+
+    def __init__(self, recorder, name, trace_id, args):
+        self.recorder = recorder
+        self.name = name
+        self.trace_id = trace_id
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = f"{exc_type.__name__}: {exc}"
+        self.recorder._record("X", self.name, self.start, time.perf_counter_ns() - self.start,
+                              self.trace_id, self.args)
+        return False
+
+    def annotate(self, trace_id=None, **args):
+        """Sets the correlation id(s) once known (e.g. after parsing a command) and adds args."""
+        if trace_id is not None:
+            self.trace_id = trace_id
+        self.args.update(args)
+
+
+class TraceRecorder:
+    """Records spans per thread into a fixed-size ring and exports them as Chrome trace-event JSON.
+
+    A span is one tuple appended under a lock when it ends (about a
+    microsecond), so the recorder stays on. Spans carry a trace id, usually
+    a request or capture id, or a tuple of ids for work shared by several
+    requests. The export links spans with the same id across threads by
+    flow arrows, so Perfetto (ui.perfetto.dev) or chrome://tracing shows how
+    a capture hopped from the portal callbacks to the analysis threads.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, enabled=True):
+        self.lock = threading.Lock()
+        # (phase, name, ts_ns, dur_ns, tid, trace_id, args, thread name). The name is kept per event:
+        # threads come and go (one per analysis) and Linux reuses native ids
+        self.events = deque(maxlen=capacity)
+        self.enabled = enabled
+        self.pid = os.getpid()
+
+    def configure(self, capacity=None, enabled=None):
+        with self.lock:
+            if capacity and capacity != self.events.maxlen:
+                self.events = deque(self.events, maxlen=capacity)
+            if enabled is not None:
+                self.enabled = enabled
+
+    def span(self, name, trace_id=None, **args):
+        """Context manager recording a complete event for its block."""
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name, trace_id, args)
+
+    def instant(self, name, trace_id=None, **args):
+        if self.enabled:
+            self._record("i", name, time.perf_counter_ns(), 0, trace_id, args)
+
+    def begin(self, name, trace_id, **args):
+        """Starts an async span that may end on another thread (see end())."""
+        if self.enabled:
+            self._record("b", name, time.perf_counter_ns(), 0, trace_id, args)
+
+    def end(self, name, trace_id, **args):
+        if self.enabled:
+            self._record("e", name, time.perf_counter_ns(), 0, trace_id, args)
+
+    def _record(self, phase, name, ts, dur, trace_id, args):
+        tid = threading.get_native_id()
+        thread = threading.current_thread().name
+        with self.lock:
+            self.events.append((phase, name, ts, dur, tid, trace_id, args, thread))
+
+    def export(self, seconds=None):
+        """Returns the events of the last `seconds` (all if None) as a Chrome trace-event dict."""
+        with self.lock:
+            events = list(self.events)
+        now = time.perf_counter_ns()
+        if seconds:
+            cutoff = now - int(seconds * 1e9)
+            events = [e for e in events if e[2] + e[3] >= cutoff]
+        trace = [{"ph": "M", "name": "process_name", "pid": self.pid, "tid": 0, "args": {"name": "SauronEye"}}]
+        threads = {} # tid -> names of the threads that had it in this window, oldest first
+        for e in events:
+            names = threads.setdefault(e[4], [])
+            if e[7] not in names:
+                names.append(e[7])
+        for tid, names in sorted(threads.items()):
+            trace.append({"ph": "M", "name": "thread_name", "pid": self.pid, "tid": tid,
+                          "args": {"name": " / ".join(names)}})
+        flows = {} # trace id -> [(ts, tid)] of its complete spans
+        for phase, name, ts, dur, tid, trace_id, args, _ in events:
+            event = {"ph": phase, "name": name, "cat": name.split(".", 1)[0], "ts": ts / 1000.0,
+                     "pid": self.pid, "tid": tid}
+            ids = trace_id if isinstance(trace_id, tuple) else (trace_id,) if trace_id is not None else ()
+            ids = [str(i) for i in ids if i is not None]
+            if args or ids:
+                event["args"] = dict(args, **({"trace_id": ",".join(ids)} if ids else {}))
+            if phase == "X":
+                event["dur"] = dur / 1000.0
+                for i in ids:
+                    flows.setdefault(i, []).append((ts, tid))
+            elif phase == "i":
+                event["s"] = "t"
+            else:
+                event["id"] = ids[0] if ids else name
+            trace.append(event)
+        for number, (trace_id, points) in enumerate(sorted(flows.items()), 1):
+            if len(points) < 2:
+                continue
+            points.sort()
+            for index, (ts, tid) in enumerate(points):
+                phase = "s" if index == 0 else "f" if index == len(points) - 1 else "t"
+                # bp=e binds each arrow end to the span enclosing ts on that thread
+                trace.append({"ph": phase, "name": trace_id, "cat": "flow", "id": number, "bp": "e",
+                              "ts": ts / 1000.0, "pid": self.pid, "tid": tid})
+        return {"traceEvents": trace, "displayTimeUnit": "ms",
+                "otherData": {"exported": time.strftime('%Y-%m-%dT%H:%M:%S'),
+                              # Wall clock at trace time 0 (timestamps are perf_counter based)
+                              "clock_offset_s": time.time() - now / 1e9,
+                              "seconds": seconds, "capacity": self.events.maxlen}}
+
+    def dump(self, path, seconds=None):
+        """Writes export(seconds) to path; returns the number of recorded events written."""
+        data = self.export(seconds)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(data, f)
+        return sum(1 for e in data["traceEvents"] if e["ph"] in ("X", "i", "b", "e"))
+
+
+tracer = TraceRecorder()
+
+
+def traced(name, id_attr=None):
+    """Method decorator: records a span named name, with getattr(self, id_attr) as trace id.
+
+    The id is read when the method returns, so a method that starts a new
+    capture is recorded under the new id.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if not tracer.enabled:
+                return func(self, *args, **kwargs)
+            with tracer.span(name) as span:
+                try:
+                    return func(self, *args, **kwargs)
+                finally:
+                    if id_attr:
+                        span.annotate(trace_id=getattr(self, id_attr, None))
+        return wrapper
+    return decorate
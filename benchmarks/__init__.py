@@ -0,0 +1 @@
+"""Benchmarks for SauronEye's own overhead. Run modules from the repository root with `python -m benchmarks.<name>`."""
@@ -0,0 +1,416 @@
+"""Input-path latency: KeyboardListener's grab-and-forward loop and command publishing.
+
+Feeds synthetic or recorded key events into a real DeviceManager/PassthroughEngine
+(autoscan off, so no real keyboard is touched) and times each forwarded frame
+from injection until it can be read from the pass-through output, plus the
+key-to-publish latency of intercepted commands. Two devices are available:
+
+    fake     in-memory: events arrive through a pipe, forwarded frames go to a pipe
+             instead of uinput. No root needed.
+    uinput   loopback: a uinput source device and the real uinput pass-through
+             device, which is grabbed by the harness so the desktop never sees
+             the typing. Needs root and /dev/uinput.
+
+Commands go to an in-process fake transport by default, which can simulate a
+broker outage (--outage START,SECONDS); --transport mqtt/unix uses the real ones.
+
+    python -m benchmarks.input_path --rates 8,60,0 --keys 300 --json input.json
+    python -m benchmarks.input_path --rates 30 --keys 600 --command-every 10 --outage 5,8
+    sudo python -m benchmarks.input_path --device uinput --rates 0
+    sudo python -m benchmarks.input_path --record typing.jsonl --source /dev/input/event3 --seconds 30
+    python -m benchmarks.input_path --replay typing.jsonl
+"""
+import os
+import json
+import time
+import argparse
+import selectors
+import threading
+from collections import deque
+
+import evdev
+from evdev import ecodes
+
+import KeyboardListener
+from KeyboardListener import INPUT_EVENT, DeviceManager, CommandPublisher
+from KeyBindings import MODE_PRESS
+from CommandTransport import CommandTransport, create_command_transport
+from benchmarks.stats import summarize, print_summary, write_json
+
+TYPING_KEYS = [ecodes.KEY_A + i for i in range(10)] + [ecodes.KEY_SPACE, ecodes.KEY_E, ecodes.KEY_T]
+READ_CHUNK = INPUT_EVENT.size * 256
+
+
+class FakeInputDevice:
+    """Looks enough like evdev.InputDevice for DeviceManager; events are written into a pipe."""
+
+    def __init__(self, keys, name="SauronEye bench keyboard"):
+        self.fd, self.write_fd = os.pipe()
+        os.set_blocking(self.fd, False)
+        self.name = name
+        self.path = "fake:bench"
+        self.keys = list(keys)
+
+    def capabilities(self):
+        return {ecodes.EV_KEY: self.keys, ecodes.EV_MSC: [ecodes.MSC_SCAN]}
+
+    def grab(self):
+        pass
+
+    def ungrab(self):
+        pass
+
+    def read(self):
+        data = os.read(self.fd, READ_CHUNK) # BlockingIOError when empty, like evdev
+        for offset in range(0, len(data) - INPUT_EVENT.size + 1, INPUT_EVENT.size):
+            sec, usec, etype, code, value = INPUT_EVENT.unpack_from(data, offset)
+            yield evdev.InputEvent(sec, usec, etype, code, value)
+
+    def write_frame(self, events, now):
+        sec, usec = int(now), int((now % 1) * 1e6)
+        os.write(self.write_fd, b"".join(INPUT_EVENT.pack(sec, usec, *event) for event in events))
+
+    def close(self):
+        for fd in (self.fd, self.write_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.fd = self.write_fd = -1
+
+
+class PipeSink:
+    """Stands in for the uinput pass-through device: frames written to fd come out of read_fd."""
+
+    def __init__(self):
+        self.read_fd, self.fd = os.pipe()
+
+    def close(self):
+        os.close(self.fd)
+
+
+class UInputSource:
+    """A uinput keyboard used as the grabbed source device (loopback mode)."""
+
+    def __init__(self, keys):
+        self.uinput = evdev.UInput({ecodes.EV_KEY: list(keys), ecodes.EV_MSC: [ecodes.MSC_SCAN]},
+                                   name="SauronEye bench source")
+        time.sleep(0.2) # Let udev create the event node
+        self.device = evdev.InputDevice(self.uinput.device.path)
+
+    def write_frame(self, events, now):
+        # The kernel stamps uinput events itself; now is only used by FakeInputDevice
+        for etype, code, value in events:
+            self.uinput.write(etype, code, value)
+
+    def close(self):
+        self.uinput.close()
+
+
+class FakeTransport(CommandTransport):
+    """In-process command transport whose 'broker' can be taken down and brought back."""
+
+    name = "fake"
+
+    def __init__(self):
+        self.up = threading.Event()
+        self.up.set()
+        self.delivered = 0
+
+    def wait_ready(self, timeout):
+        return self.up.wait(timeout)
+
+    def send(self, message):
+        if not self.up.is_set():
+            raise OSError("broker unavailable")
+        self.delivered += 1
+
+
+class Outage:
+    """Broker-down window relative to the scenario start (time.time() clock)."""
+
+    def __init__(self, spec):
+        self.start, self.duration = (float(v) for v in spec.split(",")) if spec else (None, 0.0)
+        self.begin = self.end = None
+
+    def schedule(self, transport, t0):
+        if self.start is None:
+            return
+        self.begin, self.end = t0 + self.start, t0 + self.start + self.duration
+        for delay, action in ((self.start, transport.up.clear), (self.start + self.duration, transport.up.set)):
+            timer = threading.Timer(delay, action)
+            timer.daemon = True
+            timer.start()
+
+    def contains(self, t):
+        return self.begin is not None and self.begin <= t < self.end
+
+
+class LatencyLog:
+    """Replaces a LatencyStats to keep every sample, tagged with whether its event fell in the outage."""
+
+    def __init__(self, outage):
+        self.outage = outage
+        self.samples = {'all': [], 'outage': [], 'normal': []}
+
+    def record(self, ms):
+        self.samples['all'].append(ms)
+        event_time = time.time() - ms / 1000.0
+        self.samples['outage' if self.outage.contains(event_time) else 'normal'].append(ms)
+
+
+class ForwardReader(threading.Thread):
+    """Reads forwarded frames and matches each SYN_REPORT to the oldest pending injection time."""
+
+    def __init__(self, fd, pending, outage):
+        super().__init__(name="ForwardReader", daemon=True)
+        self.fd = fd
+        self.pending = pending
+        self.outage = outage
+        self.running = True
+        self.samples = {'all': [], 'outage': [], 'normal': []}
+        self.unmatched = 0
+
+    def run(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self.fd, selectors.EVENT_READ)
+        while self.running:
+            if not selector.select(0.2):
+                continue
+            try:
+                data = os.read(self.fd, READ_CHUNK)
+            except BlockingIOError:
+                continue
+            except OSError:
+                break
+            if not data:
+                break
+            now = time.time()
+            for offset in range(0, len(data) - INPUT_EVENT.size + 1, INPUT_EVENT.size):
+                _, _, etype, code, _ = INPUT_EVENT.unpack_from(data, offset)
+                if etype != ecodes.EV_SYN or code != ecodes.SYN_REPORT:
+                    continue
+                try:
+                    injected = self.pending.popleft()
+                except IndexError:
+                    self.unmatched += 1
+                    continue
+                ms = (now - injected) * 1000.0
+                self.samples['all'].append(ms)
+                self.samples['outage' if self.outage.contains(injected) else 'normal'].append(ms)
+        selector.close()
+
+
+def key_frame(code, value):
+    return [(ecodes.EV_MSC, ecodes.MSC_SCAN, code), (ecodes.EV_KEY, code, value), (ecodes.EV_SYN, ecodes.SYN_REPORT, 0)]
+
+
+def synthetic_stream(keys, rate, command_code, command_every):
+    """(offset seconds, frame) pairs for keys keystrokes at rate per second (0 = back to back)."""
+    frames = []
+    hold = min(0.03, 0.4 / rate) if rate > 0 else 0.0
+    for i in range(keys):
+        if command_code is not None and command_every and (i + 1) % command_every == 0:
+            code = command_code
+        else:
+            code = TYPING_KEYS[i % len(TYPING_KEYS)]
+        t = i / rate if rate > 0 else 0.0
+        frames.append((t, key_frame(code, 1)))
+        frames.append((t + hold, key_frame(code, 0)))
+    frames.sort(key=lambda item: item[0])
+    return frames
+
+
+def load_recording(path):
+    """Frames from a JSONL recording ({"t", "type", "code", "value"} per event), split at SYN_REPORT."""
+    frames, current = [], []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            current.append((event['type'], event['code'], event['value']))
+            if event['type'] == ecodes.EV_SYN and event['code'] == ecodes.SYN_REPORT:
+                frames.append((event['t'], current))
+                current = []
+    return frames
+
+
+def record(source_path, out_path, seconds):
+    """Records a real device's events (without grabbing it) for later --replay."""
+    dev = evdev.InputDevice(source_path)
+    print(f"Recording {dev.name} for {seconds:.0f} s to {out_path} (keystrokes are stored in clear text)")
+    start = None
+    deadline = time.time() + seconds
+    count = 0
+    selector = selectors.DefaultSelector()
+    selector.register(dev.fd, selectors.EVENT_READ)
+    with open(out_path, "w") as f:
+        while time.time() < deadline:
+            if not selector.select(max(0.0, deadline - time.time())):
+                continue
+            for event in dev.read():
+                t = event.sec + event.usec / 1e6
+                start = t if start is None else start
+                f.write(json.dumps({'t': round(t - start, 6), 'type': event.type, 'code': event.code,
+                                    'value': event.value}) + "\n")
+                count += 1
+    dev.close()
+    print(f"Recorded {count} events.")
+
+
+def run_scenario(args, frames, label):
+    outage = Outage(args.outage)
+    if args.transport == "fake":
+        transport = FakeTransport()
+    else:
+        transport = create_command_transport(args.transport, KeyboardListener.MQTT_BROKER, KeyboardListener.MQTT_PORT,
+                                             KeyboardListener.MQTT_TOPIC, KeyboardListener.COMMAND_SOCKET)
+    publisher = CommandPublisher(transport)
+    publish_log = LatencyLog(outage)
+    publisher.publish_latency = publish_log
+    submitted = [0]
+    def submit(command, event_time=None):
+        submitted[0] += 1
+        publisher.submit(command, event_time)
+    engine_log = LatencyLog(outage)
+    manager = DeviceManager(submit, engine_log, autoscan=False)
+
+    sink = None
+    output = None
+    keys = sorted(set(TYPING_KEYS) | set(KeyboardListener.INTERCEPT) | {c for c in [args.command_code] if c})
+    if args.device == "uinput":
+        source = UInputSource(keys)
+        engine = manager.add_device(source.device)
+        output = evdev.InputDevice(engine.virtual.device.path)
+        output.grab() # Keep the bench typing away from the desktop
+        read_fd = output.fd
+    else:
+        source = FakeInputDevice(keys)
+        sink = PipeSink()
+        engine = manager.add_device(source, sink)
+        read_fd = sink.read_fd
+    if engine is None:
+        raise SystemExit("Could not set up the bench device.")
+
+    pending = deque()
+    reader = ForwardReader(read_fd, pending, outage)
+    reader.start()
+    publisher.start()
+    loop = threading.Thread(target=manager.run, name="DeviceManager", daemon=True)
+    loop.start()
+    time.sleep(0.1)
+
+    if args.transport == "fake":
+        outage.schedule(transport, time.time())
+    start = time.perf_counter()
+    expected = 0
+    for offset, frame in frames:
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        forwarded = any(etype not in (ecodes.EV_SYN, ecodes.EV_MSC) and
+                        not (etype == ecodes.EV_KEY and code in engine.codes) for etype, code, _ in frame)
+        now = time.time()
+        if forwarded:
+            pending.append(now) # Before the write, so the reader can never see the frame first
+            expected += 1
+        source.write_frame(frame, now)
+    inject_s = time.perf_counter() - start
+
+    # Let the pipeline drain, including commands held back by an outage
+    drain_deadline = time.time() + max(2.0, (outage.end or 0) - time.time() + 2.0)
+    while time.time() < drain_deadline and (pending or not publisher.queue.empty()):
+        time.sleep(0.05)
+    time.sleep(0.2)
+    manager.stop()
+    loop.join(timeout=DeviceManager.RESCAN_INTERVAL + 1.0)
+    reader.running = False
+    reader.join(timeout=1.0)
+    publisher.stop()
+    manager.close()
+    if output:
+        output.close()
+    if sink:
+        os.close(sink.read_fd)
+    source.close()
+
+    result = {
+        'label': label,
+        'frames': len(frames),
+        'inject_s': round(inject_s, 3),
+        'forward_expected': expected,
+        'forwarded': len(reader.samples['all']),
+        'forward_lost': len(pending),
+        'forward': {k: summarize(v) for k, v in reader.samples.items()},
+        'key_to_forward': {k: summarize(v) for k, v in engine_log.samples.items()},
+        'commands': submitted[0],
+        'published': len(publish_log.samples['all']),
+        'dropped': publisher.dropped,
+        'key_to_publish': {k: summarize(v) for k, v in publish_log.samples.items()},
+    }
+    if outage.begin is not None:
+        result['outage'] = {'start': outage.start, 'duration': outage.duration}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--device", choices=("fake", "uinput"), default="fake")
+    parser.add_argument("--rates", default="8,60,0", help="Comma-separated keystrokes per second (0 = burst)")
+    parser.add_argument("--keys", type=int, default=300, help="Keystrokes per rate")
+    parser.add_argument("--command-every", type=int, default=25, help="Every Nth keystroke is an intercepted key")
+    parser.add_argument("--replay", help="Replay a recording made with --record instead of synthetic typing")
+    parser.add_argument("--transport", choices=("fake", "mqtt", "unix"), default="fake",
+                        help="Where intercepted commands go (fake = in-process)")
+    parser.add_argument("--outage", help="START,SECONDS: fake broker down during this window of each run")
+    parser.add_argument("--record", help="Record a real device's events to this JSONL file and exit")
+    parser.add_argument("--source", help="Device to record, e.g. /dev/input/event3")
+    parser.add_argument("--seconds", type=float, default=30.0, help="Recording length")
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    args = parser.parse_args()
+
+    if args.record:
+        if not args.source:
+            parser.error("--record needs --source")
+        record(args.source, args.record, args.seconds)
+        return
+    if args.outage and args.transport != "fake":
+        parser.error("--outage needs --transport fake")
+
+    command_code = ecodes.KEY_KPENTER # Bound to "capture" by default; resolved against the config below
+    default_bindings, _ = KeyboardListener.load_binding_sets()
+    press = [b.codes[0] for b in default_bindings if not b.is_chord and b.mode == MODE_PRESS and not b.debounce]
+    if command_code not in press:
+        command_code = press[0] if press else None
+    args.command_code = command_code
+    if command_code is None:
+        print("No plain press binding configured; no intercepted commands will be generated.")
+
+    if args.replay:
+        scenarios = [(f"replay {os.path.basename(args.replay)}", load_recording(args.replay))]
+    else:
+        scenarios = [(f"{rate}/s" if rate > 0 else "burst",
+                      synthetic_stream(args.keys, rate, command_code, args.command_every))
+                     for rate in (float(r) for r in args.rates.split(",") if r.strip())]
+
+    results = []
+    for label, frames in scenarios:
+        result = run_scenario(args, frames, label)
+        results.append(result)
+        print(f"--- {label}: {result['frames']} frames in {result['inject_s']} s, "
+              f"forwarded {result['forwarded']}/{result['forward_expected']}, commands {result['commands']} "
+              f"(published {result['published']}, dropped {result['dropped']}) ---")
+        print_summary("inject-to-readable", result['forward']['all'])
+        print_summary("key-to-forward (engine)", result['key_to_forward']['all'])
+        print_summary("key-to-publish", result['key_to_publish']['all'])
+        if 'outage' in result:
+            print_summary("inject-to-readable, outage", result['forward']['outage'])
+            print_summary("key-to-publish, outage", result['key_to_publish']['outage'])
+    if args.json:
+        write_json(args.json, {'benchmark': 'input_path', 'device': args.device, 'transport': args.transport,
+                               'command_every': args.command_every, 'scenarios': results})
+
+
+if __name__ == "__main__":
+    main()
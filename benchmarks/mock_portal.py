@@ -0,0 +1,152 @@
+"""Mock org.freedesktop.portal.ScreenCast service for headless capture tests.
+
+Owns org.freedesktop.portal.Desktop on the session bus given by
+DBUS_SESSION_BUS_ADDRESS (normally a private dbus-daemon started by
+benchmarks.portal_capture) and answers CreateSession, SelectSources and Start
+like xdg-desktop-portal does: each call returns a Request object path, and the
+result follows as a Request.Response signal. Start reports one stream with a
+fixed PipeWire node id and size. No PipeWire node exists, so ScreenCastHandler
+must be given a source_template such as videotestsrc.
+
+    DBUS_SESSION_BUS_ADDRESS=... python -m benchmarks.mock_portal --width 1920 --height 1080
+"""
+import sys
+import argparse
+
+from gi.repository import GLib, Gio
+
+PORTAL_BUS_NAME = "org.freedesktop.portal.Desktop"
+PORTAL_OBJECT_PATH = "/org/freedesktop/portal/desktop"
+PORTAL_IFACE_REQUEST = "org.freedesktop.portal.Request"
+NODE_ID = 42
+
+INTROSPECTION_XML = """
+<node>
+  <interface name="org.freedesktop.portal.ScreenCast">
+    <method name="CreateSession">
+      <arg type="a{sv}" name="options" direction="in"/>
+      <arg type="o" name="handle" direction="out"/>
+    </method>
+    <method name="SelectSources">
+      <arg type="o" name="session_handle" direction="in"/>
+      <arg type="a{sv}" name="options" direction="in"/>
+      <arg type="o" name="handle" direction="out"/>
+    </method>
+    <method name="Start">
+      <arg type="o" name="session_handle" direction="in"/>
+      <arg type="s" name="parent_window" direction="in"/>
+      <arg type="a{sv}" name="options" direction="in"/>
+      <arg type="o" name="handle" direction="out"/>
+    </method>
+    <property name="AvailableSourceTypes" type="u" access="read"/>
+    <property name="AvailableCursorModes" type="u" access="read"/>
+    <property name="version" type="u" access="read"/>
+  </interface>
+  <interface name="org.freedesktop.portal.Session">
+    <method name="Close"/>
+    <signal name="Closed">
+      <arg type="a{sv}" name="details"/>
+    </signal>
+  </interface>
+</node>
+"""
+PROPERTIES = {"AvailableSourceTypes": GLib.Variant("u", 3), "AvailableCursorModes": GLib.Variant("u", 1),
+              "version": GLib.Variant("u", 4)}
+
+
+class MockScreenCastPortal:
+    """Answers portal calls after response_delay seconds (plus dialog_delay for SelectSources)."""
+
+    def __init__(self, width, height, response_delay=0.01, dialog_delay=0.0, fail=None):
+        self.width = width
+        self.height = height
+        self.response_delay = response_delay
+        self.dialog_delay = dialog_delay # Stands in for the user picking a window
+        self.fail = fail                 # Method whose Response reports failure (code 2)
+        self.node = Gio.DBusNodeInfo.new_for_xml(INTROSPECTION_XML)
+        self.connection = None
+        self.sessions = {} # session path -> registration id
+        self.counter = 0
+
+    def own_name(self, on_ready, on_lost):
+        def bus_acquired(connection, name):
+            self.connection = connection
+            connection.register_object(PORTAL_OBJECT_PATH, self.node.interfaces[0], self._method_call,
+                                       self._get_property, None)
+        Gio.bus_own_name(Gio.BusType.SESSION, PORTAL_BUS_NAME, Gio.BusNameOwnerFlags.NONE,
+                         bus_acquired, lambda connection, name: on_ready(),
+                         lambda connection, name: on_lost())
+
+    def _get_property(self, connection, sender, object_path, interface_name, property_name):
+        return PROPERTIES.get(property_name)
+
+    def _path(self, kind, sender, token):
+        # Same layout as xdg-desktop-portal: /org/freedesktop/portal/desktop/<kind>/<sender>/<token>
+        return f"{PORTAL_OBJECT_PATH}/{kind}/{sender[1:].replace('.', '_')}/{token}"
+
+    def _token(self, options, key):
+        self.counter += 1
+        return options.get(key) or f"mock{self.counter}"
+
+    def _method_call(self, connection, sender, object_path, interface_name, method_name, parameters, invocation):
+        args = parameters.unpack()
+        options = args[-1]
+        request_path = self._path("request", sender, self._token(options, "handle_token"))
+        delay = self.response_delay
+        if method_name == "CreateSession":
+            session_path = self._path("session", sender, self._token(options, "session_handle_token"))
+            self.sessions[session_path] = connection.register_object(
+                session_path, self.node.interfaces[1], self._session_call, None, None)
+            results = {"session_handle": GLib.Variant("s", session_path)}
+        elif method_name == "SelectSources":
+            results = {}
+            delay += self.dialog_delay
+        elif method_name == "Start":
+            stream = (NODE_ID, {"position": GLib.Variant("(ii)", (0, 0)),
+                                "size": GLib.Variant("(ii)", (self.width, self.height)),
+                                "source_type": GLib.Variant("u", 1)})
+            results = {"streams": GLib.Variant("a(ua{sv})", [stream])}
+        else:
+            invocation.return_dbus_error("org.freedesktop.DBus.Error.UnknownMethod", method_name)
+            return
+        invocation.return_value(GLib.Variant("(o)", (request_path,)))
+        code = 2 if self.fail == method_name else 0
+        GLib.timeout_add(int(delay * 1000), self._respond, sender, request_path, code, {} if code else results)
+
+    def _respond(self, sender, request_path, code, results):
+        self.connection.emit_signal(sender, request_path, PORTAL_IFACE_REQUEST, "Response",
+                                    GLib.Variant("(ua{sv})", (code, results)))
+        return False
+
+    def _session_call(self, connection, sender, object_path, interface_name, method_name, parameters, invocation):
+        registration = self.sessions.pop(object_path, None)
+        invocation.return_value(None)
+        if registration:
+            connection.unregister_object(registration)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--response-delay", type=float, default=0.01, help="Seconds before each Response signal")
+    parser.add_argument("--dialog-delay", type=float, default=0.0, help="Extra seconds for SelectSources")
+    parser.add_argument("--fail", choices=("CreateSession", "SelectSources", "Start"),
+                        help="Answer this call with response code 2 (error)")
+    args = parser.parse_args()
+    portal = MockScreenCastPortal(args.width, args.height, args.response_delay, args.dialog_delay, args.fail)
+    loop = GLib.MainLoop()
+    # The harness reads this line to know the name is owned
+    def lost():
+        print(f"Could not own {PORTAL_BUS_NAME} (is another portal running on this bus?)", flush=True)
+        loop.quit()
+    portal.own_name(lambda: print("Mock portal ready", flush=True), lost)
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        pass
+    sys.exit(0 if portal.connection else 1)
+
+
+if __name__ == "__main__":
+    main()
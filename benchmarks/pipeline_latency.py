@@ -0,0 +1,355 @@
+"""Capture-to-display latency of SauronEye's own pipeline, against a stub Ollama server.
+
+Drives a real MainApplication (offscreen) with synthetic frames through
+on_capture_successful -> run_analysis (encode_image, analyze_image,
+store_capture) -> publish_output_message -> the chat display, while
+benchmarks.stub_ollama stands in for the model with a fixed latency and token
+rate. Model time is measured by the stub and reported separately, so the
+remaining stages are SauronEye's own overhead. Runs every combination of
+frame size, encoding and concurrency (requests sharing one frame, as when
+several clients ask for a capture at once) and reports per-stage
+p50/p95/p99, throughput, CPU time and RSS.
+
+    QT_QPA_PLATFORM=offscreen python -m benchmarks.pipeline_latency --json pipeline.json
+    QT_QPA_PLATFORM=offscreen python -m benchmarks.pipeline_latency --sizes 1920x1080 --formats jpeg \\
+        --concurrency 1,8 --latency 0.5 --token-rate 30 --chat 20
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+import urllib.request
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QObject, QMetaObject, Qt, pyqtSignal, pyqtSlot
+from PIL import Image, ImageDraw
+
+from MainApplication import MainApplication
+from CommandProtocol import Command
+from benchmarks.stats import summarize, print_summary, write_json
+
+STAGES = ("dispatch", "encode", "model_call", "model_server", "model_overhead", "store", "publish", "display",
+          "end_to_end", "overhead")
+
+
+def synthetic_frame(width, height, seed=0):
+    """A desktop-like frame: flat background, windows, text lines and one gradient."""
+    rng = random.Random(seed)
+    img = Image.new("RGB", (width, height), (236, 236, 236))
+    draw = ImageDraw.Draw(img)
+    for _ in range(6):
+        x0, y0 = rng.randrange(0, width * 3 // 4), rng.randrange(0, height * 3 // 4)
+        x1 = min(width - 1, x0 + rng.randrange(200, width // 2 + 201))
+        y1 = min(height - 1, y0 + rng.randrange(150, height // 2 + 151))
+        draw.rectangle((x0, y0, x1, y1), fill=(255, 255, 255), outline=(120, 120, 120))
+        draw.rectangle((x0, y0, x1, y0 + 24), fill=(rng.randrange(40, 90),) * 3)
+        for y in range(y0 + 32, y1 - 12, 16):
+            line = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz_(){}=.: ") for _ in range(rng.randrange(10, 90)))
+            draw.text((x0 + 8, y), line, fill=(rng.randrange(0, 80), rng.randrange(0, 80), rng.randrange(0, 160)))
+    gradient = Image.linear_gradient("L").resize((width // 4, height // 4)).convert("RGB")
+    img.paste(gradient, (width - width // 4, height - height // 4))
+    return img
+
+
+def start_stub(args):
+    """Starts benchmarks.stub_ollama in its own process (its CPU time is not counted) and returns (process, url)."""
+    process = subprocess.Popen([sys.executable, "-m", "benchmarks.stub_ollama", "--port", "0",
+                                "--latency", str(args.latency), "--token-rate", str(args.token_rate),
+                                "--tokens", str(args.tokens), "--jitter", str(args.jitter)],
+                               stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if " on " not in line:
+        process.kill()
+        raise RuntimeError(f"stub Ollama did not start: {line!r}")
+    return process, line.strip().split(" on ", 1)[1]
+
+
+def stub_records(url):
+    with urllib.request.urlopen(url + "/stub/stats", timeout=5) as response:
+        return {record['key']: record for record in json.load(response)['requests']}
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1048576.0
+    except (OSError, ValueError):
+        return None
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Probe(QObject):
+    """Lives on the Qt main thread: starts frames there and timestamps what reaches the display."""
+
+    frame_signal = pyqtSignal(object, object) # (image, [Command, ...])
+
+    def __init__(self, app):
+        super().__init__()
+        self.app = app
+        self.lock = threading.Condition()
+        self.records = {}  # request_id -> {stage start/end stamps and durations}
+        self.stream = None # {'count', 'first'} of the chat reply being measured
+        self.local = threading.local()
+        self.frame_signal.connect(self.start_frame)
+        app.output_message_signal.connect(self.displayed)
+        app.stream_fragment_signal.connect(self.fragment)
+        self._instrument()
+
+    def _instrument(self):
+        app = self.app
+        run_local_analysis = app.run_local_analysis
+        def timed_run(image, request=None):
+            record = self.records.get(request.request_id) if request else None
+            if record is not None:
+                record['dispatch'] = (time.perf_counter() - record['t0']) * 1000.0
+            self.local.record = record
+            try:
+                return run_local_analysis(image, request)
+            finally:
+                self.local.record = None
+        app.run_local_analysis = timed_run
+        for stage, name in (("encode", "encode_image"), ("model_call", "analyze_image"),
+                            ("store", "store_capture"), ("publish", "publish_output_message")):
+            setattr(app, name, self._timed(stage, getattr(app, name)))
+
+    def _timed(self, stage, method):
+        def wrapper(*args, **kwargs):
+            record = getattr(self.local, 'record', None)
+            start = time.perf_counter()
+            if record is not None and stage == "publish":
+                record['publish_start'] = start
+            try:
+                return method(*args, **kwargs)
+            finally:
+                if record is not None:
+                    record[stage] = record.get(stage, 0.0) + (time.perf_counter() - start) * 1000.0
+        return wrapper
+
+    @pyqtSlot(object, object)
+    def start_frame(self, image, requests):
+        now = time.perf_counter()
+        for request in requests:
+            self.records[request.request_id] = {'t0': now}
+        self.app.pending_capture_requests = list(requests)
+        self.app.on_capture_successful(image)
+
+    @pyqtSlot(str)
+    def displayed(self, message):
+        now = time.perf_counter()
+        # "[SauronEye-Analysis]: <request_id> ..." (the stub echoes the prompt's first word)
+        text = message.split(": ", 1)[1] if ": " in message else message
+        record = self.records.get((text.split() or [""])[0])
+        if record is None or 'displayed' in record:
+            return
+        with self.lock:
+            record['displayed'] = now
+            self.lock.notify_all()
+
+    @pyqtSlot(str, str)
+    def fragment(self, stream_id, text):
+        stream = self.stream
+        if stream is None:
+            return
+        stream['count'] += 1
+        if stream['count'] == 2: # The first fragment is the sender label
+            stream['first'] = time.perf_counter()
+
+    def wait_displayed(self, request_ids, timeout):
+        deadline = time.time() + timeout
+        with self.lock:
+            while not all('displayed' in self.records.get(r, ()) for r in request_ids):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.lock.wait(remaining)
+        return True
+
+
+def run_scenario(probe, frame, image_format, concurrency, count, warmup, timeout, stub_url, max_size=None):
+    """Runs count frames (plus warmup) closed-loop; returns the result dict for one combination."""
+    options = {'format': image_format}
+    if max_size:
+        options['max_size'] = max_size
+    measured = []
+    lost = 0
+    cpu_start, wall_start = None, None
+    for i in range(warmup + count):
+        if i == warmup:
+            stub_records(stub_url) # Drop warmup records
+            cpu_start, wall_start = cpu_seconds(), time.perf_counter()
+        requests = []
+        for _ in range(concurrency):
+            request = Command("capture", source="bench", image=options)
+            request.prompt = f"{request.request_id} Describe this screen."
+            requests.append(request)
+        probe.frame_signal.emit(frame, requests)
+        ids = [request.request_id for request in requests]
+        if not probe.wait_displayed(ids, timeout):
+            lost += sum(1 for r in ids if 'displayed' not in probe.records.get(r, ()))
+        if i >= warmup:
+            measured.extend(ids)
+        else:
+            for request_id in ids:
+                probe.records.pop(request_id, None)
+    wall = time.perf_counter() - wall_start
+    cpu = cpu_seconds() - cpu_start
+    server = stub_records(stub_url)
+
+    samples = {stage: [] for stage in STAGES}
+    for request_id in measured:
+        record = probe.records.pop(request_id, {})
+        if 'displayed' not in record:
+            continue
+        record['end_to_end'] = (record['displayed'] - record['t0']) * 1000.0
+        record['display'] = (record['displayed'] - record['publish_start']) * 1000.0
+        stub = server.get(request_id)
+        if stub:
+            record['model_server'] = stub['server_ms']
+            record['model_overhead'] = record['model_call'] - stub['server_ms']
+            record['overhead'] = record['end_to_end'] - stub['server_ms']
+        for stage in STAGES:
+            if stage in record:
+                samples[stage].append(record[stage])
+    request_bytes = [record['request_bytes'] for record in server.values()]
+    return {
+        'stages': {stage: summarize(values) for stage, values in samples.items()},
+        'completed': len(samples['end_to_end']),
+        'lost': lost,
+        'wall_s': round(wall, 3),
+        'throughput_per_s': round(len(samples['end_to_end']) / wall, 3) if wall else None,
+        'cpu_s': round(cpu, 3),
+        'cpu_percent': round(100.0 * cpu / wall, 1) if wall else None,
+        'rss_mb': round(rss_mb() or 0.0, 1),
+        'request_kb_mean': round(sum(request_bytes) / len(request_bytes) / 1024.0, 1) if request_bytes else None,
+    }
+
+
+def run_chat(probe, app, count, timeout):
+    """Streams count chat replies; time to first token on screen and total reply time."""
+    first, total = [], []
+    for i in range(count):
+        probe.stream = {'count': 0}
+        start = time.perf_counter()
+        app.send_chat_message_to_ollama(f"chat-{i} Hello")
+        done = time.perf_counter()
+        deadline = time.time() + timeout
+        while 'first' not in probe.stream and time.time() < deadline:
+            time.sleep(0.001)
+        if 'first' in probe.stream:
+            first.append((probe.stream['first'] - start) * 1000.0)
+        total.append((done - start) * 1000.0)
+    probe.stream = None
+    return {'first_token': summarize(first), 'reply': summarize(total)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="1280x720,1920x1080,3840x2160", help="Comma-separated WIDTHxHEIGHT")
+    parser.add_argument("--formats", default="png,jpeg", help="Comma-separated encodings (png, jpeg, webp)")
+    parser.add_argument("--concurrency", default="1,4", help="Comma-separated requests per frame")
+    parser.add_argument("--max-size", type=int, help="image max_size option (longest side)")
+    parser.add_argument("--frames", type=int, default=20, help="Measured frames per combination")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured frames first")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub time to first token (s)")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Stub tokens per second (0 = instant)")
+    parser.add_argument("--tokens", type=int, default=32, help="Stub tokens per reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Stub relative latency variation")
+    parser.add_argument("--chat", type=int, default=0, help="Also measure N streamed chat replies")
+    parser.add_argument("--no-stores", action="store_true", help="Disable capture store and history")
+    parser.add_argument("--broker", help="Publish to this MQTT broker (default: no MQTT)")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds before a request counts as lost")
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub(args)
+    workdir = tempfile.mkdtemp(prefix="sauroneye-bench-")
+    q_app = QApplication(sys.argv)
+    app = MainApplication()
+    app.settings.update({
+        'ollama_server': stub_url,
+        'ollama_model': "stub",
+        'analysis_mode': "local",
+        'outbox_path': "",
+        'recall_model': "",
+        'capture_store_path': "" if args.no_stores else os.path.join(workdir, "captures.sqlite"),
+        'history_path': "" if args.no_stores else os.path.join(workdir, "history.sqlite"),
+    })
+    if args.broker:
+        app.settings.update({'mqtt_broker': args.broker, 'mqtt_port': str(args.port),
+                             'mqtt_output_topic': f"sauroneye_bench/{os.getpid()}/output"})
+    app._update_attributes_from_settings()
+    app.start_capture_store()
+    app.start_history()
+    probe = Probe(app)
+    if args.broker:
+        app.setup_mqtt()
+
+    sizes = [tuple(int(v) for v in size.lower().split("x")) for size in args.sizes.split(",") if size.strip()]
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    results = []
+    chat = None
+
+    def worker():
+        nonlocal chat
+        try:
+            if args.broker:
+                deadline = time.time() + 5.0
+                while not app.is_mqtt_connected and time.time() < deadline:
+                    time.sleep(0.05)
+                if not app.is_mqtt_connected:
+                    print(f"MQTT broker {args.broker}:{args.port} unavailable, measuring without MQTT.")
+            for width, height in sizes:
+                frame = synthetic_frame(width, height)
+                for image_format in formats:
+                    for concurrency in levels:
+                        result = run_scenario(probe, frame, image_format, concurrency, args.frames, args.warmup,
+                                              args.timeout, stub_url, args.max_size)
+                        result.update(size=f"{width}x{height}", format=image_format, concurrency=concurrency)
+                        results.append(result)
+                        print(f"--- {width}x{height} {image_format} x{concurrency}: "
+                              f"{result['throughput_per_s']}/s, cpu {result['cpu_percent']}%, "
+                              f"rss {result['rss_mb']} MB, request {result['request_kb_mean']} KB ---")
+                        for stage in STAGES:
+                            print_summary(stage, result['stages'][stage])
+                        if result['lost']:
+                            print(f"  {'':<28} lost={result['lost']}")
+            if args.chat:
+                chat = run_chat(probe, app, args.chat, args.timeout)
+                print("--- Streamed chat ---")
+                print_summary("first_token", chat['first_token'])
+                print_summary("reply", chat['reply'])
+        finally:
+            QMetaObject.invokeMethod(q_app, "quit", Qt.QueuedConnection)
+
+    threading.Thread(target=worker, daemon=True).start()
+    q_app.exec_()
+    app.close()
+    stub.terminate()
+    stub.wait()
+
+    if args.json:
+        write_json(args.json, {
+            'benchmark': 'pipeline_latency',
+            'stub': {'latency': args.latency, 'token_rate': args.token_rate, 'tokens': args.tokens,
+                     'jitter': args.jitter},
+            'frames': args.frames, 'stores': not args.no_stores, 'mqtt': bool(args.broker),
+            'scenarios': results, 'chat': chat,
+        })
+
+
+if __name__ == "__main__":
+    main()
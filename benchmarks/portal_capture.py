@@ -0,0 +1,236 @@
+"""Capture-path timing: portal handshake, pipeline preroll and frame delivery, headless.
+
+Starts a private session bus (dbus-daemon --session) and benchmarks.mock_portal
+on it, then runs the real ScreenCastHandler against them. Its GStreamer source
+is swapped for a live videotestsrc of the size the portal reports. GLib is
+pumped from the Qt event loop every --glib-interval ms, as MainApplication
+does. Per capture the phases are:
+
+    create_session / select_sources / start   call -> portal Response handled
+    handshake        start_capture() -> Start response handled
+    pipeline_setup   parse_launch + set_state(PLAYING)
+    preroll          PLAYING requested -> first appsink sample
+    frame            first sample -> capture_successful delivered on the Qt thread
+    total            start_capture() -> frame delivered
+
+    python -m benchmarks.portal_capture --captures 50 --json portal.json
+    python -m benchmarks.portal_capture --sizes 1920x1080,3840x2160 --glib-interval 5 --dialog-delay 0.2
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+from benchmarks.stats import summarize, print_summary, write_json
+
+PHASES = ("create_session", "select_sources", "start", "handshake", "pipeline_setup", "preroll", "frame", "total")
+TEST_SOURCE = "videotestsrc is-live=true pattern={pattern} ! video/x-raw,width={{width}},height={{height}},framerate=30/1"
+
+
+def start_private_bus():
+    """Starts dbus-daemon --session and points this process (and its children) at it."""
+    process = subprocess.Popen(["dbus-daemon", "--session", "--nofork", "--nopidfile", "--print-address=1"],
+                               stdout=subprocess.PIPE, text=True)
+    address = process.stdout.readline().strip()
+    if not address:
+        process.kill()
+        raise RuntimeError("dbus-daemon did not print an address")
+    os.environ["DBUS_SESSION_BUS_ADDRESS"] = address
+    return process
+
+
+def start_mock_portal(args, width, height):
+    command = [sys.executable, "-m", "benchmarks.mock_portal", "--width", str(width), "--height", str(height),
+               "--response-delay", str(args.response_delay), "--dialog-delay", str(args.dialog_delay)]
+    if args.fail:
+        command += ["--fail", args.fail]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    if "ready" not in process.stdout.readline():
+        process.kill()
+        raise RuntimeError("mock portal did not start")
+    return process
+
+
+class CaptureProbe:
+    """Wraps a ScreenCastHandler's steps with timestamps; one dict of stamps per capture."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.current = None
+        self.done = []
+        self.failures = []
+        self.failure_ms = [] # start_capture() -> capture_failed delivered
+        self.on_finished = None
+        responses = handler._on_portal_response_gio
+        def on_response(*args):
+            self._stamp("response")
+            return responses(*args)
+        handler._on_portal_response_gio = on_response
+        setup = handler._setup_and_run_gstreamer
+        def on_setup():
+            self._stamp("setup_start")
+            try:
+                return setup()
+            finally:
+                self._stamp("setup_end")
+        handler._setup_and_run_gstreamer = on_setup
+        new_sample = handler._on_new_sample
+        def on_sample(appsink):
+            self._stamp("sample")
+            return new_sample(appsink)
+        handler._on_new_sample = on_sample
+        handler.capture_successful.connect(self._succeeded)
+        handler.capture_failed.connect(self._failed)
+
+    def _stamp(self, name):
+        current = self.current
+        if current is None:
+            return
+        if name == "response":
+            current.setdefault("responses", []).append(time.perf_counter())
+        else:
+            current.setdefault(name, time.perf_counter())
+
+    def start(self):
+        self.current = {"start": time.perf_counter()}
+        self.handler.start_capture()
+
+    def _succeeded(self, image):
+        current, self.current = self.current, None
+        if current is None:
+            return
+        current["delivered"] = time.perf_counter()
+        current["size"] = image.size
+        self.done.append(current)
+        self.on_finished()
+
+    def _failed(self, message):
+        current, self.current = self.current, None
+        if current is None:
+            return
+        self.failures.append(message)
+        self.failure_ms.append((time.perf_counter() - current["start"]) * 1000.0)
+        self.on_finished()
+
+    def timed_out(self):
+        if self.current is not None:
+            self.current = None
+            self.failures.append("timeout")
+            self.handler.cleanup()
+            self.on_finished()
+
+    def phases(self):
+        samples = {phase: [] for phase in PHASES}
+        for c in self.done:
+            responses = c.get("responses", [])
+            if len(responses) < 3 or "sample" not in c:
+                continue
+            ms = lambda a, b: (b - a) * 1000.0
+            samples["create_session"].append(ms(c["start"], responses[0]))
+            samples["select_sources"].append(ms(responses[0], responses[1]))
+            samples["start"].append(ms(responses[1], responses[2]))
+            samples["handshake"].append(ms(c["start"], c["setup_start"]))
+            samples["pipeline_setup"].append(ms(c["setup_start"], c["setup_end"]))
+            samples["preroll"].append(ms(c["setup_end"], c["sample"]))
+            samples["frame"].append(ms(c["sample"], c["delivered"]))
+            samples["total"].append(ms(c["start"], c["delivered"]))
+        return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="1920x1080", help="Comma-separated WIDTHxHEIGHT reported by the portal")
+    parser.add_argument("--captures", type=int, default=30, help="Measured captures per size")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured captures first")
+    parser.add_argument("--glib-interval", type=int, default=50,
+                        help="ms between GLib iterations on the Qt loop (MainApplication uses 50)")
+    parser.add_argument("--response-delay", type=float, default=0.01, help="Mock portal delay per Response (s)")
+    parser.add_argument("--dialog-delay", type=float, default=0.0, help="Mock SelectSources dialog time (s)")
+    parser.add_argument("--pattern", default="smpte", help="videotestsrc pattern")
+    parser.add_argument("--fail", choices=("CreateSession", "SelectSources", "Start"),
+                        help="Make the mock portal fail this step (error-path timing)")
+    parser.add_argument("--interval", type=float, default=0.05, help="Seconds between captures")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Seconds before a capture counts as lost")
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    args = parser.parse_args()
+
+    bus = start_private_bus()
+    portal = None
+    results = {}
+    try:
+        # Imported only now, so Gio connects to the private bus
+        from PyQt5.QtCore import QCoreApplication, QTimer
+        from gi.repository import GLib
+        import ScreenCastHandler
+        q_app = QCoreApplication(sys.argv)
+        context = GLib.MainContext.default()
+        glib_timer = QTimer()
+        glib_timer.timeout.connect(lambda: context.iteration(False))
+        glib_timer.start(args.glib_interval)
+
+        for size in [s for s in args.sizes.split(",") if s.strip()]:
+            width, height = (int(v) for v in size.lower().split("x"))
+            portal = start_mock_portal(args, width, height)
+            handler = ScreenCastHandler.ScreenCastHandler(source_template=TEST_SOURCE.format(pattern=args.pattern))
+            probe = CaptureProbe(handler)
+            remaining = [args.warmup + args.captures]
+            timeout = QTimer()
+            timeout.setSingleShot(True)
+            timeout.timeout.connect(probe.timed_out)
+
+            def next_capture():
+                if remaining[0] == args.captures:
+                    probe.done.clear()
+                    probe.failures.clear()
+                    probe.failure_ms.clear()
+                if remaining[0] <= 0:
+                    q_app.quit()
+                    return
+                remaining[0] -= 1
+                timeout.start(int(args.timeout * 1000))
+                probe.start()
+
+            def finished():
+                timeout.stop()
+                QTimer.singleShot(int(args.interval * 1000), next_capture)
+
+            probe.on_finished = finished
+            QTimer.singleShot(0, next_capture)
+            wall_start = time.perf_counter()
+            q_app.exec_()
+            samples = probe.phases()
+            results[size] = {
+                "phases": {phase: summarize(values) for phase, values in samples.items()},
+                "completed": len(probe.done),
+                "failed": len(probe.failures),
+                "failures": sorted(set(probe.failures)),
+                "failure_latency": summarize(probe.failure_ms),
+                "wall_s": round(time.perf_counter() - wall_start, 3),
+            }
+            handler.cleanup()
+            portal.terminate()
+            portal.wait()
+            portal = None
+    finally:
+        if portal:
+            portal.terminate()
+        bus.terminate()
+        bus.wait()
+
+    print(f"--- Capture path (glib every {args.glib_interval} ms, portal response delay "
+          f"{args.response_delay * 1000:.0f} ms) ---")
+    for size, result in results.items():
+        print(f"{size}: {result['completed']} captured, {result['failed']} failed {result['failures'] or ''}")
+        for phase in PHASES:
+            print_summary(phase, result["phases"][phase])
+        if result["failed"]:
+            print_summary("failure_latency", result["failure_latency"])
+    if args.json:
+        write_json(args.json, {'benchmark': 'portal_capture', 'glib_interval_ms': args.glib_interval,
+                               'response_delay': args.response_delay, 'dialog_delay': args.dialog_delay,
+                               'pattern': args.pattern, 'sizes': results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import json
+import os
+import sys
+import time
+import platform
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples_ms):
+    """Returns count, mean and p50/p95/p99/max (ms) for a list of samples."""
+    values = sorted(samples_ms)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean': round(sum(values) / len(values), 3),
+        'p50': round(percentile(values, 50), 3),
+        'p95': round(percentile(values, 95), 3),
+        'p99': round(percentile(values, 99), 3),
+        'max': round(values[-1], 3),
+    }
+
+
+def print_summary(name, summary):
+    if not summary.get('count'):
+        print(f"  {name:<28} no samples")
+        return
+    print(f"  {name:<28} n={summary['count']:<6} mean={summary['mean']:>9.3f} p50={summary['p50']:>9.3f} "
+          f"p95={summary['p95']:>9.3f} p99={summary['p99']:>9.3f} max={summary['max']:>9.3f} ms")
+
+
+def environment():
+    """Describes the machine so runs can be compared fairly."""
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def write_json(path, results):
+    """Writes machine-readable results (with environment info) for run-to-run comparison."""
+    data = {'environment': environment(), 'results': results}
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+    print(f"Results written to {path}")
@@ -0,0 +1,169 @@
+"""Stub Ollama server for benchmarks: implements /api/chat without a model.
+
+Answers after a configurable delay (time to first token) and produces tokens at
+a configurable rate, streamed as NDJSON when the request asks for streaming.
+The reply starts with the first word of the last user message, so callers can
+tag prompts with a request id and find it again in the output. GET /stub/stats
+returns (and clears) per-request server-side timings.
+
+    python -m benchmarks.stub_ollama --port 11435 --latency 0.2 --token-rate 40 --tokens 64
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILLER = ("the window shows a code editor with a python file open and a terminal below it "
+          "listing test results while a browser on the right displays documentation").split()
+
+
+class StubOllama(ThreadingHTTPServer):
+    """Threaded HTTP server holding the stub's settings and recorded requests."""
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, token_rate=0.0, tokens=32, jitter=0.0, host="127.0.0.1"):
+        super().__init__((host, port), StubHandler)
+        self.latency = latency
+        self.token_rate = token_rate # Tokens per second, 0 = all at once
+        self.tokens = tokens
+        self.jitter = jitter         # Relative random variation of latency and token interval
+        self.lock = threading.Lock()
+        self.records = []
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def record(self, entry):
+        with self.lock:
+            self.records.append(entry)
+
+    def take_records(self):
+        with self.lock:
+            records, self.records = self.records, []
+        return records
+
+    def vary(self, seconds):
+        if self.jitter and seconds:
+            seconds *= max(0.0, random.uniform(1.0 - self.jitter, 1.0 + self.jitter))
+        return seconds
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, like the real server
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/version":
+            self._send_json({"version": "0.0.0-stub"})
+        elif self.path == "/api/tags":
+            self._send_json({"models": [{"name": "stub:latest", "model": "stub:latest", "size": 0}]})
+        elif self.path == "/stub/stats":
+            self._send_json({"requests": self.server.take_records()})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        received = time.perf_counter()
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path != "/api/chat":
+            self._send_json({"error": "not found"}, 404)
+            return
+        try:
+            request = json.loads(body)
+        except ValueError as e:
+            self._send_json({"error": f"invalid JSON: {e}"}, 400)
+            return
+        messages = request.get("messages") or [{}]
+        prompt = messages[-1].get("content") or ""
+        images = messages[-1].get("images") or []
+        words = [(prompt.split() or ["stub"])[0]] + [FILLER[i % len(FILLER)] for i in range(self.server.tokens - 1)]
+        pieces = [words[0]] + [" " + word for word in words[1:]]
+        model = request.get("model", "stub")
+        stream = request.get("stream", True)
+        parsed = time.perf_counter()
+
+        time.sleep(self.server.vary(self.server.latency))
+        first_token = time.perf_counter()
+        interval = 1.0 / self.server.token_rate if self.server.token_rate > 0 else 0.0
+        if stream:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for piece in pieces:
+                self._write_chunk({"model": model, "created_at": _now(),
+                                   "message": {"role": "assistant", "content": piece}, "done": False})
+                time.sleep(self.server.vary(interval))
+            done = time.perf_counter()
+            self._write_chunk(_final(model, "", received, first_token, done, len(pieces)))
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            time.sleep(self.server.vary(interval) * len(pieces))
+            done = time.perf_counter()
+            self._send_json(_final(model, "".join(pieces), received, first_token, done, len(pieces)))
+        self.server.record({
+            "key": words[0],
+            "stream": bool(stream),
+            "request_bytes": len(body),
+            "images": len(images),
+            "image_chars": sum(len(image) for image in images), # base64
+            "server_ms": round((time.perf_counter() - received) * 1000.0, 3),
+            "parse_ms": round((parsed - received) * 1000.0, 3), # Reading and decoding the request body
+        })
+
+    def _write_chunk(self, data):
+        line = json.dumps(data).encode() + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _final(model, content, received, first_token, done, count):
+    return {"model": model, "created_at": _now(), "message": {"role": "assistant", "content": content},
+            "done": True, "done_reason": "stop",
+            "total_duration": int((done - received) * 1e9), "load_duration": 0,
+            "prompt_eval_count": 1, "prompt_eval_duration": int((first_token - received) * 1e9),
+            "eval_count": count, "eval_duration": int((done - first_token) * 1e9)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435, help="0 picks a free port")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before the first token")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Tokens per second (0 = instant)")
+    parser.add_argument("--tokens", type=int, default=32, help="Tokens per reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Relative random variation, e.g. 0.2")
+    args = parser.parse_args()
+    server = StubOllama(args.port, args.latency, args.token_rate, max(1, args.tokens), args.jitter, args.host)
+    # The benchmark reads this line to find the port
+    print(f"Stub Ollama listening on {server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Keypress-to-capture-start latency: MQTT (via broker) vs. Unix socket.
+
+Drives a real MainApplication (offscreen) and measures the time from the
+sender handing a "capture" command to its transport until
+MainApplication.capture_and_process() starts on the Qt main thread, i.e. the
+full receive path including transport thread -> command_signal -> handle_command.
+
+    QT_QPA_PLATFORM=offscreen python -m benchmarks.transport_latency --count 500
+    QT_QPA_PLATFORM=offscreen python -m benchmarks.transport_latency --transports unix --json unix.json
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QMetaObject, Qt
+
+from MainApplication import MainApplication
+from CommandTransport import (MqttCommandTransport, UnixSocketCommandTransport,
+                              TRANSPORT_MQTT, TRANSPORT_UNIX)
+from benchmarks.stats import summarize, print_summary, write_json
+
+
+def build_app(args, socket_path, topic_prefix):
+    app = MainApplication()
+    app.settings.update({
+        'mqtt_broker': args.broker,
+        'mqtt_port': str(args.port),
+        'mqtt_keypad_topic': f"{topic_prefix}/keypad",
+        'mqtt_output_topic': f"{topic_prefix}/output",
+        'command_socket': socket_path,
+    })
+    app._update_attributes_from_settings()
+    return app
+
+
+def run_transport(transport, received, count, interval, timeout):
+    """Sends count commands one at a time and returns the per-command latencies (ms)."""
+    samples = []
+    lost = 0
+    for _ in range(count):
+        received.clear()
+        start = time.perf_counter()
+        try:
+            transport.send("capture")
+        except OSError as e:
+            print(f"  send failed: {e}")
+            lost += 1
+            continue
+        if received.wait(timeout):
+            samples.append((received.stamp - start) * 1000.0)
+        else:
+            lost += 1
+        time.sleep(interval)
+    return samples, lost
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--transports", default=f"{TRANSPORT_MQTT},{TRANSPORT_UNIX}",
+                        help="Comma-separated transports to measure")
+    parser.add_argument("--count", type=int, default=200, help="Commands per transport")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured commands first")
+    parser.add_argument("--interval", type=float, default=0.01, help="Seconds between commands")
+    parser.add_argument("--timeout", type=float, default=2.0, help="Seconds before a command counts as lost")
+    parser.add_argument("--broker", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    args = parser.parse_args()
+
+    q_app = QApplication(sys.argv)
+    topic_prefix = f"sauroneye_bench/{os.getpid()}"
+    socket_path = f"@sauroneye-bench-{os.getpid()}"
+    app = build_app(args, socket_path, topic_prefix)
+
+    # Replace the portal capture with a timestamp: "capture start" is the end of the measured path
+    received = threading.Event()
+    def capture_started(request=None):
+        received.stamp = time.perf_counter()
+        received.set()
+    app.capture_and_process = capture_started
+
+    app.setup_mqtt()
+    app.start_command_socket()
+    results = {}
+
+    def worker():
+        try:
+            for kind in [k.strip() for k in args.transports.split(",") if k.strip()]:
+                if kind == TRANSPORT_UNIX:
+                    transport = UnixSocketCommandTransport(socket_path)
+                elif kind == TRANSPORT_MQTT:
+                    transport = MqttCommandTransport(args.broker, args.port, f"{topic_prefix}/keypad", "bench_sender")
+                else:
+                    print(f"Unknown transport '{kind}', skipping.")
+                    continue
+                transport.start()
+                deadline = time.time() + 5.0
+                while not (transport.wait_ready(0.1) and (kind != TRANSPORT_MQTT or app.is_mqtt_connected)):
+                    if time.time() > deadline:
+                        break
+                if kind == TRANSPORT_MQTT and not app.is_mqtt_connected:
+                    print(f"MQTT broker {args.broker}:{args.port} unavailable, skipping mqtt.")
+                    transport.stop()
+                    continue
+                run_transport(transport, received, args.warmup, args.interval, args.timeout)
+                samples, lost = run_transport(transport, received, args.count, args.interval, args.timeout)
+                transport.stop()
+                results[kind] = dict(summarize(samples), lost=lost)
+        finally:
+            QMetaObject.invokeMethod(q_app, "quit", Qt.QueuedConnection)
+
+    threading.Thread(target=worker, daemon=True).start()
+    q_app.exec_()
+    app.close()
+
+    print("--- Keypress-to-capture-start latency ---")
+    for kind, summary in results.items():
+        print_summary(kind, summary)
+        if summary.get('lost'):
+            print(f"  {'':<28} lost={summary['lost']}")
+    if args.json:
+        write_json(args.json, {'benchmark': 'transport_latency', 'transports': results,
+                               'count': args.count, 'interval': args.interval})
+
+
+if __name__ == "__main__":
+    main()
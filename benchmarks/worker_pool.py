@@ -0,0 +1,106 @@
+"""Distributed analysis: job throughput and latency across N workers on one machine.
+
+Starts N AnalysisWorker processes in --dry-run mode (no Ollama) against a local
+broker, submits jobs through a JobDispatcher and reports end-to-end latency.
+--kill-one terminates a worker mid-run to exercise lease expiry and retry.
+
+    python -m benchmarks.worker_pool --workers 4 --jobs 200
+    python -m benchmarks.worker_pool --workers 3 --jobs 50 --kill-one --lease 3
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import subprocess
+
+import paho.mqtt.client as mqtt
+
+from CommandProtocol import Command
+from JobDispatch import JobDispatcher
+from MqttChunking import ChunkedPublisher, Reassembler, CLASS_JOB
+from benchmarks.stats import summarize, print_summary, write_json
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=100)
+    parser.add_argument("--image-bytes", type=int, default=200000, help="Size of the fake encoded frame")
+    parser.add_argument("--lease", type=float, default=5.0)
+    parser.add_argument("--kill-one", action="store_true", help="Kill one worker after a third of the jobs")
+    parser.add_argument("--broker", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    args = parser.parse_args()
+
+    base = f"sauroneye_bench/{os.getpid()}/jobs"
+    group = f"bench{os.getpid()}"
+    workers = [subprocess.Popen([sys.executable, "AnalysisWorker.py", "--dry-run", "--broker", args.broker,
+                                 "--port", str(args.port), "--topic", base, "--group", group,
+                                 "--worker-id", f"bench-{i}"])
+               for i in range(args.workers)]
+
+    publisher = ChunkedPublisher()
+    reassembler = Reassembler()
+    submitted = {}
+    latencies = []
+    by_worker = {}
+    failed = []
+    all_done = threading.Event()
+
+    def on_done(request, status, text, worker):
+        if status == "ok":
+            latencies.append((time.perf_counter() - submitted[request.request_id]) * 1000.0)
+            by_worker[worker] = by_worker.get(worker, 0) + 1
+        else:
+            failed.append(request.request_id)
+        if len(latencies) + len(failed) >= args.jobs:
+            all_done.set()
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"bench_producer_{os.getpid()}",
+                         protocol=mqtt.MQTTv5)
+    dispatcher = JobDispatcher(base, lambda topic, payload, single: publisher.publish(
+        client, topic, payload, CLASS_JOB, single=single), on_done, lease=args.lease)
+    connected = threading.Event()
+    client.on_connect = lambda c, u, f, rc, p=None: (c.subscribe(dispatcher.reply_topic, qos=1), connected.set())
+    client.on_message = lambda c, u, msg: dispatcher.handle_reply(reassembler.add(msg.payload, msg.topic))
+    client.connect(args.broker, args.port, 60)
+    client.loop_start()
+    results = {}
+    try:
+        if not connected.wait(5):
+            print(f"MQTT broker {args.broker}:{args.port} unavailable.")
+            return
+        dispatcher.start()
+        time.sleep(2.0) # Let the workers connect and subscribe
+        image = os.urandom(args.image_bytes)
+        start = time.perf_counter()
+        for i in range(args.jobs):
+            request = Command("capture", request_id=f"job{i}", source="bench")
+            submitted[request.request_id] = time.perf_counter()
+            dispatcher.submit(request, image, "benchmark", "none")
+            if args.kill_one and i == args.jobs // 3 and workers:
+                print(f"Killing worker pid {workers[0].pid}")
+                workers[0].kill()
+        all_done.wait(args.timeout)
+        elapsed = time.perf_counter() - start
+        results = dict(summarize(latencies), failed=len(failed), throughput=round(len(latencies) / elapsed, 2),
+                       per_worker=by_worker, stats=dispatcher.stats)
+        print(f"--- {args.jobs} jobs on {args.workers} workers in {elapsed:.2f}s ---")
+        print_summary("job latency", results)
+        print(f"  throughput={results['throughput']} jobs/s failed={len(failed)} per worker={by_worker}")
+        print(f"  dispatcher: {dispatcher.stats}")
+    finally:
+        dispatcher.stop()
+        client.loop_stop()
+        for worker in workers:
+            worker.terminate()
+    if args.json and results:
+        write_json(args.json, {'benchmark': 'worker_pool', 'workers': args.workers, 'jobs': args.jobs,
+                               'results': results})
+
+
+if __name__ == "__main__":
+    main()